@@ -0,0 +1,164 @@
+"""Append-only activity journal.
+
+Events go into a bounded in-memory ring (what /api/activity-log serves) and a
+pending batch that a background thread appends to a JSONL file and fsyncs,
+so callers never wait on disk. When the file outgrows ``max_bytes`` it is
+rotated to ``<path>.1`` and compacted down to the entries still in the ring.
+"""
+import itertools
+import json
+import os
+import threading
+from collections import deque
+
+
+class ActivityJournal:
+    def __init__(self, path, capacity=200, flush_interval=1.0, max_bytes=1024 * 1024, legacy_path=None):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._ring = deque(maxlen=capacity)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._load(legacy_path)
+        last_id = self._ring[-1]["id"] if self._ring else 0
+        self._ids = itertools.count(last_id + 1)
+
+    def append(self, entry):
+        """Record an event; returns it with its assigned ``id``."""
+        with self._lock:
+            entry = dict(entry, id=next(self._ids))
+            self._ring.append(entry)
+            self._pending.append(entry)
+        return entry
+
+    def query(self, since=None, limit=None):
+        """Newest-first events with ``id`` greater than ``since``, at most ``limit``."""
+        result = []
+        with self._lock:
+            for entry in reversed(self._ring):
+                if since is not None and entry["id"] <= since:
+                    break
+                result.append(entry)
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    # --- background flushing ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="activity-journal", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def flush(self):
+        """Write and fsync every pending entry in one batch."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            f = self._open()
+            f.write("".join(json.dumps(entry) + "\n" for entry in batch))
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception as e:
+            print(f"Error writing activity log, will retry {len(batch)} entries: {e}")
+            self._close_file()
+            with self._lock:
+                # Back in front of anything appended meanwhile, oldest dropped past the ring's capacity
+                self._pending = (batch + self._pending)[-self.capacity:]
+            return 0
+        try:
+            if f.tell() > self.max_bytes:
+                self._compact(batch[-1]["id"])
+        except Exception as e:
+            print(f"Error compacting activity log: {e}")
+        return len(batch)
+
+    def _close_file(self):
+        # Reopened on the next flush, which also terminates a torn last line
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a+b")
+            # Terminate a torn last line so the next record starts cleanly
+            if self._file.tell() > 0:
+                self._file.seek(-1, os.SEEK_END)
+                if self._file.read(1) != b"\n":
+                    self._file.write(b"\n")
+            self._file.close()
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _compact(self, upto_id):
+        """Rotate the current file to ``.1`` and rewrite it from the ring."""
+        self._file.close()
+        self._file = None
+        os.replace(self.path, self.path + ".1")
+        with self._lock:
+            # Entries after ``upto_id`` are still pending and go out with the next flush
+            entries = [entry for entry in self._ring if entry["id"] <= upto_id]
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+
+    # --- startup ---
+
+    def _load(self, legacy_path):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in deque(f, maxlen=self.capacity):
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # blank or torn line from an interrupted write
+                        if self._ring and entry.get("id", 0) <= self._ring[-1].get("id", 0):
+                            continue  # rewritten after a failed fsync
+                        self._ring.append(entry)
+            except Exception as e:
+                print(f"Error loading activity log: {e}")
+            return
+        if legacy_path and os.path.exists(legacy_path):
+            # One-time migration from the old rewrite-the-whole-list JSON file
+            try:
+                with open(legacy_path, "r") as f:
+                    legacy = json.load(f)
+                for i, entry in enumerate(legacy[-self.capacity:], start=1):
+                    entry = dict(entry, id=i)
+                    self._ring.append(entry)
+                    self._pending.append(entry)
+            except Exception as e:
+                print(f"Error loading activity log: {e}")
@@ -0,0 +1,410 @@
+"""Vectorized performance analytics over the trades store.
+
+Closed trades are loaded once per trade-store write version into NumPy
+column arrays (times and minute of day are computed by SQLite, not in Python), and
+:func:`summarize` derives everything from those arrays in one pass: equity
+curve, drawdown, Sharpe/Sortino on daily P&L, expectancy, win rate by
+session and strategy, and the R-multiple distribution.
+
+R-multiples use a ``risk_amount``/``risk`` column when the trade logger
+records one; otherwise each trade is expressed in units of the average
+losing trade, the usual 1R proxy when per-trade risk is not stored.
+
+    python analytics_engine.py --bench 1000000
+    python analytics_engine.py --reload 1000000    # store-backed load and refresh
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # /api/analytics/summary reports the missing dependency
+
+from analytics_store import DEFAULT_SESSIONS, RISK_COLUMNS
+from scan_scheduler import clock_minutes
+
+TRADING_DAYS = 252
+
+
+class TradeArrays:
+    """Column arrays for closed trades, ordered by entry time."""
+
+    def __init__(self, ts, pnl, minute, strategy_codes, strategies, symbol_codes, symbols, risk=None):
+        self.ts = ts
+        self.pnl = pnl
+        self.minute = minute
+        self.strategy_codes = strategy_codes
+        self.strategies = strategies
+        self.symbol_codes = symbol_codes
+        self.symbols = symbols
+        self.risk = risk
+
+    def __len__(self):
+        return len(self.pnl)
+
+    def select(self, symbol=None, strategy=None):
+        mask = None
+        if symbol is not None:
+            mask = self.symbol_codes == _code(self.symbols, symbol)
+        if strategy is not None:
+            strategy_mask = self.strategy_codes == _code(self.strategies, strategy)
+            mask = strategy_mask if mask is None else mask & strategy_mask
+        if mask is None:
+            return self
+        return TradeArrays(self.ts[mask], self.pnl[mask], self.minute[mask], self.strategy_codes[mask], self.strategies,
+                           self.symbol_codes[mask], self.symbols, None if self.risk is None else self.risk[mask])
+
+
+def _code(labels, value):
+    matches = np.nonzero(labels == value)[0]
+    return matches[0] if len(matches) else -1
+
+
+class AnalyticsEngine:
+    """Closed-trade arrays kept in step with the trades store.
+
+    A write-version bump reads only rows past the highest rowid seen so far
+    plus the rows that were still open (no profit) at the last read, and
+    merges the newly closed ones into the arrays. A full reload happens on
+    first use, after a closed trade is edited or deleted (``rewrite_version``),
+    or when the table's columns change.
+    """
+
+    def __init__(self, trade_store):
+        self.trade_store = trade_store
+        self._arrays = None
+        self._rowids = None
+        self._version = None
+        self._rewrite = None
+        self._columns = None
+        self._high = 0
+        self._open = []
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def arrays(self):
+        """Trade arrays for the store's current write version (refreshed when it moves)."""
+        version = self.trade_store.write_version()
+        with self._lock:
+            if self._arrays is None or version != self._version:
+                self._refresh()
+            return self._arrays
+
+    def summary(self, symbol=None, strategy=None, starting_balance=0.0):
+        if np is None:
+            raise RuntimeError("numpy is required for /api/analytics/summary")
+        return summarize(self.arrays().select(symbol, strategy), starting_balance, sessions=self.trade_store.sessions)
+
+    def _refresh(self):
+        conn = self.trade_store.connection()
+        # One read transaction, so the versions, high-water rowid and rows are one snapshot
+        conn.execute("BEGIN")
+        try:
+            version, rewrite = self.trade_store.versions()
+            columns = tuple(row[1] for row in conn.execute("PRAGMA table_info(trades)"))
+            high = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM trades").fetchone()[0]
+            select = self._select_sql(columns)
+            if self._arrays is None or rewrite != self._rewrite or columns != self._columns:
+                rows = conn.execute(select).fetchall()
+                base = None
+                self.full_loads += 1
+            else:
+                rows = conn.execute(f"{select} WHERE rowid > ?", (self._high,)).fetchall()
+                for start in range(0, len(self._open), OPEN_BATCH):
+                    batch = self._open[start:start + OPEN_BATCH]
+                    rows += conn.execute(f"{select} WHERE rowid IN ({', '.join('?' * len(batch))})", batch).fetchall()
+                base = self._arrays
+                self.incremental_loads += 1
+        finally:
+            conn.execute("COMMIT")
+        has_risk = any(c in columns for c in RISK_COLUMNS)
+        closed = [r for r in rows if r[2] is not None and r[6]]
+        self._open = [r[0] for r in rows if not (r[2] is not None and r[6])]
+        if base is None:
+            self._arrays, self._rowids = _merge(None, None, closed, has_risk)
+        elif closed:
+            self._arrays, self._rowids = _merge(base, self._rowids, closed, has_risk)
+        self._version, self._rewrite, self._columns, self._high = version, rewrite, columns, high
+
+    @staticmethod
+    def _select_sql(columns):
+        risk_column = next((c for c in RISK_COLUMNS if c in columns), None)
+        symbol = "symbol" if "symbol" in columns else "''"
+        strategy = "strategy" if "strategy" in columns else "''"
+        risk = f"CAST({risk_column} AS REAL)" if risk_column else "NULL"
+        return f"""
+            SELECT rowid,
+                   CAST(strftime('%s', entry_time) AS INTEGER),
+                   profit_value,
+                   CAST(substr(entry_time, 12, 2) AS INTEGER) * 60 + CAST(substr(entry_time, 15, 2) AS INTEGER),
+                   COALESCE({strategy}, ''),
+                   COALESCE({symbol}, ''),
+                   entry_time IS NOT NULL,
+                   {risk}
+            FROM trades"""
+
+
+# Open-trade rowids re-read per statement on an incremental refresh
+OPEN_BATCH = 500
+
+
+def _merge(base, base_rowids, rows, has_risk):
+    """Arrays for ``base`` plus ``rows`` (SELECT order of _select_sql), ordered by (entry time, rowid)."""
+    n = len(rows)
+    rowids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    ts = np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=n)
+    pnl = np.fromiter((r[2] for r in rows), dtype=np.float64, count=n)
+    minute = np.fromiter((r[3] or 0 for r in rows), dtype=np.int16, count=n)
+    strategy_values = np.array([r[4] for r in rows], dtype=object).astype(str)
+    symbol_values = np.array([r[5] for r in rows], dtype=object).astype(str)
+    risk = None
+    if has_risk:
+        risk = np.fromiter((r[7] if r[7] is not None else np.nan for r in rows), dtype=np.float64, count=n)
+
+    if base is None:
+        strategies, strategy_codes = np.unique(strategy_values, return_inverse=True)
+        symbols, symbol_codes = np.unique(symbol_values, return_inverse=True)
+        order = np.lexsort((rowids, ts))
+        return TradeArrays(ts[order], pnl[order], minute[order], strategy_codes[order], strategies,
+                           symbol_codes[order], symbols, None if risk is None else risk[order]), rowids[order]
+
+    # Re-code both sides against the union of labels (np.unique keeps them sorted)
+    strategies = np.unique(np.concatenate((base.strategies, strategy_values)))
+    symbols = np.unique(np.concatenate((base.symbols, symbol_values)))
+    old_strategy_codes = np.searchsorted(strategies, base.strategies)[base.strategy_codes]
+    old_symbol_codes = np.searchsorted(symbols, base.symbols)[base.symbol_codes]
+    strategy_codes = np.searchsorted(strategies, strategy_values)
+    symbol_codes = np.searchsorted(symbols, symbol_values)
+    if risk is None:
+        base_risk = None
+    else:
+        base_risk = base.risk if base.risk is not None else np.full(len(base), np.nan)
+
+    order = np.lexsort((rowids, ts))
+    parts = [(base.ts, ts[order]), (base.pnl, pnl[order]), (base.minute, minute[order]),
+             (old_strategy_codes, strategy_codes[order]), (old_symbol_codes, symbol_codes[order]),
+             (base_rowids, rowids[order])]
+    if risk is not None:
+        parts.append((base_risk, risk[order]))
+    merged = [np.concatenate(pair) for pair in parts]
+    # New trades usually sort after everything held; re-sort only when one does not
+    if len(base) and (ts[order][0], rowids[order][0]) < (base.ts[-1], base_rowids[-1]):
+        resort = np.lexsort((merged[5], merged[0]))
+        merged = [column[resort] for column in merged]
+    ts, pnl, minute, strategy_codes, symbol_codes, rowids = merged[:6]
+    return TradeArrays(ts, pnl, minute, strategy_codes, strategies, symbol_codes, symbols,
+                       merged[6] if risk is not None else None), rowids
+
+
+def session_codes(minute, sessions=DEFAULT_SESSIONS):
+    """Map entry minute of day to session indexes (first matching window wins; len(sessions) = off session).
+
+    Same windows and minute precision as the SQL session rollup, wrapping midnight when end < start.
+    """
+    codes = np.full(minute.shape, len(sessions), dtype=np.int8)
+    for index in range(len(sessions) - 1, -1, -1):
+        _, start, end = sessions[index]
+        lo, hi = clock_minutes(start), clock_minutes(end)
+        codes[((minute >= lo) & (minute < hi)) if lo <= hi else ((minute >= lo) | (minute < hi))] = index
+    return codes
+
+
+def _grouped_win_rate(codes, labels, wins, pnl):
+    counts = np.bincount(codes, minlength=len(labels))
+    won = np.bincount(codes, weights=wins, minlength=len(labels))
+    total = np.bincount(codes, weights=pnl, minlength=len(labels))
+    result = {}
+    for index, label in enumerate(labels):
+        if counts[index]:
+            result[str(label)] = {
+                "trades": int(counts[index]),
+                "win_rate": round(float(100.0 * won[index] / counts[index]), 2),
+                "pnl": round(float(total[index]), 2),
+            }
+    return result
+
+
+def summarize(trades, starting_balance=0.0, sessions=DEFAULT_SESSIONS, curve_points=500):
+    n = len(trades)
+    if n == 0:
+        return {"trades": 0}
+    pnl = trades.pnl
+    wins = pnl > 0
+    losses = pnl < 0
+
+    # Equity curve and drawdown
+    equity = starting_balance + np.cumsum(pnl)
+    peaks = np.maximum.accumulate(np.concatenate(([starting_balance], equity)))[1:]
+    drawdown = equity - peaks
+    dd_end = int(np.argmin(drawdown))
+    max_drawdown = float(drawdown[dd_end])
+    max_drawdown_pct = float(max_drawdown / peaks[dd_end] * 100.0) if peaks[dd_end] > 0 else None
+
+    # Daily P&L for Sharpe/Sortino (returns on starting balance when given)
+    days, day_index = np.unique(trades.ts // 86400, return_inverse=True)
+    daily = np.bincount(day_index, weights=pnl)
+    returns = daily / starting_balance if starting_balance > 0 else daily
+    mean = returns.mean()
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+    scale = np.sqrt(TRADING_DAYS)
+
+    # Expectancy
+    win_count = int(wins.sum())
+    loss_count = int(losses.sum())
+    avg_win = float(pnl[wins].mean()) if win_count else 0.0
+    avg_loss = float(-pnl[losses].mean()) if loss_count else 0.0
+    gross_loss = float(-pnl[losses].sum())
+
+    # R-multiples
+    if trades.risk is not None and np.isfinite(trades.risk).any():
+        r_multiples = pnl / np.where(trades.risk > 0, trades.risk, np.nan)
+        r_basis = "risk_amount"
+    elif avg_loss > 0:
+        r_multiples = pnl / avg_loss
+        r_basis = "average_loss"
+    else:
+        r_multiples = np.full(n, np.nan)
+        r_basis = None
+    finite_r = r_multiples[np.isfinite(r_multiples)]
+    edges = np.array([-np.inf, -3, -2, -1, -0.5, 0, 0.5, 1, 2, 3, np.inf])
+    r_hist = np.histogram(finite_r, bins=edges)[0] if len(finite_r) else np.zeros(len(edges) - 1, dtype=int)
+
+    # Downsampled equity curve for charting
+    step = max(1, n // curve_points)
+    idx = np.arange(step - 1, n, step)
+    if idx[-1] != n - 1:
+        idx = np.append(idx, n - 1)
+
+    session_labels = np.array([name for name, _, _ in sessions] + ["off_session"])
+    return {
+        "trades": n,
+        "wins": win_count,
+        "losses": loss_count,
+        "win_rate": round(100.0 * win_count / n, 2),
+        "net_pnl": round(float(equity[-1] - starting_balance), 2),
+        "profit_factor": round(float(pnl[wins].sum()) / gross_loss, 3) if gross_loss > 0 else None,
+        "avg_win": round(avg_win, 2),
+        "avg_loss": round(avg_loss, 2),
+        "expectancy": round(float(pnl.mean()), 4),
+        "max_drawdown": round(max_drawdown, 2),
+        "max_drawdown_pct": None if max_drawdown_pct is None else round(max_drawdown_pct, 2),
+        "sharpe": round(float(mean / std * scale), 3) if std > 0 else None,
+        "sortino": round(float(mean / downside * scale), 3) if downside > 0 else None,
+        "trading_days": int(len(days)),
+        "win_rate_by_session": _grouped_win_rate(session_codes(trades.minute, sessions), session_labels, wins, pnl),
+        "win_rate_by_strategy": _grouped_win_rate(trades.strategy_codes, trades.strategies, wins, pnl),
+        "r_multiples": {
+            "basis": r_basis,
+            "mean": round(float(finite_r.mean()), 3) if len(finite_r) else None,
+            "median": round(float(np.median(finite_r)), 3) if len(finite_r) else None,
+            "buckets": [
+                {"from": None if np.isinf(lo) else float(lo), "to": None if np.isinf(hi) else float(hi), "count": int(c)}
+                for lo, hi, c in zip(edges[:-1], edges[1:], r_hist)
+            ],
+        },
+        "equity_curve": [
+            {"time": int(t), "equity": round(float(e), 2), "drawdown": round(float(d), 2)}
+            for t, e, d in zip(trades.ts[idx], equity[idx], drawdown[idx])
+        ],
+    }
+
+
+def _synthetic(n, seed=7):
+    rng = np.random.default_rng(seed)
+    ts = np.sort(rng.integers(1_600_000_000, 1_700_000_000, n))
+    strategies = np.array(["judas_swing", "mmxm", "order_block", "fvg"])
+    symbols = np.array(["EURJPY", "GBPJPY", "USDJPY", "XAUUSD"])
+    return TradeArrays(ts, rng.normal(5, 40, n), ((ts // 60) % 1440).astype(np.int16),
+                       rng.integers(0, len(strategies), n), strategies,
+                       rng.integers(0, len(symbols), n), symbols)
+
+
+def _bench_reload(n, repeat, batch=50):
+    """Time the engine against a real store: the cold load, then refreshes after the bot
+    inserts ``batch`` trades and closes ``batch`` open ones, then one after an edit."""
+    from analytics_store import TradeStore
+
+    rng = np.random.default_rng(7)
+    strategies = ["judas_swing", "mmxm", "order_block", "fvg"]
+    symbols = ["EURJPY", "GBPJPY", "USDJPY", "XAUUSD"]
+
+    def trade(i, closed=True):
+        entry = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_600_000_000 + i * 60))
+        return (symbols[i % 4], strategies[(i // 4) % 4], "buy" if i % 2 else "sell", entry,
+                f"{rng.normal(5, 40):.2f}" if closed else None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "trades.db")
+        writer = sqlite3.connect(db_file)
+        writer.execute("""CREATE TABLE trades (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, strategy TEXT,
+                          direction TEXT, entry_time TEXT, profit TEXT)""")
+        writer.executemany("INSERT INTO trades (symbol, strategy, direction, entry_time, profit) VALUES (?, ?, ?, ?, ?)",
+                           (trade(i, closed=i % 10_000) for i in range(n)))
+        writer.commit()
+        store = TradeStore(db_file)
+        store.connection()
+        engine = AnalyticsEngine(store)
+
+        start = time.perf_counter()
+        engine.arrays()
+        print(f"{len(engine.arrays())} closed trades: cold load {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        timings = []
+        next_id = n
+        for _ in range(repeat):
+            with writer:
+                writer.executemany("INSERT INTO trades (symbol, strategy, direction, entry_time, profit) "
+                                   "VALUES (?, ?, ?, ?, ?)", (trade(next_id + i, closed=False) for i in range(batch)))
+                writer.execute("UPDATE trades SET profit = '12.5' WHERE rowid IN "
+                               "(SELECT rowid FROM trades WHERE profit IS NULL LIMIT ?)", (batch,))
+            next_id += batch
+            start = time.perf_counter()
+            engine.arrays()
+            timings.append((time.perf_counter() - start) * 1000.0)
+        print(f"refresh after {batch} inserts + {batch} closes: best {min(timings):.1f} ms, worst {max(timings):.1f} ms")
+
+        with writer:
+            writer.execute("UPDATE trades SET profit = '-3' WHERE rowid = 2")
+        start = time.perf_counter()
+        engine.arrays()
+        print(f"refresh after editing a closed trade (full reload): {(time.perf_counter() - start) * 1000:.0f} ms")
+        writer.close()
+
+        fresh = AnalyticsEngine(store).arrays()
+        held = engine.arrays()
+        same = (len(fresh) == len(held) and np.array_equal(fresh.ts, held.ts) and np.allclose(fresh.pnl, held.pnl)
+                and np.array_equal(fresh.strategies[fresh.strategy_codes], held.strategies[held.strategy_codes]))
+        print(f"loads: {engine.full_loads} full, {engine.incremental_loads} incremental; "
+              f"matches a fresh load: {same}")
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized trade summary and the store reload.")
+    parser.add_argument("--bench", type=int, default=1_000_000, help="number of synthetic trades")
+    parser.add_argument("--reload", type=int, metavar="N",
+                        help="time loading and refreshing N trades from a temporary trades.db instead")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if args.reload:
+        _bench_reload(args.reload, args.repeat)
+        return
+    trades = _synthetic(args.bench)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = summarize(trades, starting_balance=10_000.0)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    print(f"{args.bench} trades: best {min(timings):.1f} ms, worst {max(timings):.1f} ms")
+    print({k: result[k] for k in ("trades", "win_rate", "net_pnl", "max_drawdown", "sharpe", "sortino", "expectancy")})
+
+
+if __name__ == "__main__":
+    main()
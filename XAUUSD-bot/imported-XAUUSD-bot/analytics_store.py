@@ -0,0 +1,445 @@
+"""Shared data-access layer for trades/trades.db analytics.
+
+The ``trades`` table is written by the bot's trade logger with text times and
+profits. On first use this module adds typed, derived columns to it:
+
+- ``profit_value REAL``: the profit cast once, at write time
+- ``trade_date TEXT``: ``YYYY-MM-DD`` of ``entry_time``
+- ``weekday INTEGER``: 0 (Sunday) .. 6
+
+These are backfilled once, in short batches so the bot can keep writing,
+and then kept current by triggers stored in the database, so they stay correct whichever process inserts. Covering indexes
+on them let the day and weekday aggregations run from the index alone.
+
+Closed trades (non-NULL profit) are also rolled up into ``pnl_rollup``,
+keyed by (dimension, bucket) for day, weekday, symbol, strategy and session.
+Session buckets use the config's ``trading_sessions`` windows (see
+``scan_scheduler.session_windows``); when those change, the rollups are
+rebuilt, in batches, the next time the store is opened.
+Triggers maintain the rollups when a trade is
+inserted, closed (profit set), edited or deleted, so the endpoints read a
+few rows instead of aggregating the raw table. Run
+``python analytics_store.py rebuild`` to recompute them from scratch and
+``python analytics_store.py check`` to compare them with the raw table.
+
+Every write to ``trades`` also bumps ``store_meta.write_version``, which
+result caches use to tell whether an aggregate they hold is still current.
+``store_meta.rewrite_version`` moves only when a closed trade is edited or
+deleted, so readers that hold closed trades can pick up inserts and closes
+incrementally and reload in full only after a rewrite.
+
+Connections are opened once per thread in WAL mode and reused. Queries are
+constant parameterized SQL, so sqlite3's per-connection statement cache
+prepares each one only once.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from scan_scheduler import session_windows
+
+DB_FILE = os.path.join("trades", "trades.db")
+
+_DERIVED_COLUMNS = (
+    ("profit_value", "REAL"),
+    ("trade_date", "TEXT"),
+    ("weekday", "INTEGER"),
+)
+
+_DERIVED_SET = """
+    profit_value = CAST(profit AS REAL),
+    trade_date = substr(entry_time, 1, 10),
+    weekday = CAST(strftime('%w', entry_time) AS INTEGER)
+"""
+
+_SCHEMA = [
+    f"""CREATE TRIGGER IF NOT EXISTS trades_derived_ai AFTER INSERT ON trades BEGIN
+        UPDATE trades SET {_DERIVED_SET} WHERE rowid = NEW.rowid;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trades_derived_au AFTER UPDATE OF entry_time, profit ON trades BEGIN
+        UPDATE trades SET {_DERIVED_SET} WHERE rowid = NEW.rowid;
+    END""",
+    "CREATE INDEX IF NOT EXISTS idx_trades_date_profit ON trades (trade_date, profit_value)",
+    "CREATE INDEX IF NOT EXISTS idx_trades_weekday_profit ON trades (weekday, profit_value)",
+    """CREATE TABLE IF NOT EXISTS store_meta (id INTEGER PRIMARY KEY CHECK (id = 1), write_version INTEGER NOT NULL,
+                                              rewrite_version INTEGER NOT NULL DEFAULT 0)""",
+    "INSERT OR IGNORE INTO store_meta (id, write_version) VALUES (1, 0)",
+    """CREATE TRIGGER IF NOT EXISTS trades_version_ai AFTER INSERT ON trades BEGIN
+        UPDATE store_meta SET write_version = write_version + 1 WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trades_version_au AFTER UPDATE ON trades BEGIN
+        UPDATE store_meta SET write_version = write_version + 1 WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trades_version_ad AFTER DELETE ON trades BEGIN
+        UPDATE store_meta SET write_version = write_version + 1 WHERE id = 1;
+    END""",
+]
+
+# Columns whose edit on a closed trade counts as a rewrite (see trades_rewrite_au)
+_REWRITE_COLUMNS = ("entry_time", "profit", "symbol", "strategy")
+
+_ROLLUP_TABLE = """
+    CREATE TABLE IF NOT EXISTS pnl_rollup (
+        dimension TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        trades INTEGER NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0,
+        pnl REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, bucket)
+    ) WITHOUT ROWID
+"""
+
+# Rowids per backfill transaction, and the pause after each so waiting writers get in
+BACKFILL_BATCH = 10_000
+BACKFILL_PAUSE = 0.005
+
+# Rollup backfill progress: rows in (done, pending_to] are not aggregated yet
+_ROLLUP_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        done INTEGER NOT NULL,
+        pending_to INTEGER NOT NULL,
+        sessions TEXT
+    )
+"""
+
+_ROLLUP_TRIGGERS = ("trades_rollup_ai", "trades_rollup_au", "trades_rollup_ad")
+
+# Windows the session rollup buckets by when no config is given; see scan_scheduler.session_windows
+DEFAULT_SESSIONS = tuple(session_windows(enabled_only=False))
+
+# Columns the trade logger may use for trade direction and per-trade risk
+SIDE_COLUMNS = ("direction", "side", "trade_type", "order_type", "type", "action")
+RISK_COLUMNS = ("risk_amount", "risk")
+
+PNL_BY_DAY_SQL = """
+    SELECT bucket, pnl FROM pnl_rollup
+    WHERE dimension = 'day' AND bucket >= ?
+    ORDER BY bucket ASC
+"""
+
+PNL_BY_WEEKDAY_SQL = """
+    SELECT CAST(bucket AS INTEGER), pnl FROM pnl_rollup
+    WHERE dimension = 'weekday'
+    ORDER BY bucket
+"""
+
+# Same numbers as the trade logger's get_trade_stats: every row counted (open ones too),
+# win rate as a 0-1 fraction, premium as the total P&L
+TRADE_STATS_SQL = """
+    SELECT {side} AS s, COUNT(*), COALESCE(SUM(CAST(profit AS REAL) > 0), 0), COALESCE(SUM(CAST(profit AS REAL)), 0)
+    FROM trades WHERE symbol = ? AND strategy = ? AND s IS NOT NULL
+    GROUP BY s
+"""
+
+
+class TradeStore:
+    def __init__(self, db_file=DB_FILE, busy_timeout_ms=5000, sessions=DEFAULT_SESSIONS):
+        self.db_file = db_file
+        self.sessions = sessions
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections = []
+        self._migrated = False
+        self._migrate_lock = threading.Lock()
+        self._stats_sql = None
+
+    def connection(self):
+        """This thread's connection, opened (and the schema migrated) on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not os.path.exists(self.db_file):
+                raise FileNotFoundError(f"Trade database not found: {self.db_file}")
+            conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout_ms / 1000.0,
+                                   cached_statements=256, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            self._connections.append(conn)
+        if not self._migrated:
+            self.migrate(conn)
+        return conn
+
+    def migrate(self, conn=None):
+        """Add derived columns, backfill them, and install triggers and indexes."""
+        conn = conn or self.connection()
+        with self._migrate_lock:
+            if self._migrated:
+                return
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+            if not columns:
+                raise sqlite3.OperationalError("no such table: trades")
+            with conn:
+                for name, sql_type in _DERIVED_COLUMNS:
+                    if name not in columns:
+                        conn.execute(f"ALTER TABLE trades ADD COLUMN {name} {sql_type}")
+                # Rows the bot writes while the backfill runs get their values here
+                for statement in _SCHEMA[:2]:
+                    conn.execute(statement)
+            self._backfill(conn)
+            # One statement per transaction: each index build holds the write lock on its own
+            for statement in _SCHEMA:
+                with conn:
+                    conn.execute(statement)
+            with conn:
+                self._install_rewrite_trigger(conn, columns)
+            if "symbol" in columns and "strategy" in columns:
+                with conn:
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_strategy ON trades (symbol, strategy)")
+            with conn:
+                self._install_rollups(conn, columns)
+            self._backfill_rollups(conn, columns)
+            conn.execute("ANALYZE trades")
+            self._migrated = True
+
+    def _backfill(self, conn):
+        """Fill the derived columns ``BACKFILL_BATCH`` rowids per transaction, so the bot's
+        writers (5 s busy timeout) get the lock between batches instead of after the whole table."""
+        last_rowid = conn.execute("SELECT MAX(rowid) FROM trades").fetchone()[0] or 0
+        for start in range(0, last_rowid, BACKFILL_BATCH):
+            with conn:
+                conn.execute(f"""UPDATE trades SET {_DERIVED_SET}
+                                 WHERE rowid > ? AND rowid <= ? AND (trade_date IS NULL OR profit_value IS NULL)""",
+                             (start, start + BACKFILL_BATCH))
+            time.sleep(BACKFILL_PAUSE)
+
+    def _install_rewrite_trigger(self, conn, columns):
+        if "rewrite_version" not in {row[1] for row in conn.execute("PRAGMA table_info(store_meta)")}:
+            conn.execute("ALTER TABLE store_meta ADD COLUMN rewrite_version INTEGER NOT NULL DEFAULT 0")
+        # Closing a trade (profit NULL -> value) is not a rewrite; the derived-column
+        # trigger's own UPDATE touches none of these columns
+        watched = ", ".join(c for c in _REWRITE_COLUMNS + RISK_COLUMNS if c in columns)
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trades_rewrite_au AFTER UPDATE OF {watched} ON trades
+            WHEN OLD.profit IS NOT NULL BEGIN
+            UPDATE store_meta SET rewrite_version = rewrite_version + 1 WHERE id = 1;
+        END""")
+        conn.execute("""CREATE TRIGGER IF NOT EXISTS trades_rewrite_ad AFTER DELETE ON trades
+            WHEN OLD.profit IS NOT NULL BEGIN
+            UPDATE store_meta SET rewrite_version = rewrite_version + 1 WHERE id = 1;
+        END""")
+
+    # --- rollups ---
+
+    def _dimensions(self, columns, row):
+        """``[(dimension, bucket SQL)]`` for a row alias such as NEW, OLD or t."""
+        dims = [
+            ("day", f"substr({row}.entry_time, 1, 10)"),
+            ("weekday", f"strftime('%w', {row}.entry_time)"),
+        ]
+        if "symbol" in columns:
+            dims.append(("symbol", f"{row}.symbol"))
+        if "strategy" in columns:
+            dims.append(("strategy", f"{row}.strategy"))
+        if "session" in columns:
+            dims.append(("session", f"{row}.session"))
+        else:
+            clock = f"substr({row}.entry_time, 12, 5)"
+            cases = " ".join(
+                f"WHEN {clock} >= '{start}' {'AND' if start <= end else 'OR'} {clock} < '{end}' THEN '{name}'"
+                for name, start, end in self.sessions)
+            dims.append(("session", f"CASE WHEN {row}.entry_time IS NULL THEN NULL {cases} ELSE 'off_session' END"))
+        return dims
+
+    def _apply_row_sql(self, columns, row, sign):
+        """Upsert one row's contribution (``sign`` = 1 or -1) into every rollup bucket."""
+        buckets = " UNION ALL ".join(f"SELECT '{dim}' AS d, {expr} AS b" for dim, expr in self._dimensions(columns, row))
+        profit = f"CAST({row}.profit AS REAL)"
+        return f"""
+            INSERT INTO pnl_rollup (dimension, bucket, trades, wins, losses, pnl)
+            SELECT d, b, {sign}, {sign} * ({profit} > 0), {sign} * ({profit} < 0), {sign} * {profit}
+            FROM ({buckets}) WHERE b IS NOT NULL AND {row}.profit IS NOT NULL
+            ON CONFLICT (dimension, bucket) DO UPDATE SET
+                trades = trades + excluded.trades,
+                wins = wins + excluded.wins,
+                losses = losses + excluded.losses,
+                pnl = pnl + excluded.pnl;
+        """
+
+    def _install_rollups(self, conn, columns):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pnl_rollup'").fetchone()
+        conn.execute(_ROLLUP_STATE_TABLE)
+        if "sessions" not in {row[1] for row in conn.execute("PRAGMA table_info(rollup_state)")}:
+            conn.execute("ALTER TABLE rollup_state ADD COLUMN sessions TEXT")
+        conn.execute("INSERT OR IGNORE INTO rollup_state (id, done, pending_to) VALUES (1, 0, 0)")
+        spec = json.dumps([list(window) for window in self.sessions])
+        stored = conn.execute("SELECT sessions FROM rollup_state").fetchone()[0]
+        # Rollups from before windows were recorded used the defaults
+        stored = stored or json.dumps([list(window) for window in DEFAULT_SESSIONS])
+        if exists and stored != spec and "session" not in columns:
+            # The triggers and the session buckets encode the old windows: start over, in batches
+            print(f"Session windows changed ({stored} -> {spec}), rebuilding the P&L rollups")
+            for trigger in _ROLLUP_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute("DROP TABLE pnl_rollup")
+            exists = None
+        conn.execute(_ROLLUP_TABLE)
+        conn.execute("UPDATE rollup_state SET sessions = ?", (spec,))
+        if not exists:
+            # Rows up to here are aggregated by _backfill_rollups in batches; the triggers skip them until then
+            conn.execute("UPDATE rollup_state SET done = 0, pending_to = (SELECT COALESCE(MAX(rowid), 0) FROM trades)")
+        watched = ", ".join(c for c in ("entry_time", "profit", "symbol", "strategy", "session")
+                            if c in columns)
+        aggregated = "WHEN {0}.rowid <= (SELECT done FROM rollup_state) OR {0}.rowid > (SELECT pending_to FROM rollup_state)"
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trades_rollup_ai AFTER INSERT ON trades {aggregated.format("NEW")} BEGIN
+            {self._apply_row_sql(columns, "NEW", 1)}
+        END""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trades_rollup_au AFTER UPDATE OF {watched} ON trades {aggregated.format("NEW")} BEGIN
+            {self._apply_row_sql(columns, "OLD", -1)}
+            {self._apply_row_sql(columns, "NEW", 1)}
+        END""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trades_rollup_ad AFTER DELETE ON trades {aggregated.format("OLD")} BEGIN
+            {self._apply_row_sql(columns, "OLD", -1)}
+        END""")
+
+    def _aggregate_sql(self, dim, expr, where=""):
+        return f"""
+            INSERT INTO pnl_rollup (dimension, bucket, trades, wins, losses, pnl)
+            SELECT '{dim}', {expr} AS b, COUNT(*),
+                   SUM(CAST(t.profit AS REAL) > 0), SUM(CAST(t.profit AS REAL) < 0), SUM(CAST(t.profit AS REAL))
+            FROM trades t WHERE t.profit IS NOT NULL AND b IS NOT NULL {where}
+            GROUP BY b
+            ON CONFLICT (dimension, bucket) DO UPDATE SET
+                trades = trades + excluded.trades,
+                wins = wins + excluded.wins,
+                losses = losses + excluded.losses,
+                pnl = pnl + excluded.pnl
+        """
+
+    def _backfill_rollups(self, conn, columns):
+        """Aggregate rows the rollups do not cover yet, ``BACKFILL_BATCH`` rowids per transaction.
+
+        Progress is kept in ``rollup_state`` with the batch, so an interrupted
+        run resumes where it stopped and no row is counted twice.
+        """
+        while True:
+            with conn:
+                done, pending_to = conn.execute("SELECT done, pending_to FROM rollup_state").fetchone()
+                if done >= pending_to:
+                    return
+                upto = min(pending_to, done + BACKFILL_BATCH)
+                for dim, expr in self._dimensions(columns, "t"):
+                    conn.execute(self._aggregate_sql(dim, expr, "AND t.rowid > ? AND t.rowid <= ?"), (done, upto))
+                conn.execute("UPDATE rollup_state SET done = ?", (upto,))
+            time.sleep(BACKFILL_PAUSE)
+
+    def _rebuild_rollups(self, conn, columns):
+        conn.execute("DELETE FROM pnl_rollup")
+        conn.execute("UPDATE rollup_state SET done = 0, pending_to = 0")
+        for dim, expr in self._dimensions(columns, "t"):
+            conn.execute(self._aggregate_sql(dim, expr))
+
+    def rebuild_rollups(self):
+        """Recompute every rollup from the raw trades table."""
+        conn = self.connection()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+        with conn:
+            self._rebuild_rollups(conn, columns)
+            conn.execute("UPDATE store_meta SET write_version = write_version + 1 WHERE id = 1")
+
+    def check_rollups(self, tolerance=1e-6):
+        """Compare rollups with a fresh aggregation; returns a list of mismatches."""
+        conn = self.connection()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+        mismatches = []
+        for dim, expr in self._dimensions(columns, "t"):
+            raw = {b: (n, w, l, p) for b, n, w, l, p in conn.execute(f"""
+                SELECT {expr} AS b, COUNT(*), SUM(CAST(t.profit AS REAL) > 0),
+                       SUM(CAST(t.profit AS REAL) < 0), SUM(CAST(t.profit AS REAL))
+                FROM trades t WHERE t.profit IS NOT NULL AND b IS NOT NULL GROUP BY b
+            """)}
+            rolled = {b: (n, w, l, p) for b, n, w, l, p in conn.execute(
+                "SELECT bucket, trades, wins, losses, pnl FROM pnl_rollup WHERE dimension = ? AND trades != 0", (dim,))}
+            for bucket in sorted(set(raw) | set(rolled)):
+                expected = raw.get(bucket, (0, 0, 0, 0.0))
+                actual = rolled.get(bucket, (0, 0, 0, 0.0))
+                if expected[:3] != actual[:3] or abs((expected[3] or 0.0) - (actual[3] or 0.0)) > tolerance:
+                    mismatches.append({"dimension": dim, "bucket": bucket, "expected": expected, "actual": actual})
+        return mismatches
+
+    def write_version(self):
+        """Counter bumped by every insert, update or delete on trades."""
+        return self.connection().execute("SELECT write_version FROM store_meta WHERE id = 1").fetchone()[0]
+
+    def versions(self):
+        """``(write_version, rewrite_version)``; see the module docstring."""
+        return self.connection().execute("SELECT write_version, rewrite_version FROM store_meta WHERE id = 1").fetchone()
+
+    def pnl_by_day(self, since_date):
+        """``[(YYYY-MM-DD, pnl)]`` for trades entered on or after ``since_date``."""
+        return self.connection().execute(PNL_BY_DAY_SQL, (since_date,)).fetchall()
+
+    def pnl_by_weekday(self):
+        """``[(weekday 0=Sun..6, pnl)]`` over all trades."""
+        return self.connection().execute(PNL_BY_WEEKDAY_SQL).fetchall()
+
+    def trade_stats(self, symbol, strategy):
+        """Buy/sell trade count, win rate (0-1) and total P&L (``premium``) for one symbol and strategy."""
+        stats = {side: {"count": 0, "win_rate": 0.0, "premium": 0.0} for side in ("buy", "sell")}
+        for side, trades, wins, pnl in self.connection().execute(self._trade_stats_sql(), (symbol, strategy)):
+            stats[side] = {
+                "count": trades,
+                "win_rate": round(wins / trades, 4),
+                "premium": round(pnl, 2),
+            }
+        return stats
+
+    def _trade_stats_sql(self):
+        if self._stats_sql is None:
+            columns = self.columns()
+            side = next((c for c in SIDE_COLUMNS if c in columns), None)
+            if side is None or "symbol" not in columns or "strategy" not in columns:
+                raise sqlite3.OperationalError("trades has no symbol, strategy and buy/sell columns")
+            value = f"lower(CAST({side} AS TEXT))"
+            self._stats_sql = TRADE_STATS_SQL.format(
+                side=f"CASE WHEN {value} IN ('buy', 'long', '0') THEN 'buy' WHEN {value} IN ('sell', 'short', '1') THEN 'sell' END")
+        return self._stats_sql
+
+    def has_side_column(self):
+        columns = self.columns()
+        return "symbol" in columns and "strategy" in columns and any(c in columns for c in SIDE_COLUMNS)
+
+    def columns(self):
+        return {row[1] for row in self.connection().execute("PRAGMA table_info(trades)")}
+
+    def close(self):
+        for conn in self._connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._connections = []
+        self._local = threading.local()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the trades.db P&L rollups.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--config", default="config.json", help="config whose trading_sessions define the windows")
+    args = parser.parse_args()
+    try:
+        with open(args.config) as f:
+            sessions = session_windows(json.load(f).get("trading_sessions"), enabled_only=False)
+    except (OSError, ValueError):
+        sessions = DEFAULT_SESSIONS
+    store = TradeStore(args.db, sessions=sessions)
+    if args.command == "rebuild":
+        store.rebuild_rollups()
+        print("Rollups rebuilt.")
+        return
+    mismatches = store.check_rollups()
+    if mismatches:
+        print(json.dumps(mismatches, indent=2, default=str))
+        print(f"{len(mismatches)} rollup bucket(s) differ from the raw table.")
+        sys.exit(1)
+    print("Rollups match the raw trades table.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,5 @@
 import logging
 import os
-import threading
-import subprocess
 from fastapi import FastAPI, Request, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -10,13 +8,29 @@ try:
     import MetaTrader5 as mt5  # Available on Windows with terminal installed
 except Exception:
     mt5 = None  # Allow API to run without MT5 in cloud deployments
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import datetime
 import sys
 import json
-import time
+import asyncio
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from STOCKDATA.utils.trade_logger import get_trade_stats
-import shutil
+from mt5_session import MT5SessionManager, MT5SessionError
+from deal_cache import DealCache, parse_since
+from config_store import ConfigStore, ConfigValidationError
+from activity_journal import ActivityJournal
+from event_stream import EventBroker, TOPICS, diff_positions
+from analytics_store import TradeStore
+from result_cache import ResultCache, normalize_key
+from analytics_engine import AnalyticsEngine
+from scan_scheduler import session_windows
+from candle_store import CandleStore, CANDLE_DIR, normalize_timeframe, to_records
+from risk_state import RiskStateStore
+from bot_supervisor import BotLogStore, BotSupervisor
+from bot_ipc import ControlServer
+from copy_trading import CopyTrader
 
 
 
@@ -24,6 +38,17 @@ import shutil
 
 app = FastAPI()
 
+# Blocking work never runs on the event loop: terminal calls go to the MT5
+# session's single worker thread, file and SQLite work to this pool.
+IO_WORKERS = int(os.environ.get("API_IO_WORKERS", "8"))
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="api-io")
+
+async def run_io(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+async def run_mt5(func, session=None, op="call"):
+    return await asyncio.wrap_future(mt5_sessions.submit(func, session=session, op=op))
+
 # Allow all origins for development (change in production)
 app.add_middleware(
     CORSMiddleware,
@@ -31,90 +56,110 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Config-Version"],
 )
 
 CONFIG_FILE = 'config.json'
 
+# Used when config.json is missing or corrupted at startup
+DEFAULT_CONFIG = {
+    "symbols": ["XAUUSD", "XAGUSD", "GBPJPY", "USDJPY", "EURJPY", "US30", "AMD", "MSFT", "NVDA"],
+    "timeframe": "TIMEFRAME_M15",
+    "candle_count": 50,
+    "candle_freshness_threshold_seconds": 900,
+    "risk_settings": {
+        "max_daily_loss": 500,
+        "max_daily_profit": 1000,
+        "risk_per_trade": 1.5,
+        "max_daily_trades": 20,
+        "default_lot_size": 0.05,
+        "max_open_trades": 20,
+        "allow_multiple_trades": True
+    },
+    "trading_sessions": {
+        "enable_trading": True,
+        "london": { "active": True, "start": "08:00", "end": "17:00" },
+        "new_york": { "active": True, "start": "13:00", "end": "22:00" },
+        "asian": { "active": False, "start": "00:00", "end": "09:00" },
+        "custom": { "start": "08:00", "end": "17:00" }
+    },
+    "strategy_filters": {
+        "killzone_filter": True,
+        "news_filter": True,
+        "volatility_filter": True,
+        "trend_filter": True
+    },
+    "notifications": {
+        "email_alerts": True,
+        "telegram_alerts": True,
+        "push_notifications": True,
+        "trade_alerts": True
+    },
+    "advanced_settings": {
+        "max_slippage": 3,
+        "max_spread": 20,
+        "auto_reconnect": True,
+        "emergency_stop": True,
+        "bot_restart_policy": "on-failure",
+        "bot_heartbeat_timeout": 0
+    },
+    "logging": {
+        "log_dir": "logs",
+        "log_level": "INFO"
+    },
+    "mt5": {
+        "login": 5036996416,
+        "password": "6kZs-oPr",
+        "server": "MetaQuotes-Demo"
+    }
+}
+
+# Parsed and validated once per change; reloaded when config.json changes on disk
+config_store = ConfigStore(CONFIG_FILE, defaults=DEFAULT_CONFIG)
+
 def load_config():
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Config file not found or corrupted at {CONFIG_FILE}: {e}. Returning default config.")
-        # Return a complete default config if file is missing or corrupted
-        return {
-            "symbols": ["XAUUSD", "XAGUSD", "GBPJPY", "USDJPY", "EURJPY", "US30", "AMD", "MSFT", "NVDA"],
-            "timeframe": "TIMEFRAME_M15",
-            "candle_count": 50,
-            "candle_freshness_threshold_seconds": 900,
-            "risk_settings": {
-                "max_daily_loss": 500,
-                "max_daily_profit": 1000,
-                "risk_per_trade": 1.5,
-                "max_daily_trades": 20,
-                "default_lot_size": 0.05,
-                "max_open_trades": 20,
-                "allow_multiple_trades": True
-            },
-            "trading_sessions": {
-                "enable_trading": True,
-                "london": { "active": True, "start": "08:00", "end": "17:00" },
-                "new_york": { "active": True, "start": "13:00", "end": "22:00" },
-                "asian": { "active": False, "start": "00:00", "end": "09:00" },
-                "custom": { "start": "08:00", "end": "17:00" }
-            },
-            "strategy_filters": {
-                "killzone_filter": True,
-                "news_filter": True,
-                "volatility_filter": True,
-                "trend_filter": True
-            },
-            "notifications": {
-                "email_alerts": True,
-                "telegram_alerts": True,
-                "push_notifications": True,
-                "trade_alerts": True
-            },
-            "advanced_settings": {
-                "max_slippage": 3,
-                "max_spread": 20,
-                "auto_reconnect": True,
-                "emergency_stop": True
-            },
-            "logging": {
-                "log_dir": "logs",
-                "log_level": "INFO"
-            },
-            "mt5": {
-                "login": 5036996416,
-                "password": "6kZs-oPr",
-                "server": "MetaQuotes-Demo"
-            }
-        }
-    except Exception as e:
-        print(f"An unexpected error occurred while loading config file: {e}. Returning empty config.")
-        return {}
+    return config_store.get()
 
-# Helper function to save config.json (atomic write for safety)
-def save_config(config_data):
-    try:
-        tmp_file = CONFIG_FILE + '.tmp'
-        with open(tmp_file, 'w') as f:
-            json.dump(config_data, f, indent=2)
-        shutil.move(tmp_file, CONFIG_FILE)
-    except Exception as e:
-        print(f"Error saving config file: {e}")
+# One long-lived terminal session shared by every request (see mt5_session.py)
+mt5_sessions = MT5SessionManager(mt5, auto_reconnect=load_config().get('advanced_settings', {}).get('auto_reconnect', True))
+config_store.subscribe(lambda cfg: setattr(mt5_sessions, 'auto_reconnect', cfg.get('advanced_settings', {}).get('auto_reconnect', True)))
+
+# Closed-deal caches per (login, server); only deals past the high-water mark are fetched
+deal_caches = {}
+
+# Reused, indexed connections to trades/trades.db for the analytics endpoints
+# Session rollups bucket by the configured windows (re-keyed on the next start if they change)
+trade_store = TradeStore(sessions=session_windows(load_config().get('trading_sessions'), enabled_only=False))
+
+# Analytics results, invalidated whenever the trade store's write version moves
+analytics_cache = ResultCache(max_entries=256, ttl=60.0)
 
-# Initial load of configuration when the API server starts
-config = load_config()
+# NumPy column arrays over closed trades for the summary metrics
+analytics_engine = AnalyticsEngine(trade_store)
 
-# Global variable to hold the bot process
-bot_process = None
+async def cached_analytics(endpoint, compute, **params):
+    key = normalize_key(endpoint, **params)
+    return await run_io(
+        lambda: analytics_cache.get_or_compute(
+            key, trade_store.write_version(), compute,
+            cacheable=lambda result: isinstance(result, dict) and result.get("success")))
+
+# Closed bars on disk, shared with the bot and backtests; only the tail is fetched
+candle_store = CandleStore(os.environ.get("CANDLE_DIR", CANDLE_DIR))
+
+# Daily trade/P&L counters and open slots, shared live with the bot (logs/risk_state.db)
+risk_state = RiskStateStore()
+
+# Push channel for the dashboard (activity, positions, bot status/output/metrics, accounts)
+events = EventBroker()
 
 # --- Activity Log ---
-activity_log = []
-activity_log_file = os.path.join("logs", "activity_log.json")
-activity_log_lock = threading.Lock()
+# Ring buffer in memory, appended to logs/activity_log.jsonl in the background
+activity_log = ActivityJournal(
+    os.path.join("logs", "activity_log.jsonl"),
+    capacity=200,
+    legacy_path=os.path.join("logs", "activity_log.json"),
+)
 
 # Helper to add event to activity log
 def log_event(event_type, title, details, tag):
@@ -125,25 +170,9 @@ def log_event(event_type, title, details, tag):
         "timestamp": datetime.datetime.now().isoformat(),
         "tag": tag
     }
-    with activity_log_lock:
-        activity_log.append(entry)
-        # Keep only last 200 events
-        if len(activity_log) > 200:
-            activity_log[:] = activity_log[-200:]
-        # Save to file
-        try:
-            with open(activity_log_file, "w") as f:
-                json.dump(activity_log, f, indent=2)
-        except Exception as e:
-            print(f"Error writing activity log: {e}")
-
-# Load activity log from file at startup
-if os.path.exists(activity_log_file):
-    try:
-        with open(activity_log_file, "r") as f:
-            activity_log = json.load(f)
-    except Exception as e:
-        print(f"Error loading activity log: {e}")
+    entry = activity_log.append(entry)
+    events.publish("activity", entry)
+    return entry
 
 # In-memory storage for demo (replace with DB in production)
 mt5_accounts = []
@@ -161,6 +190,7 @@ class MT5Account(BaseModel):
 MT5_ACCOUNTS_FILE = 'mt5_accounts.json'
 
 def save_mt5_accounts(accounts: List[MT5Account]):
+    events.publish("accounts", [acc.dict() for acc in accounts])
     try:
         with open(MT5_ACCOUNTS_FILE, 'w') as f:
             json.dump([acc.dict() for acc in accounts], f, indent=2)
@@ -188,11 +218,11 @@ class MT5LoginRequest(BaseModel):
 
 # Auth stubs to satisfy frontend checks when Node auth is not used
 @app.get("/auth/status")
-def auth_status():
+async def auth_status():
     return {"authenticated": False, "user": None}
 
 @app.get("/logout")
-def logout():
+async def logout():
     return {"success": True}
 
 class GoogleUser(BaseModel):
@@ -200,7 +230,7 @@ class GoogleUser(BaseModel):
     name: str
 
 @app.get("/api/account")
-def get_account():
+async def get_account():
     # Replace this with your real trading bot data
     return {
         "balance": 1234.56,
@@ -212,20 +242,13 @@ def get_account():
     }
 
 @app.post("/api/mt5/login")
-def mt5_login(account: MT5LoginRequest):
+async def mt5_login(account: MT5LoginRequest):
     if mt5 is None:
         error_msg = "MetaTrader5 is not available in this deployment. This endpoint requires MT5 on Windows."
         print(f"ERROR: {error_msg}")
         return {"success": False, "error": error_msg}
     print(f"Attempting MT5 login for account: {account.login} on server: {account.server}")
 
-    # First, disconnect if already connected
-    print("Shutting down any existing MT5 connections...")
-    mt5.shutdown()
-    time.sleep(1)  # Give it a moment to disconnect
-
-    # Attempt to connect with new credentials
-    print("Initializing MT5 connection...")
     try:
         login_int = int(account.login)
     except (TypeError, ValueError):
@@ -233,32 +256,13 @@ def mt5_login(account: MT5LoginRequest):
         print(f"ERROR: {error_msg}")
         return {"success": False, "error": error_msg}
 
-    if not mt5.initialize(login=login_int, password=account.password, server=account.server):
-        error_msg = f"Failed to initialize MT5 terminal. Error: {mt5.last_error()}"
-        print(f"ERROR: {error_msg}")
-        log_event("error", "Login Failed", f"Failed to connect to MT5 with credentials: {account.login} on {account.server}", "error")
-        return {"success": False, "error": error_msg}
-
-    print("MT5 terminal initialized successfully. Attempting to login...")
-
-    # Try to login with provided credentials
-    authorized = mt5.login(login=login_int, password=account.password, server=account.server)
-    if not authorized:
-        error_msg = f"MT5 login failed. Error: {mt5.last_error()}"
+    # Reuses the running terminal; only a login switch happens if another account was active
+    try:
+        acc_info = await asyncio.wrap_future(mt5_sessions.submit_connect(login_int, account.password, account.server))
+    except MT5SessionError as e:
+        error_msg = str(e)
         print(f"ERROR: {error_msg}")
         log_event("error", "MT5 Login Failed", f"Login failed for {account.login} on {account.server}", "error")
-        mt5.shutdown()
-        return {"success": False, "error": error_msg}
-
-    print("MT5 login successful. Fetching account info...")
-
-    # Fetch account info
-    acc_info = mt5.account_info()
-    if acc_info is None:
-        error_msg = f"Failed to fetch account info. Error: {mt5.last_error()}"
-        print(f"ERROR: {error_msg}")
-        log_event("error", "MT5 Account Info Failed", f"Could not fetch account info for {account.login}", "error")
-        mt5.shutdown()
         return {"success": False, "error": error_msg}
 
     print(f"Account info retrieved successfully. Login: {acc_info.login}, Balance: {acc_info.balance}")
@@ -278,87 +282,108 @@ def mt5_login(account: MT5LoginRequest):
     global mt5_accounts
     mt5_accounts = [a for a in mt5_accounts if a.login != acc.login or a.server != acc.server]
     mt5_accounts.append(acc)
-    save_mt5_accounts(mt5_accounts)
+    await run_io(save_mt5_accounts, mt5_accounts)
 
     print(f"Account {acc.login} connected and saved successfully.")
     log_event("connection", "MT5 Connected", f"Account ****{str(acc_info.login)[-4:]} ({account.server})", "connection")
 
-    # Don't shutdown here to keep the connection alive
-    # mt5.shutdown()
-
     return {"success": True, "account": acc.dict()}
 
 @app.get("/api/mt5/accounts", response_model=List[MT5Account])
-def get_mt5_accounts():
+async def get_mt5_accounts():
     return mt5_accounts
 
 @app.post("/api/mt5/logout")
-def mt5_logout(account: MT5LoginRequest):
+async def mt5_logout(account: MT5LoginRequest):
     global mt5_accounts
     initial_count = len(mt5_accounts)
     mt5_accounts = [acc for acc in mt5_accounts if acc.login != account.login or acc.server != account.server]
     if len(mt5_accounts) < initial_count:
-        save_mt5_accounts(mt5_accounts)
+        await run_io(save_mt5_accounts, mt5_accounts)
+        try:
+            await asyncio.wrap_future(mt5_sessions.submit_disconnect(account.login, account.server))
+        except (TypeError, ValueError):
+            pass
         log_event("connection", "MT5 Disconnected", f"Account ****{str(account.login)[-4:]} ({account.server}) disconnected.", "connection")
         return {"success": True, "message": "Account disconnected successfully."}
     else:
         return JSONResponse(status_code=404, content={"success": False, "error": "Account not found."})
 
 @app.get("/api/mt5/trades")
-def get_mt5_trades():
+async def get_mt5_trades(since: str = None, limit: int = Query(None, ge=1), cursor: str = None):
+    """Open positions plus closed trades from the deal cache.
+
+    ``since`` (ISO time or epoch seconds) keeps closed trades after that time,
+    ``limit`` keeps the newest N and ``cursor`` (a previous ``next_cursor``)
+    pages further back in history.
+    """
     if mt5 is None:
         return JSONResponse(status_code=200, content={"success": False, "error": "MetaTrader5 not available in this deployment.", "open_trades": [], "closed_trades": []})
+    try:
+        since_ts = parse_since(since)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"success": False, "error": f"Invalid since value: {since}", "open_trades": [], "closed_trades": []})
     config = load_config()
     mt5_config = config.get('mt5', {})
-    if not mt5.initialize(login=mt5_config.get('login'), password=mt5_config.get('password'), server=mt5_config.get('server')):
-        return JSONResponse(status_code=200, content={"success": False, "error": "MetaTrader 5 terminal not found or not running.", "open_trades": [], "closed_trades": []})
     try:
-        # Get open positions
-        open_trades = mt5.positions_get()
-        open_trades_list = []
-        if open_trades is not None:
-            for pos in open_trades:
-                open_trades_list.append({
-                    "ticket": pos.ticket,
-                    "symbol": pos.symbol,
-                    "volume": pos.volume,
-                    "price_open": pos.price_open,
-                    "profit": pos.profit,
-                    "type": pos.type,
-                    "time": datetime.datetime.fromtimestamp(pos.time).isoformat() if hasattr(pos, 'time') else None,
-                    "comment": getattr(pos, 'comment', "")
-                })
-        # Get closed deals (history)
-        utc_from = datetime.datetime.now() - datetime.timedelta(days=365)
-        utc_to = datetime.datetime.now()
-        history_deals = mt5.history_deals_get(utc_from, utc_to)
-        closed_trades_list = []
-        # Only include real closed trades (DEAL_TYPE_BUY/SELL and volume > 0)
-        DEAL_TYPE_BUY = 0
-        DEAL_TYPE_SELL = 1
-        if history_deals is not None:
-            for deal in history_deals:
-                if deal.type in (DEAL_TYPE_BUY, DEAL_TYPE_SELL) and deal.volume > 0:
-                    closed_trades_list.append({
-                        "ticket": deal.ticket,
-                        "symbol": deal.symbol,
-                        "volume": deal.volume,
-                        "price": deal.price,
-                        "profit": float(deal.profit),
-                        "type": deal.type,
-                        "time": datetime.datetime.fromtimestamp(deal.time).isoformat() if hasattr(deal, 'time') else None,
-                        "comment": getattr(deal, 'comment', "")
-                    })
-        mt5.shutdown()
-        return {"success": True, "open_trades": open_trades_list, "closed_trades": closed_trades_list}
+        session = mt5_sessions.register(mt5_config.get('login'), mt5_config.get('password'), mt5_config.get('server'))
+    except (TypeError, ValueError):
+        return JSONResponse(status_code=200, content={"success": False, "error": "MT5 credentials missing from config.", "open_trades": [], "closed_trades": []})
+    cache = deal_caches.setdefault(session, DealCache())
+    try:
+        open_trades_list = await run_mt5(lambda mt5: _fetch_trades(mt5, cache), session=session, op="trades")
+        # Thousands of deals take long enough to encode that it is done off the event loop
+        body = await run_io(_encode_trades, cache, open_trades_list, since_ts, limit, cursor)
+        return Response(content=body, media_type="application/json")
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"success": False, "error": str(e), "open_trades": [], "closed_trades": []})
+    except MT5SessionError:
+        return JSONResponse(status_code=200, content={"success": False, "error": "MetaTrader 5 terminal not found or not running.", "open_trades": [], "closed_trades": []})
     except Exception as e:
         logging.error(f"Error fetching MT5 trades: {e}")
         return JSONResponse(status_code=200, content={"success": False, "error": f"Failed to fetch MT5 trades: {e}", "open_trades": [], "closed_trades": []})
 
+def _encode_trades(cache, open_trades_list, since_ts, limit, cursor):
+    closed_trades_list, next_cursor = cache.page(since=since_ts, limit=limit, cursor=cursor)
+    return json.dumps({"success": True, "open_trades": open_trades_list, "closed_trades": closed_trades_list,
+                       "next_cursor": next_cursor}, default=str).encode()
+
+def _fetch_trades(mt5, cache):
+    """Read open positions and top up the deal cache; runs on the MT5 session thread."""
+    open_trades_list = _fetch_positions(mt5)
+    # Get closed deals newer than what is already cached
+    cache.refresh(mt5)
+    return open_trades_list
+
+def _fetch_positions(mt5):
+    open_trades = mt5.positions_get()
+    open_trades_list = []
+    if open_trades is not None:
+        for pos in open_trades:
+            open_trades_list.append({
+                "ticket": pos.ticket,
+                "symbol": pos.symbol,
+                "volume": pos.volume,
+                "price_open": pos.price_open,
+                "profit": pos.profit,
+                "type": pos.type,
+                "time": datetime.datetime.fromtimestamp(pos.time).isoformat() if hasattr(pos, 'time') else None,
+                "comment": getattr(pos, 'comment', "")
+            })
+    return open_trades_list
+
+@app.get("/api/mt5/session")
+async def get_mt5_session():
+    """Session state and per-operation terminal latency."""
+    return mt5_sessions.metrics()
+
 @app.get("/api/bot/settings")
-def get_bot_settings():
-    config_data = load_config()
-    return JSONResponse(content=config_data)
+async def get_bot_settings(request: Request):
+    _, body, etag, version = config_store.snapshot()
+    headers = {"ETag": etag, "X-Config-Version": str(version), "Cache-Control": "no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/api/bot/settings")
 async def update_bot_settings(settings_data: dict = Body(...)):
@@ -371,104 +396,135 @@ async def update_bot_settings(settings_data: dict = Body(...)):
     Other keys will be merged into config.json as before.
     """
     try:
-        # Persist UI runtime selections separately so the bot thread can poll them
-        runtime_keys = ["all_strategies", "selected_strategies", "killzone_map", "current_session"]
-        runtime_state_path = os.path.join("logs", "bot_runtime_settings.json")
-        os.makedirs(os.path.dirname(runtime_state_path), exist_ok=True)
-        try:
-            with open(runtime_state_path, "w") as f:
-                json.dump({k: settings_data.get(k) for k in runtime_keys if k in settings_data}, f, indent=2)
-        except Exception:
-            pass
-
-        # Merge persistent config as before
-        config.update(settings_data)
-        save_config(config)
+        await run_io(_save_bot_settings, settings_data)
+        delivery = await run_io(_deliver_settings)
         log_event("config", "Bot Settings Updated", "Configuration settings updated successfully via UI.", "settings")
-        return {"success": True, "message": "Settings updated successfully!"}
+        return {"success": True, "message": "Settings updated successfully!", "version": config_store.version, "etag": config_store.etag,
+                "delivery": delivery}
+    except ConfigValidationError as e:
+        return JSONResponse(status_code=400, content={"success": False, "error": f"Invalid settings: {e}"})
     except Exception as e:
         log_event("error", "Failed to Update Settings", f"Error updating configuration: {e}", "settings")
         return JSONResponse(status_code=500, content={"success": False, "error": f"Failed to update settings: {e}"})
 
-def stream_output(pipe, prefix):
-    """Reads from a pipe and prints lines with a prefix."""
+def _deliver_settings(timeout=1.0):
+    """Wait for the bot's ack of the settings version just pushed over the control channel."""
+    version = bot_control.version
+    if not bot_control.connected:
+        return {"version": version, "channel": False, "acked": False}
+    ack = bot_control.wait_ack(version, timeout)
+    return {"version": version, "channel": True, "acked": bool(ack and ack["ok"]), "error": ack["error"] if ack else "no ack"}
+
+def _save_bot_settings(settings_data):
+    # Persist UI runtime selections separately for bots that poll the file instead of the control channel
+    runtime_keys = ["all_strategies", "selected_strategies", "killzone_map", "current_session"]
+    runtime_state_path = os.path.join("logs", "bot_runtime_settings.json")
+    os.makedirs(os.path.dirname(runtime_state_path), exist_ok=True)
     try:
-        with pipe:
-            for line in iter(pipe.readline, b''):
-                print(f"[{prefix}] {line.decode().strip()}")
-    except Exception as e:
-        print(f"Error in stream_output thread: {e}")
+        with open(runtime_state_path, "w") as f:
+            json.dump({k: settings_data.get(k) for k in runtime_keys if k in settings_data}, f, indent=2)
+    except Exception:
+        pass
+
+    # Merge persistent config as before
+    config_store.update(settings_data)
+
+# Socket to the bot: versioned settings pushed on every config change (acked back), bot status/metrics in
+bot_control = ControlServer(
+    on_status=lambda status: events.publish("bot_metrics", {"kind": "status", "data": status}),
+    on_metrics=lambda metrics: events.publish("bot_metrics", {"kind": "metrics", "data": metrics}),
+    on_event=lambda title, details: log_event("bot_control", title, details, "status"),
+)
+config_store.subscribe(lambda cfg: bot_control.publish_settings(cfg, etag=config_store.etag))
+
+# Parsed bot output, bounded and indexed (logs/bot_logs.db)
+bot_logs = BotLogStore()
+
+# Runs `python -m STOCKDATA`, restarting it with backoff if it crashes (or, with
+# bot_heartbeat_timeout set, goes silent after it has started heartbeating)
+_advanced = load_config().get('advanced_settings', {})
+bot_supervisor = BotSupervisor(
+    [sys.executable, "-m", "STOCKDATA"],
+    cwd=os.path.dirname(os.path.abspath(__file__)),
+    log_store=bot_logs,
+    restart=_advanced.get('bot_restart_policy', 'on-failure'),
+    heartbeat_timeout=_advanced.get('bot_heartbeat_timeout', 0),
+    symbols=load_config().get('symbols', []),
+    on_record=lambda record: events.publish("bot_log", record),
+    on_status=lambda status: events.publish("bot_status", status),
+    on_event=lambda event_type, title, details: log_event(event_type, title, details, "status"),
+    stop_request=lambda: bot_control.request_stop("stop requested from the API"),
+)
+config_store.subscribe(bot_supervisor.update_config)
+# Any control message counts as a heartbeat
+bot_control.on_heartbeat = bot_supervisor.beat
 
 def start_bot_process():
-    """Starts the bot as a subprocess and streams its output."""
-    global bot_process
-    if bot_process and bot_process.poll() is None:
-        print("Bot process is already running.")
-        return
-
+    """Starts the supervised bot process; False if it was already running."""
     print("Attempting to start the bot process...")
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    command = [sys.executable, "-m", "STOCKDATA"]
-    
-    env = os.environ.copy()
-    env["PYTHONUNBUFFERED"] = "1"
-
-    try:
-        # Use CREATE_NEW_PROCESS_GROUP on Windows to ensure the bot process can be terminated cleanly
-        creationflags = subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0
-        bot_process = subprocess.Popen(
-            command,
-            cwd=project_root,
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            creationflags=creationflags
-        )
-        print(f"Bot process started with PID: {bot_process.pid}")
-
-        # Start threads to stream stdout and stderr
-        threading.Thread(target=stream_output, args=(bot_process.stdout, 'BOT-STDOUT'), daemon=True).start()
-        threading.Thread(target=stream_output, args=(bot_process.stderr, 'BOT-STDERR'), daemon=True).start()
-
-        log_event("bot_control", "Bot Started", "Trading bot process initiated.", "status")
-
-    except Exception as e:
-        print(f"Failed to start bot process: {e}")
-        log_event("error", "Failed to Start Bot", f"Error starting bot process: {e}", "status")
+    started = bot_supervisor.start()
+    if not started:
+        print("Bot process is already running.")
+    return started
 
 @app.post("/api/bot/start")
-def start_bot():
+async def start_bot():
     """API endpoint to manually start the bot."""
     print("Received request to start bot...")
-    start_bot_process()
-    return {"success": True, "message": "Bot start initiated."}
+    try:
+        await run_io(start_bot_process)
+        return {"success": True, "message": "Bot start initiated.", "status": bot_status()}
+    except Exception as e:
+        log_event("error", "Failed to Start Bot", f"Error starting bot process: {e}", "status")
+        return JSONResponse(status_code=500, content={"success": False, "error": f"Failed to start bot: {e}"})
 
 @app.post("/api/bot/stop")
-def stop_bot():
-    global bot_process
-    if bot_process is None or bot_process.poll() is not None:
+async def stop_bot():
+    status = bot_status()
+    if not status["running"] and status["state"] != "backoff":
         return JSONResponse(status_code=400, content={"success": False, "error": "Bot is not running."})
     try:
-        # Terminate the process. On Windows, this will kill the process tree.
-        # For cross-platform, process.terminate() or process.kill() might be needed.
-        bot_process.terminate()
-        # Optional: wait for process to terminate
-        bot_process.wait(timeout=5) 
-        bot_process = None # Reset global variable
-        log_event("bot_control", "Bot Stopped", "Trading bot process terminated.", "status")
-        return {"success": True, "message": "Bot stopped successfully!"}
+        # Cancels a pending restart; a live bot gets a stop request on stdin, then SIGINT/CTRL_BREAK, then terminate, then kill
+        code = await run_io(bot_supervisor.stop)
+        return {"success": True, "message": "Bot stopped successfully!", "exit_code": code}
     except Exception as e:
         log_event("error", "Failed to Stop Bot", f"Error stopping bot process: {e}", "status")
         return JSONResponse(status_code=500, content={"success": False, "error": f"Failed to stop bot: {e}"})
 
 @app.get("/api/bot/status")
+async def get_bot_status():
+    return bot_status()
+
 def bot_status():
-    global bot_process
-    running = bot_process is not None and bot_process.poll() is None
-    return {"running": running}
+    return dict(bot_supervisor.status(), control_connected=bot_control.connected)
+
+@app.get("/api/bot/control")
+async def get_bot_control():
+    """Control channel state: connection, settings version pushed vs acked, ack latency, last bot status/metrics."""
+    return bot_control.status()
+
+@app.get("/api/bot/logs")
+async def get_bot_logs(level: str = None, symbol: str = None, since_id: int = None, before_id: int = None,
+                       search: str = None, run: int = None, limit: int = Query(200, ge=1, le=5000)):
+    """Newest-first parsed bot output; ``level`` is a minimum (WARNING includes ERROR and CRITICAL).
+    Page back with ``before_id`` or poll forward with ``since_id``."""
+    try:
+        records = await run_io(bot_logs.query, level=level, symbol=symbol, since_id=since_id,
+                               before_id=before_id, search=search, run=run, limit=limit)
+        return {"success": True, "data": records}
+    except Exception as e:
+        return JSONResponse(content={"success": False, "error": str(e)})
+
+@app.get("/api/bot/logs/stats")
+async def get_bot_log_stats():
+    return await run_io(bot_logs.stats)
 
 @app.post("/api/user/google")
-def save_google_user(user: GoogleUser):
+async def save_google_user(user: GoogleUser):
+    await run_io(_save_google_user, user)
+    return {"success": True}
+
+def _save_google_user(user):
     users_file = "users.json"
     users = []
     if os.path.exists(users_file):
@@ -482,76 +538,285 @@ def save_google_user(user: GoogleUser):
         users.append({"email": user.email, "name": user.name})
     with open(users_file, "w") as f:
         json.dump(users, f, indent=2)
-    return {"success": True}
 
 @app.get("/api/activity-log")
-def get_activity_log():
-    with activity_log_lock:
-        return list(reversed(activity_log))  # newest first
+async def get_activity_log(since: int = None, limit: int = Query(None, ge=1)):
+    """Newest-first events; ``since`` is the last event ``id`` the client already has."""
+    return activity_log.query(since=since, limit=limit)
 
 @app.get("/api/analytics/trade-stats")
-def api_trade_stats(symbol: str = Query(...), strategy: str = Query(...)):
+async def api_trade_stats(symbol: str = Query(...), strategy: str = Query(...)):
     try:
-        stats = get_trade_stats(symbol, strategy)
-        return JSONResponse(content={"success": True, "data": stats})
+        return await cached_analytics(
+            "trade-stats", lambda: {"success": True, "data": _trade_stats(symbol, strategy)},
+            symbol=symbol, strategy=strategy)
     except Exception as e:
         return JSONResponse(content={"success": False, "error": str(e)})
 
+def _trade_stats(symbol, strategy):
+    # Needs a buy/sell column in trades; otherwise fall back to the logger's own stats (same units)
+    try:
+        if trade_store.has_side_column():
+            return trade_store.trade_stats(symbol, strategy)
+    except Exception as e:
+        print(f"Trade stats query unavailable: {e}")
+    return get_trade_stats(symbol, strategy)
+
 @app.get("/api/analytics/pnl-by-day")
-def pnl_by_day(days: int = 14):
+async def pnl_by_day(days: int = 14):
     """Return daily P/L totals for the last N days."""
     try:
-        db_file = "trades/trades.db"
-        import sqlite3, datetime as dt
-        conn = sqlite3.connect(db_file)
-        c = conn.cursor()
-        since = (dt.datetime.utcnow() - dt.timedelta(days=days)).strftime("%Y-%m-%d")
-        c.execute("""
-            SELECT substr(entry_time,1,10) as d, COALESCE(SUM(CAST(profit as REAL)),0)
-            FROM trades
-            WHERE entry_time >= ?
-            GROUP BY d
-            ORDER BY d ASC
-        """, (since,))
-        rows = c.fetchall()
-        conn.close()
-        return {"success": True, "data": [{"date": d, "pnl": float(p)} for d, p in rows]}
+        return await cached_analytics("pnl-by-day", lambda: _pnl_by_day(days), days=days)
     except Exception as e:
         return JSONResponse(content={"success": False, "error": str(e)})
 
+def _pnl_by_day(days):
+    since = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+    rows = trade_store.pnl_by_day(since)
+    return {"success": True, "data": [{"date": d, "pnl": float(p)} for d, p in rows]}
+
 @app.get("/api/analytics/pnl-by-weekday")
-def pnl_by_weekday():
+async def pnl_by_weekday():
     """Return P/L aggregated by weekday (Mon..Sun)."""
     try:
-        db_file = "trades/trades.db"
-        import sqlite3
-        conn = sqlite3.connect(db_file)
-        c = conn.cursor()
-        c.execute("""
-            SELECT strftime('%w', entry_time) as wd, COALESCE(SUM(CAST(profit as REAL)),0) as pnl
-            FROM trades
-            GROUP BY wd
-            ORDER BY wd
-        """)
-        rows = c.fetchall()
-        conn.close()
-        # map 0..6 to Mon..Sun style labels
-        labels = ['Sun','Mon','Tue','Wed','Thu','Fri','Sat']
-        return {"success": True, "data": [{"weekday": labels[int(wd)], "pnl": float(p)} for wd, p in rows]}
+        return await cached_analytics("pnl-by-weekday", _pnl_by_weekday)
+    except Exception as e:
+        return JSONResponse(content={"success": False, "error": str(e)})
+
+def _pnl_by_weekday():
+    rows = trade_store.pnl_by_weekday()
+    # map 0..6 to Mon..Sun style labels
+    labels = ['Sun','Mon','Tue','Wed','Thu','Fri','Sat']
+    return {"success": True, "data": [{"weekday": labels[int(wd)], "pnl": float(p)} for wd, p in rows]}
+
+def _candle_records(symbol, timeframe, count, since):
+    """Read and convert stored bars (file I/O and a Python loop) on the I/O pool."""
+    series = candle_store.series(symbol, timeframe)
+    columns = series.since(since) if since is not None else series.tail(count)
+    return series.timeframe, to_records(columns)[-count:]
+
+@app.get("/api/candles/{symbol}")
+async def get_candles(symbol: str, timeframe: str = None, count: int = Query(200, ge=1, le=10000), since: int = None):
+    """Closed bars from the candle store, topped up from the terminal when a newer bar is due."""
+    try:
+        config = load_config()
+        # Only configured symbols and known timeframes map to store paths
+        if symbol not in config.get("symbols", []):
+            return JSONResponse(status_code=404, content={"success": False, "error": f"Unknown symbol: {symbol}"})
+        try:
+            timeframe = normalize_timeframe(timeframe or config.get("timeframe", "TIMEFRAME_M15"))
+        except ValueError as e:
+            return JSONResponse(status_code=404, content={"success": False, "error": str(e)})
+        synced = False
+        if mt5 is not None and await run_io(candle_store.needs_sync, symbol, timeframe):
+            mt5_config = config.get('mt5', {})
+            try:
+                session = mt5_sessions.register(mt5_config.get('login'), mt5_config.get('password'), mt5_config.get('server'))
+                await run_mt5(lambda mt5: candle_store.sync(mt5, symbol, timeframe), session=session, op="candles")
+                synced = True
+            except Exception as e:
+                print(f"Candle sync for {symbol} failed, serving stored bars: {e}")
+        resolved, candles = await run_io(_candle_records, symbol, timeframe, count, since)
+        return {"success": True, "symbol": symbol, "timeframe": resolved, "synced": synced, "candles": candles}
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"success": False, "error": str(e)})
+    except Exception as e:
+        return JSONResponse(content={"success": False, "error": str(e)})
+
+@app.get("/api/analytics/summary")
+async def analytics_summary(symbol: str = None, strategy: str = None, starting_balance: float = Query(0.0, ge=0)):
+    """Equity curve, drawdown, Sharpe/Sortino, expectancy, win rate by session/strategy and R-multiples."""
+    try:
+        return await cached_analytics(
+            "summary",
+            lambda: {"success": True, "data": analytics_engine.summary(symbol, strategy, starting_balance)},
+            symbol=symbol, strategy=strategy, starting_balance=starting_balance)
+    except Exception as e:
+        return JSONResponse(content={"success": False, "error": str(e)})
+
+@app.get("/api/risk/state")
+async def get_risk_state(day: str = None):
+    """Today's (or ``day``'s) trade counts, P&L and open slots, with what the risk limits still allow."""
+    try:
+        limits = load_config().get("risk_settings", {})
+        return {"success": True, "data": await run_io(risk_state.snapshot, day, limits)}
     except Exception as e:
         return JSONResponse(content={"success": False, "error": str(e)})
 
+# --- Copy trading ---
+# One fan-out at a time; its account workers stay logged in between dispatches
+copy_trader = None
+copy_reports = collections.deque(maxlen=50)
+
+class CopySignal(BaseModel):
+    symbol: str
+    side: str
+    sl: float
+    tp: float = None
+    price: float = None
+    comment: str = "copy"
+
+def _stop_copy_trader():
+    global copy_trader
+    trader, copy_trader = copy_trader, None
+    if trader is not None:
+        trader.close()
+
+@app.post("/api/copy/start")
+async def start_copy_trading():
+    """(Re)start the fan-out over the stored MT5 accounts that are logged in this session."""
+    global copy_trader
+    if mt5 is None:
+        return {"success": False, "error": "MetaTrader5 is not available in this deployment. This endpoint requires MT5 on Windows."}
+    try:
+        await run_io(_stop_copy_trader)
+        trader = CopyTrader.from_config(load_config(), [acc.dict() for acc in mt5_accounts],
+                                        mt5_sessions.password_for, log_event=log_event)
+        if not trader.accounts:
+            return JSONResponse(status_code=400, content={"success": False, "error": "No logged-in MT5 accounts to copy to."})
+        connected = await run_io(trader.start)
+        if not connected:
+            await run_io(trader.close)
+            return JSONResponse(status_code=502, content={"success": False, "error": "No copy account could log in.",
+                                                          "errors": trader.errors})
+        copy_trader = trader
+        log_event("trade", "Copy Trading Started", f"{len(connected)} accounts connected", "trade")
+        return {"success": True, "connected": sorted(connected), "errors": trader.errors}
+    except Exception as e:
+        log_event("error", "Failed to Start Copy Trading", str(e), "error")
+        return JSONResponse(status_code=500, content={"success": False, "error": f"Failed to start copy trading: {e}"})
+
+@app.post("/api/copy/dispatch")
+async def dispatch_copy_signal(signal: CopySignal):
+    """Size and send ``signal`` on every connected copy account; returns the per-account report."""
+    trader = copy_trader
+    if trader is None:
+        return JSONResponse(status_code=400, content={"success": False, "error": "Copy trading is not started."})
+    if signal.side not in ("buy", "sell"):
+        return JSONResponse(status_code=400, content={"success": False, "error": f"Invalid side: {signal.side}"})
+    try:
+        report = await run_io(trader.dispatch, signal.dict(exclude_none=True))
+    except Exception as e:
+        log_event("error", "Copy Dispatch Failed", str(e), "error")
+        return JSONResponse(status_code=500, content={"success": False, "error": f"Copy dispatch failed: {e}"})
+    copy_reports.append(report)
+    filled = sum(1 for r in report["accounts"].values() if r["status"] == "filled")
+    log_event("trade", "Copy Signal Dispatched",
+              f"{signal.side} {signal.symbol}: {filled}/{len(report['accounts'])} accounts filled", "trade")
+    return {"success": True, "report": report}
+
+@app.get("/api/copy/report")
+async def get_copy_report(limit: int = Query(10, ge=1, le=50)):
+    """Recent dispatch reports (newest first), plus late answers and orders still pending."""
+    trader = copy_trader
+    late = await run_io(trader.collect_late) if trader is not None else []
+    return {
+        "success": True,
+        "running": trader is not None,
+        "connected": sorted(trader.connected) if trader is not None else [],
+        "errors": dict(trader.errors) if trader is not None else {},
+        "pending": trader.pending() if trader is not None else {},
+        "late_results": late,
+        "reports": list(copy_reports)[-limit:][::-1],
+    }
+
+@app.post("/api/copy/stop")
+async def stop_copy_trading():
+    if copy_trader is None:
+        return JSONResponse(status_code=400, content={"success": False, "error": "Copy trading is not running."})
+    await run_io(_stop_copy_trader)
+    log_event("trade", "Copy Trading Stopped", "Copy account workers logged out", "trade")
+    return {"success": True}
+
+@app.get("/api/analytics/cache-stats")
+async def analytics_cache_stats():
+    return analytics_cache.stats()
+
+@app.get("/api/stream")
+async def event_stream(request: Request, topics: str = None):
+    """Server-Sent Events feed; ``topics`` is a comma list of activity, positions,
+    bot_status, bot_log, bot_metrics, accounts (default: all)."""
+    wanted = [t for t in (topics or "").split(",") if t in TOPICS] or list(TOPICS)
+    subscriber = events.subscribe(wanted)
+    # Initial state so clients can render before the first delta arrives
+    if "bot_status" in wanted:
+        subscriber.offer({"id": None, "topic": "bot_status", "data": bot_status()})
+    if "accounts" in wanted:
+        subscriber.offer({"id": None, "topic": "accounts", "data": [acc.dict() for acc in mt5_accounts]})
+    return StreamingResponse(
+        events.sse(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/stream/stats")
+async def event_stream_stats():
+    return events.stats()
+
+async def watch_state(interval=2.0):
+    """Publish open-position deltas while anyone listens (the bot supervisor pushes bot_status itself)."""
+    last_positions = {}
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if mt5 is None or not events.has_subscribers("positions"):
+                last_positions = {}
+                continue
+            mt5_config = load_config().get('mt5', {})
+            session = mt5_sessions.register(mt5_config.get('login'), mt5_config.get('password'), mt5_config.get('server'))
+            positions = await run_mt5(_fetch_positions, session=session, op="positions_watch")
+            current = {p["ticket"]: p for p in positions}
+            delta = diff_positions(last_positions, current)
+            if delta is not None:
+                events.publish("positions", delta)
+            last_positions = current
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in state watcher: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     print("Server started. Bot will not auto-start. Control it from the web UI.")
+    events.bind(asyncio.get_running_loop())
+    asyncio.get_running_loop().create_task(watch_state())
+    mt5_sessions.start()
+    config_store.start()
+    activity_log.start()
+    bot_logs.start()
+    try:
+        bot_control.start()
+        bot_control.publish_settings(config_store.get(), etag=config_store.etag)
+        bot_supervisor.env = dict(os.environ, **bot_control.child_env())
+    except OSError as e:
+        print(f"Bot control channel unavailable, settings reach the bot through files only: {e}")
+    try:
+        imported = await run_io(risk_state.migrate_legacy)
+        if any(imported.values()):
+            print(f"Imported legacy risk counters: {imported}")
+    except Exception as e:
+        print(f"Legacy risk counter import failed: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    config_store.stop()
+    await run_io(mt5_sessions.close)
+    await run_io(activity_log.close)
+    await run_io(trade_store.close)
+    await run_io(risk_state.close)
+    await run_io(bot_supervisor.close)
+    await run_io(bot_control.close)
+    await run_io(_stop_copy_trader)
+    await run_io(bot_logs.close)
+    io_executor.shutdown(wait=False)
 
 # Optional: endpoint to update an account snapshot (balance/equity) from UI
 @app.post("/api/mt5/update-account")
-def update_account_snapshot(acc: MT5Account):
+async def update_account_snapshot(acc: MT5Account):
     global mt5_accounts
     mt5_accounts = [a for a in mt5_accounts if a.login != acc.login or a.server != acc.server]
     mt5_accounts.append(acc)
-    save_mt5_accounts(mt5_accounts)
+    await run_io(save_mt5_accounts, mt5_accounts)
     log_event("connection", "MT5 Account Updated", f"Account ****{acc.login[-4:]} ({acc.server}) snapshot updated.", "connection")
     return {"success": True}
 
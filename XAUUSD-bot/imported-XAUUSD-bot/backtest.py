@@ -0,0 +1,431 @@
+"""Replay stored OHLC bars through strategy -> ML filter -> risk -> broker.
+
+Each symbol x strategy pair runs in its own process. A job walks the bars
+once: the simulated broker settles stop loss / take profit against the new
+bar, then the strategy sees the last ``candle_count`` bars (the same window
+the live bot fetches), the ML gate scores the setup against
+``strategy_filters.ml_filter_threshold`` (0.70 if unset) and the risk stage
+runs the live pre-trade checks (:mod:`pretrade_risk`) and daily limits
+before the order is filled. Default stops are 1.5 ATR, the ATR being the
+one :mod:`feature_engine` computes for the ML features.
+
+Strategies are looked up the way ``selected_strategies`` names them, in
+``STOCKDATA.strategies.<name>``; ``module:function`` selects any other
+callable. ``backtest:ema_cross`` is a small reference strategy for
+throughput runs.
+
+    python backtest.py --data data/ --symbols XAUUSD USDJPY --strategies judas_swing mmxm
+    python backtest.py --data candles/ --symbols XAUUSD --strategies backtest:ema_cross
+    python backtest.py --bars data/XAUUSD_M15.parquet --symbols XAUUSD --strategies backtest:ema_cross
+"""
+import argparse
+import csv
+import importlib
+import inspect
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+from candle_store import CandleSeries
+from feature_engine import batch_atr
+from ml_scorer import MLScorer
+from pretrade_risk import PreTradeRiskEngine
+
+CONFIG_FILE = "config.json"
+DEFAULT_ML_THRESHOLD = 0.70
+BAR_COLUMNS = ("time", "open", "high", "low", "close")
+
+
+def load_bars(path):
+    """OHLC bars from CSV, Parquet or a candle store series directory, sorted by ``time`` (epoch seconds)."""
+    if pd is None:
+        raise RuntimeError("pandas is required to load bars")
+    if os.path.isdir(path):
+        path = os.path.normpath(path)
+        symbol_dir, timeframe = os.path.split(path)
+        root, symbol = os.path.split(symbol_dir)
+        return pd.DataFrame(CandleSeries(root, symbol, timeframe).columns())
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    if "time" not in df.columns:
+        for alias in ("timestamp", "datetime", "date"):
+            if alias in df.columns:
+                df = df.rename(columns={alias: "time"})
+                break
+    missing = [c for c in BAR_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}")
+    if not pd.api.types.is_numeric_dtype(df["time"]):
+        df["time"] = pd.to_datetime(df["time"], utc=True).astype("int64") // 10**9
+    return df.sort_values("time").reset_index(drop=True)
+
+
+def find_bars(data_dir, symbol, timeframe):
+    """A candle store series ``<data_dir>/<SYMBOL>/<TF>/``, else ``<SYMBOL>_<TF>.parquet|csv`` or ``<SYMBOL>.parquet|csv``."""
+    tf = timeframe.replace("TIMEFRAME_", "")
+    series_dir = os.path.join(data_dir, symbol, tf)
+    if os.path.exists(os.path.join(series_dir, "meta.json")):
+        return series_dir
+    for name in (f"{symbol}_{tf}", symbol):
+        for ext in (".parquet", ".csv"):
+            path = os.path.join(data_dir, name + ext)
+            if os.path.exists(path):
+                return path
+    raise FileNotFoundError(f"No bars for {symbol} {tf} in {data_dir}")
+
+
+def resolve_strategy(name):
+    """Callable for a strategy name or ``module:function`` spec."""
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        module_name = f"STOCKDATA.strategies.{name}"
+    module = importlib.import_module(module_name)
+    for candidate in ([attr] if attr else ["generate_signal", "check_signal", name, "run"]):
+        func = getattr(module, candidate, None)
+        if callable(func):
+            return func
+    raise AttributeError(f"{module_name} has no strategy entry point")
+
+
+def normalize_signal(raw):
+    """Accept the shapes strategies return ('buy', {'signal': 'sell', 'sl': ...}) as one dict."""
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        raw = {"signal": raw}
+    side = raw.get("signal") or raw.get("action") or raw.get("direction") or raw.get("type")
+    side = {"long": "buy", "short": "sell", "bullish": "buy", "bearish": "sell"}.get(str(side).lower(), str(side).lower())
+    if side not in ("buy", "sell"):
+        return None
+    return {"side": side, "sl": raw.get("sl") or raw.get("stop_loss"), "tp": raw.get("tp") or raw.get("take_profit"),
+            "features": raw.get("features")}
+
+
+def ema_cross(df, symbol=None, fast=9, slow=21):
+    """Reference strategy: trade the bar where the fast EMA crosses the slow EMA."""
+    close = df["close"]
+    fast_ema = close.ewm(span=fast, adjust=False).mean()
+    slow_ema = close.ewm(span=slow, adjust=False).mean()
+    diff_now = fast_ema.iat[-1] - slow_ema.iat[-1]
+    diff_prev = fast_ema.iat[-2] - slow_ema.iat[-2]
+    if diff_prev <= 0 < diff_now:
+        return "buy"
+    if diff_prev >= 0 > diff_now:
+        return "sell"
+    return None
+
+
+class MLGate:
+    """``predict_proba`` gate; setups without features (or without a model) pass unscored."""
+
+    def __init__(self, model_path, threshold):
+        self.threshold = threshold
+        self.scorer = None
+        self.scored = 0
+        self.rejected = 0
+        if model_path and os.path.exists(model_path):
+            self.scorer = MLScorer(model_path, threshold, poll_interval=float("inf"))
+
+    def allow(self, signal):
+        if self.scorer is None or signal["features"] is None:
+            return True
+        self.scored += 1
+        if self.scorer.score([signal["features"]])[0] < self.threshold:
+            self.rejected += 1
+            return False
+        return True
+
+
+class RiskStage:
+    """The live risk checks and lot sizing, run against the simulated book.
+
+    The per-order rules are :class:`pretrade_risk.PreTradeRiskEngine`,
+    compiled from the same ``risk_settings`` / ``advanced_settings`` as the
+    bot; the daily trade count and P&L limits are the ones
+    :meth:`risk_state.RiskStateStore.reserve_trade` applies, counted on the
+    broker's simulated day instead of the shared database.
+    """
+
+    def __init__(self, config, symbol, contract_size, point=0.01, spread=0.0):
+        settings = config.get("risk_settings") or {}
+        self.engine = PreTradeRiskEngine(config)
+        # One lot gains or loses contract_size per price unit
+        self.engine.set_symbol(symbol, point, contract_size, 1.0)
+        self.symbol = symbol
+        self.spread_points = spread / point if point else 0.0
+        self.risk_per_trade = float(settings.get("risk_per_trade", 1.0)) / 100.0
+        self.max_daily_trades = _limit(settings.get("max_daily_trades"))
+        self.max_daily_loss = _limit(settings.get("max_daily_loss"))
+        self.max_daily_profit = _limit(settings.get("max_daily_profit"))
+        self.default_lot = float(settings.get("default_lot_size", 0.1))
+        self.contract_size = contract_size
+        self.rejections = {}
+
+    def check(self, broker, side, signal_price, sl, volume, now):
+        """True if an order passes every rule; failures are counted in ``rejections``."""
+        reasons = []
+        if self.max_daily_trades is not None and broker.day_trades >= self.max_daily_trades:
+            reasons.append("max_daily_trades")
+        if self.max_daily_loss and broker.day_pnl <= -self.max_daily_loss:
+            reasons.append("max_daily_loss")
+        if self.max_daily_profit and broker.day_pnl >= self.max_daily_profit:
+            reasons.append("max_daily_profit")
+        result = self.engine.check(self.symbol, side, volume, broker.fill_price(side, signal_price), sl,
+                                   broker.balance, spread_points=self.spread_points, signal_price=signal_price,
+                                   now=now)
+        reasons.extend(r["rule"] for r in result["reasons"])
+        for rule in reasons:
+            self.rejections[rule] = self.rejections.get(rule, 0) + 1
+        return not reasons
+
+    def lot_size(self, equity, entry, sl):
+        distance = abs(entry - sl)
+        if distance <= 0:
+            return self.default_lot
+        return max(0.01, round(equity * self.risk_per_trade / (distance * self.contract_size), 2))
+
+    def opened(self, broker, ticket, side, volume, entry, sl):
+        self.engine.open_position(ticket, self.symbol, side, volume, entry, sl, broker.balance)
+
+    def closed(self, ticket, profit, ts):
+        self.engine.close_position(ticket, profit, now=ts)
+
+    def skip(self, reason):
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+
+def _limit(value):
+    """A ``risk_settings`` limit as ``risk_state`` reads it: a number, or None when unset."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SimBroker:
+    """Fills at the signal bar's close plus spread/slippage; SL checked before TP within a bar."""
+
+    def __init__(self, balance, contract_size, spread=0.0, slippage=0.0, on_close=None):
+        self.balance = balance
+        self.contract_size = contract_size
+        self.spread = spread
+        self.slippage = slippage
+        self.on_close = on_close
+        self.tickets = 0
+        self.positions = []
+        self.trades = []
+        self.day = None
+        self.day_pnl = 0.0
+        self.day_trades = 0
+        self.peak = balance
+        self.max_drawdown = 0.0
+
+    def on_bar(self, ts, high, low, close):
+        day = ts // 86400
+        if day != self.day:
+            self.day, self.day_pnl, self.day_trades = day, 0.0, 0
+        still_open = []
+        for p in self.positions:
+            if p["side"] == "buy":
+                exit_price = p["sl"] if low <= p["sl"] else p["tp"] if high >= p["tp"] else None
+            else:
+                exit_price = p["sl"] if high >= p["sl"] else p["tp"] if low <= p["tp"] else None
+            if exit_price is None:
+                still_open.append(p)
+            else:
+                self._close(p, ts, exit_price)
+        self.positions = still_open
+
+    def fill_price(self, side, price):
+        cost = self.spread / 2.0 + self.slippage
+        return price + cost if side == "buy" else price - cost
+
+    def open(self, ts, side, price, sl, tp, volume):
+        """Fill an order; returns ``(ticket, entry price)``."""
+        self.tickets += 1
+        entry = self.fill_price(side, price)
+        self.positions.append({"ticket": self.tickets, "side": side, "entry": entry, "sl": sl, "tp": tp,
+                               "volume": volume, "open_time": ts})
+        self.day_trades += 1
+        return self.tickets, entry
+
+    def close_all(self, ts, price):
+        for p in self.positions:
+            self._close(p, ts, price)
+        self.positions = []
+
+    def _close(self, p, ts, price):
+        direction = 1.0 if p["side"] == "buy" else -1.0
+        profit = (price - p["entry"]) * direction * p["volume"] * self.contract_size
+        self.balance += profit
+        self.day_pnl += profit
+        self.peak = max(self.peak, self.balance)
+        self.max_drawdown = min(self.max_drawdown, self.balance - self.peak)
+        if self.on_close is not None:
+            self.on_close(p["ticket"], profit, ts)
+        self.trades.append({"side": p["side"], "entry_time": p["open_time"], "exit_time": ts, "entry": p["entry"],
+                            "exit": price, "volume": p["volume"], "profit": round(profit, 2)})
+
+
+def run_job(job):
+    """Backtest one symbol x strategy; runs inside a worker process."""
+    df = load_bars(job["bars"])
+    strategy = resolve_strategy(job["strategy"])
+    takes_symbol = len(inspect.signature(strategy).parameters) > 1
+    gate = MLGate(job["ml_model_path"], job["ml_threshold"])
+    risk = RiskStage(job["risk_config"], job["symbol"], job["contract_size"], job["point"], job["spread"])
+    broker = SimBroker(job["balance"], job["contract_size"], job["spread"], job["slippage"], on_close=risk.closed)
+    window = job["candle_count"]
+    ts, high, low, close = (df[c].to_numpy() for c in ("time", "high", "low", "close"))
+    atr = batch_atr(high, low, close)
+    signals = 0
+
+    started = time.perf_counter()
+    for i in range(len(df)):
+        broker.on_bar(int(ts[i]), high[i], low[i], close[i])
+        if i + 1 < window:
+            continue
+        bars = df.iloc[i + 1 - window:i + 1]
+        signal = normalize_signal(strategy(bars, job["symbol"]) if takes_symbol else strategy(bars))
+        if signal is None:
+            continue
+        signals += 1
+        if not gate.allow(signal):
+            continue
+        price = float(close[i])
+        direction = 1.0 if signal["side"] == "buy" else -1.0
+        if not signal["sl"] and math.isnan(atr[i]):
+            risk.skip("atr_warmup")  # no stop to size against until the ATR has its first value
+            continue
+        sl = float(signal["sl"]) if signal["sl"] else price - direction * 1.5 * atr[i]
+        tp = float(signal["tp"]) if signal["tp"] else price + direction * 2.0 * abs(price - sl)
+        volume = risk.lot_size(broker.balance, price, sl)
+        if not risk.check(broker, signal["side"], price, sl, volume, int(ts[i])):
+            continue
+        ticket, entry = broker.open(int(ts[i]), signal["side"], price, sl, tp, volume)
+        risk.opened(broker, ticket, signal["side"], volume, entry, sl)
+    if len(df):
+        broker.close_all(int(ts[-1]), float(close[-1]))
+    elapsed = time.perf_counter() - started
+
+    wins = sum(1 for t in broker.trades if t["profit"] > 0)
+    result = {
+        "symbol": job["symbol"],
+        "strategy": job["strategy"],
+        "bars": len(df),
+        "seconds": round(elapsed, 3),
+        "bars_per_sec": round(len(df) / elapsed, 1) if elapsed > 0 else None,
+        "signals": signals,
+        "ml_scored": gate.scored,
+        "ml_rejected": gate.rejected,
+        "risk_rejections": risk.rejections,
+        "trades": len(broker.trades),
+        "win_rate": round(100.0 * wins / len(broker.trades), 2) if broker.trades else 0.0,
+        "net_pnl": round(broker.balance - job["balance"], 2),
+        "max_drawdown": round(broker.max_drawdown, 2),
+    }
+    if job.get("out_dir"):
+        name = f"{job['symbol']}_{job['strategy'].replace(':', '_')}.csv"
+        with open(os.path.join(job["out_dir"], name), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["side", "entry_time", "exit_time", "entry", "exit", "volume", "profit"])
+            writer.writeheader()
+            writer.writerows(broker.trades)
+    return result
+
+
+def ml_threshold(config):
+    """``strategy_filters.ml_filter_threshold``, 0.70 when the config does not set one."""
+    value = (config.get("strategy_filters") or {}).get("ml_filter_threshold")
+    return DEFAULT_ML_THRESHOLD if value is None else float(value)
+
+
+def risk_stage_config(config):
+    """The config sections :class:`RiskStage` reads, small enough to ship to worker processes."""
+    return {key: config.get(key) or {} for key in ("risk_settings", "advanced_settings", "risk")}
+
+
+def build_jobs(args, config):
+    risk_config = risk_stage_config(config)
+    jobs = []
+    for symbol in args.symbols or config.get("symbols", []):
+        bars = args.bars or find_bars(args.data, symbol, args.timeframe or config.get("timeframe", "TIMEFRAME_M15"))
+        for strategy in args.strategies or config.get("selected_strategies", []):
+            jobs.append({
+                "symbol": symbol,
+                "strategy": strategy,
+                "bars": bars,
+                "candle_count": args.candle_count or int(config.get("candle_count", 50)),
+                "ml_model_path": args.ml_model or config.get("advanced_settings", {}).get("ml_model_path"),
+                "ml_threshold": ml_threshold(config),
+                "risk_config": risk_config,
+                "balance": args.balance,
+                "contract_size": args.contract_size,
+                "point": args.point,
+                "spread": args.spread,
+                "slippage": args.slippage,
+                "out_dir": args.out,
+            })
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data", help="candle store root or directory of <SYMBOL>_<TF>.parquet|csv files")
+    parser.add_argument("--bars", help="single bars file used for every symbol")
+    parser.add_argument("--symbols", nargs="+", help="default: config symbols")
+    parser.add_argument("--strategies", nargs="+", help="default: config selected_strategies")
+    parser.add_argument("--timeframe", help="default: config timeframe")
+    parser.add_argument("--candle-count", type=int, help="strategy window; default: config candle_count")
+    parser.add_argument("--ml-model", help="default: advanced_settings.ml_model_path")
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--contract-size", type=float, default=100.0, help="P&L per 1.0 lot per price unit")
+    parser.add_argument("--point", type=float, default=0.01, help="price units per point (max_spread / max_slippage)")
+    parser.add_argument("--spread", type=float, default=0.0, help="in price units")
+    parser.add_argument("--slippage", type=float, default=0.0, help="in price units")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", help="directory for per-job trade CSVs")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    jobs = build_jobs(args, config)
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs) or 1))) as pool:
+        futures = {pool.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Backtest {job['symbol']} {job['strategy']} failed: {e}")
+    wall = time.perf_counter() - started
+    total_bars = sum(r["bars"] for r in results)
+
+    if args.json:
+        print(json.dumps({"results": results, "wall_seconds": round(wall, 3),
+                          "bars_per_sec": round(total_bars / wall, 1) if wall > 0 else None}, indent=2))
+        return
+    print(f"{'symbol':<10}{'strategy':<22}{'bars':>9}{'bars/s':>11}{'trades':>8}{'win%':>8}{'net':>12}{'max dd':>11}")
+    for r in sorted(results, key=lambda r: (r["symbol"], r["strategy"])):
+        print(f"{r['symbol']:<10}{r['strategy']:<22}{r['bars']:>9}{r['bars_per_sec'] or 0:>11}{r['trades']:>8}"
+              f"{r['win_rate']:>8}{r['net_pnl']:>12}{r['max_drawdown']:>11}")
+    print(f"{len(results)} jobs, {total_bars} bars in {wall:.2f}s: {total_bars / wall if wall > 0 else 0:.0f} bars/s overall")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""Local control channel between the API server and the bot process.
+
+The API server runs a :class:`ControlServer` on a Unix domain socket
+(``logs/bot_control.sock``, mode 0600) or, where there are no Unix sockets
+(Windows), on ``127.0.0.1`` with an ephemeral port. The supervised bot finds
+it through ``BOT_CONTROL_ADDRESS`` / ``BOT_CONTROL_TOKEN`` in its environment
+and connects with :class:`ControlClient`, reconnecting with backoff.
+
+Messages are newline-delimited JSON objects with a ``type``:
+
+- bot -> server: ``hello`` (token, pid, the settings ``epoch``/``version`` it
+  already has), ``ack`` (``version``, ``ok``, ``error``), ``status``,
+  ``metrics`` and ``heartbeat``;
+- server -> bot: ``welcome``, ``settings`` (``epoch``, ``version``,
+  ``settings``), ``stop`` and ``error``.
+
+Every config change is pushed as a new settings version the moment it is
+saved, and again on (re)connect if the bot's copy is older; the bot applies
+it and acks, so the API can tell the UI the change is live. Pushes go out in
+version order, and the bot ignores a version of the current epoch that is
+not newer than the one it has.
+``logs/bot_runtime_settings.json`` is still written for bots that poll it.
+
+    python bot_ipc.py --bench     # push/ack round trips over the local socket
+"""
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+CONTROL_SOCKET_FILE = os.path.join("logs", "bot_control.sock")
+ENV_ADDRESS = "BOT_CONTROL_ADDRESS"
+ENV_TOKEN = "BOT_CONTROL_TOKEN"
+PROTOCOL_VERSION = 1
+MAX_LINE = 1 << 20
+
+
+def default_address(path=CONTROL_SOCKET_FILE):
+    if hasattr(socket, "AF_UNIX") and sys.platform != "win32":
+        return "unix:" + os.path.abspath(path)
+    return "tcp:127.0.0.1:0"
+
+
+def _parse_address(address):
+    kind, _, target = address.partition(":")
+    if kind == "unix":
+        return socket.AF_UNIX, target
+    if kind == "tcp":
+        host, _, port = target.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(f"bad control address {address!r} (expected unix:PATH or tcp:HOST:PORT)")
+
+
+def _encode(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connected_at = time.time()
+        self.last_seen = self.connected_at
+
+    def send(self, message):
+        data = _encode(message)
+        with self.lock:
+            self.sock.sendall(data)
+
+    def read(self):
+        line = self.reader.readline(MAX_LINE + 1)
+        if not line:
+            return None
+        if len(line) > MAX_LINE:
+            raise ValueError("control message too long")
+        message = json.loads(line)
+        if not isinstance(message, dict):
+            raise ValueError("control message is not an object")
+        return message
+
+    def close(self):
+        # shutdown first: it wakes a thread blocked in readline, which holds the reader lock
+        for closer in (lambda: self.sock.shutdown(socket.SHUT_RDWR), self.reader.close, self.sock.close):
+            try:
+                closer()
+            except OSError:
+                pass
+
+
+class ControlServer:
+    def __init__(self, address=None, token=None, on_status=None, on_metrics=None, on_heartbeat=None, on_event=None):
+        self.address = address or default_address()
+        self.token = token or secrets.token_hex(16)
+        self.on_status = on_status
+        self.on_metrics = on_metrics
+        self.on_heartbeat = on_heartbeat
+        self.on_event = on_event
+        self.epoch = secrets.token_hex(4)  # tells a reconnecting bot whether versions are comparable
+        self.version = 0
+        self.acked_version = 0
+        self.last_ack = None
+        self.last_status = None
+        self.last_metrics = None
+        self.pushes = 0
+        self._settings = None
+        self._etag = None
+        self._sent_at = {}
+        self._rtts = deque(maxlen=256)
+        self._clients = []
+        self._lock = threading.Lock()
+        self._acked = threading.Condition(self._lock)
+        self._publish_lock = threading.Lock()  # orders settings sends; never taken while holding _lock
+        self._listener = None
+        self._thread = None
+        self._closed = threading.Event()
+
+    def start(self):
+        family, target = _parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            if os.path.exists(target):
+                os.remove(target)  # left behind by a server that did not shut down
+            sock.bind(target)
+            os.chmod(target, 0o600)
+        else:
+            sock.bind(target)
+            self.address = "tcp:%s:%d" % sock.getsockname()[:2]
+        sock.listen(4)
+        self._listener = sock
+        self._thread = threading.Thread(target=self._accept, name="bot-control", daemon=True)
+        self._thread.start()
+        return self.address
+
+    def child_env(self):
+        """Environment for the bot process so its :class:`ControlClient` can find and authenticate to us."""
+        return {ENV_ADDRESS: self.address, ENV_TOKEN: self.token}
+
+    # --- server -> bot ---
+
+    def publish_settings(self, settings, etag=None):
+        """Push ``settings`` to the connected bot as a new version; returns that version (unchanged ``etag`` is a no-op)."""
+        # Held across the send so versions leave in the order they were numbered
+        with self._publish_lock:
+            with self._lock:
+                if etag is not None and etag == self._etag:
+                    return self.version
+                self.version += 1
+                self._settings = settings
+                self._etag = etag
+                message = self._settings_message()
+                clients = list(self._clients)
+            for conn in clients:
+                self._send(conn, message)
+        return message["version"]
+
+    def wait_ack(self, version, timeout=1.0):
+        """The ack for ``version`` (or a later one) once the bot sends it; None if no bot acked in time."""
+        with self._acked:
+            if not self._acked.wait_for(lambda: self.acked_version >= version, timeout):
+                return None
+            return self.last_ack
+
+    def request_stop(self, reason="stop requested"):
+        """Ask the bot to shut down cleanly; False if no bot is connected to ask."""
+        with self._lock:
+            clients = list(self._clients)
+        return any([self._send(conn, {"type": "stop", "reason": reason}) for conn in clients])
+
+    @property
+    def connected(self):
+        return bool(self._clients)
+
+    def status(self):
+        with self._lock:
+            now = time.time()
+            rtts = sorted(self._rtts)
+            return {
+                "address": self.address,
+                "connected": bool(self._clients),
+                "clients": [{"pid": c.pid, "connected_for": round(now - c.connected_at, 1),
+                             "last_seen_age": round(now - c.last_seen, 1)} for c in self._clients],
+                "settings_version": self.version,
+                "acked_version": self.acked_version,
+                "last_ack": self.last_ack,
+                "pushes": self.pushes,
+                "ack_ms_p50": round(rtts[len(rtts) // 2], 3) if rtts else None,
+                "ack_ms_max": round(rtts[-1], 3) if rtts else None,
+                "bot_status": self.last_status,
+                "bot_metrics": self.last_metrics,
+            }
+
+    def close(self):
+        self._closed.set()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except OSError:
+                pass
+            family, target = _parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(target):
+                os.remove(target)
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for conn in clients:
+            conn.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    # --- internals ---
+
+    def _settings_message(self):
+        self._sent_at[self.version] = time.perf_counter()
+        while len(self._sent_at) > 64:
+            self._sent_at.pop(next(iter(self._sent_at)))
+        return {"type": "settings", "epoch": self.epoch, "version": self.version, "settings": self._settings}
+
+    def _send(self, conn, message):
+        try:
+            conn.send(message)
+            if message["type"] == "settings":
+                self.pushes += 1
+            return True
+        except OSError:
+            self._drop(conn)
+            return False
+
+    def _drop(self, conn):
+        with self._lock:
+            if conn not in self._clients:
+                return
+            self._clients.remove(conn)
+        conn.close()
+        self._event("Bot Control Disconnected", f"Bot process {conn.pid} left the control channel.")
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                if self._closed.is_set():
+                    return
+                time.sleep(0.1)
+                continue
+            if sock.family != getattr(socket, "AF_UNIX", None):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(_Connection(sock),), name="bot-control-conn", daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            hello = conn.read()
+            if (not hello or hello.get("type") != "hello"
+                    or not hmac.compare_digest(str(hello.get("token", "")), self.token)):
+                conn.send({"type": "error", "error": "authentication failed"})
+                conn.close()
+                return
+            conn.pid = hello.get("pid")
+            conn.send({"type": "welcome", "protocol": PROTOCOL_VERSION, "epoch": self.epoch, "version": self.version})
+            with self._publish_lock:
+                with self._lock:
+                    self._clients.append(conn)
+                    stale = self._settings is not None and (hello.get("epoch"), hello.get("version")) != (self.epoch, self.version)
+                    message = self._settings_message() if stale else None
+                if message is not None:
+                    self._send(conn, message)
+            self._event("Bot Control Connected", f"Bot process {conn.pid} joined the control channel.")
+            while not self._closed.is_set():
+                message = conn.read()
+                if message is None:
+                    break
+                self._handle(conn, message)
+        except (OSError, ValueError) as e:
+            if not self._closed.is_set():
+                print(f"Bot control connection error: {e}")
+        finally:
+            self._drop(conn)
+
+    def _handle(self, conn, message):
+        conn.last_seen = time.time()
+        if self.on_heartbeat is not None:
+            self.on_heartbeat()
+        kind = message.get("type")
+        if kind == "ack":
+            version = int(message.get("version") or 0)
+            with self._acked:
+                sent = self._sent_at.pop(version, None)
+                if sent is not None:
+                    self._rtts.append((time.perf_counter() - sent) * 1000.0)
+                if message.get("epoch", self.epoch) == self.epoch and version >= self.acked_version:
+                    self.acked_version = version
+                    self.last_ack = {"version": version, "ok": bool(message.get("ok", True)),
+                                     "error": message.get("error"), "at": conn.last_seen}
+                self._acked.notify_all()
+            if not message.get("ok", True):
+                self._event("Bot Rejected Settings", f"Settings version {version}: {message.get('error')}")
+        elif kind == "status":
+            self.last_status = message.get("status")
+            if self.on_status is not None:
+                self.on_status(self.last_status)
+        elif kind == "metrics":
+            self.last_metrics = message.get("metrics")
+            if self.on_metrics is not None:
+                self.on_metrics(self.last_metrics)
+
+    def _event(self, title, details):
+        if self.on_event is not None:
+            try:
+                self.on_event(title, details)
+            except Exception as e:
+                print(f"Error recording bot control event: {e}")
+
+
+class ControlClient:
+    """Bot side: applies pushed settings through ``on_settings(settings, version)`` and acks them.
+
+    ``on_settings`` raising rejects the version (the ack carries the error);
+    ``on_stop(reason)`` is called when the server asks for a clean shutdown.
+    """
+
+    def __init__(self, address=None, token=None, on_settings=None, on_stop=None, reconnect_max=5.0):
+        self.address = address or os.environ.get(ENV_ADDRESS)
+        self.token = token or os.environ.get(ENV_TOKEN, "")
+        self.on_settings = on_settings
+        self.on_stop = on_stop
+        self.reconnect_max = reconnect_max
+        self.epoch = None
+        self.settings_version = 0
+        self.settings = None
+        self._conn = None
+        self._closed = threading.Event()
+        self.connected = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.address)
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bot-control-client", daemon=True)
+            self._thread.start()
+        return self
+
+    def send_status(self, status):
+        return self._send({"type": "status", "status": status})
+
+    def send_metrics(self, metrics):
+        return self._send({"type": "metrics", "metrics": metrics})
+
+    def heartbeat(self):
+        return self._send({"type": "heartbeat"})
+
+    def close(self):
+        self._closed.set()
+        conn = self._conn
+        if conn is not None:
+            conn.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _send(self, message):
+        conn = self._conn
+        if conn is None:
+            return False
+        try:
+            conn.send(message)
+            return True
+        except OSError:
+            return False
+
+    def _run(self):
+        delay = 0.1
+        while not self._closed.is_set():
+            try:
+                self._session()
+                delay = 0.1
+            except (OSError, ValueError) as e:
+                if self._closed.is_set():
+                    return
+                print(f"Bot control channel unavailable ({e}); retrying in {delay:.1f}s")
+            self._closed.wait(delay)
+            delay = min(self.reconnect_max, delay * 2)
+
+    def _session(self):
+        family, target = _parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        if family != getattr(socket, "AF_UNIX", None):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _Connection(sock)
+        try:
+            conn.send({"type": "hello", "protocol": PROTOCOL_VERSION, "token": self.token, "pid": os.getpid(),
+                       "epoch": self.epoch, "version": self.settings_version})
+            welcome = conn.read()
+            if not welcome or welcome.get("type") != "welcome":
+                raise ValueError((welcome or {}).get("error", "no welcome from control server"))
+            self._conn = conn
+            self.connected.set()
+            while not self._closed.is_set():
+                message = conn.read()
+                if message is None:
+                    return
+                if message.get("type") == "settings":
+                    self._apply(conn, message)
+                elif message.get("type") == "stop" and self.on_stop is not None:
+                    self.on_stop(message.get("reason"))
+        finally:
+            self.connected.clear()
+            self._conn = None
+            conn.close()
+
+    def _apply(self, conn, message):
+        version = message.get("version")
+        if (self.epoch is not None and message.get("epoch") == self.epoch
+                and isinstance(version, int) and version <= self.settings_version):
+            return  # overtaken by a newer version of the same epoch; that one was acked already
+        ok, error = True, None
+        try:
+            if self.on_settings is not None:
+                self.on_settings(message.get("settings"), version)
+            self.epoch, self.settings_version, self.settings = message.get("epoch"), version, message.get("settings")
+        except Exception as e:
+            ok, error = False, str(e)
+        conn.send({"type": "ack", "epoch": message.get("epoch"), "version": version, "ok": ok, "error": error})
+
+
+def bench(rounds=2000, address=None):
+    workdir = tempfile.mkdtemp(prefix="bot-control-")
+    server = ControlServer(address or default_address(os.path.join(workdir, "control.sock")))
+    server.start()
+    applied = []
+    stops = []
+    client = ControlClient(server.address, server.token, on_settings=lambda s, v: applied.append(v),
+                           on_stop=stops.append).start()
+    client.connected.wait(5)
+    rtts = []
+    for n in range(rounds):
+        t0 = time.perf_counter()
+        version = server.publish_settings({"selected_strategies": ["ema_cross"], "n": n})
+        ack = server.wait_ack(version, timeout=2.0)
+        rtts.append((time.perf_counter() - t0) * 1000.0)
+        if ack is None or ack["version"] != version:
+            print(f"no ack for version {version}")
+            return False
+    rtts.sort()
+    print(f"{server.address.split(':')[0]} socket, {rounds} settings pushes: ack p50 {rtts[len(rtts) // 2]:.3f} ms, "
+          f"p99 {rtts[int(len(rtts) * 0.99)]:.3f} ms, max {rtts[-1]:.3f} ms")
+
+    client.send_status({"state": "scanning", "symbols": 9})
+    client.send_metrics({"cycle_ms": 412.0, "open_positions": 2})
+    # Reconnect after a missed update gets the latest version straight away
+    client.close()
+    latest = server.publish_settings({"selected_strategies": ["breakout"]})
+    client = ControlClient(server.address, server.token, on_settings=lambda s, v: applied.append(v),
+                           on_stop=stops.append).start()
+    caught_up = server.wait_ack(latest, timeout=2.0) is not None
+    stopped = server.request_stop("bench") and _wait(lambda: stops == ["bench"])
+    intruder = ControlClient(server.address, "wrong-token").start()
+    time.sleep(0.2)
+    rejected = not intruder.connected.is_set()
+    status = server.status()
+    intruder.close()
+    client.close()
+    server.close()
+    print(f"reconnect caught up: {caught_up}, stop delivered: {stopped}, bad token rejected: {rejected}, "
+          f"status/metrics seen: {status['bot_status'] is not None and status['bot_metrics'] is not None}")
+    return caught_up and stopped and rejected and status["bot_metrics"] is not None
+
+
+def _wait(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot control channel benchmark and self-check.")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--tcp", action="store_true", help="use localhost TCP instead of a Unix socket")
+    args = parser.parse_args()
+    if not args.bench:
+        parser.print_help()
+        return
+    ok = bench(args.rounds, "tcp:127.0.0.1:0" if args.tcp else None)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,684 @@
+"""Supervised bot subprocess with a structured, bounded log.
+
+:class:`BotSupervisor` owns the ``python -m STOCKDATA`` child process:
+
+- restart policy ``always`` / ``on-failure`` / ``never``, with exponential
+  backoff (``backoff_initial`` doubling up to ``backoff_max``; a run that
+  stayed up ``stable_seconds`` resets it) and a circuit breaker that gives
+  up (state ``failed``) after ``max_restarts`` within ``restart_window``;
+- liveness (opt-in): with ``heartbeat_timeout`` set, a run that has sent at
+  least one explicit heartbeat (a ``HEARTBEAT`` line, a ``{"event":
+  "heartbeat"}`` record or a control-channel message, see :meth:`beat`) and
+  then stays silent for that many seconds is treated as hung and restarted.
+  Any output line resets the clock. A bot that never heartbeats is never
+  killed for being quiet;
+- graceful shutdown: ``stop_request()`` (the control channel, see
+  :mod:`bot_ipc`) or else a ``{"cmd": "stop"}`` line on the child's stdin, then
+  SIGINT (CTRL_BREAK_EVENT on Windows, hence the new process group), then
+  terminate, then kill, each step waiting part of ``stop_timeout``.
+
+Every output line is parsed by :func:`parse_line` (JSON records, Python
+``logging`` lines, ``[LEVEL]`` prefixes, plain prints) into a record with
+level, symbol, stream, pid and run number, and appended to
+:class:`BotLogStore`: a SQLite table in ``logs/bot_logs.db`` indexed by
+level, symbol and time, trimmed to the newest ``max_rows``. Records are
+written in batches by a background thread, so reading the pipes never
+waits on disk.
+
+    python bot_supervisor.py --demo     # crashing child: backoff, restarts, log queries
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+BOT_LOG_DB_FILE = os.path.join("logs", "bot_logs.db")
+
+RESTART_POLICIES = ("always", "on-failure", "never")
+
+STOP_REQUEST = b'{"cmd": "stop"}\n'
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "WARN": 30, "ERROR": 40, "CRITICAL": 50, "FATAL": 50}
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS bot_logs (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        level INTEGER NOT NULL,
+        symbol TEXT,
+        stream TEXT NOT NULL,
+        pid INTEGER,
+        run INTEGER,
+        message TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_bot_logs_level ON bot_logs (level, id)",
+    "CREATE INDEX IF NOT EXISTS idx_bot_logs_symbol ON bot_logs (symbol, id)",
+    "CREATE INDEX IF NOT EXISTS idx_bot_logs_ts ON bot_logs (ts)",
+]
+
+INSERT_SQL = "INSERT OR REPLACE INTO bot_logs (id, ts, level, symbol, stream, pid, run, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+# "2025-01-02 10:00:00,123 - STOCKDATA.bot - WARNING - msg", "[ERROR] msg", "INFO: msg", "WARNING msg"
+_LOGGING_RE = re.compile(
+    r"^(?:\d{4}-\d{2}-\d{2}[ T][\d:.,]+\s*[-|]?\s*)?"
+    r"(?:[\w.]+\s*[-|:]\s*)?"
+    r"\[?(?P<level>DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL|FATAL)\b\]?\s*[-:|]?\s*(?P<message>.*)$")
+_SYMBOL_FIELD_RE = re.compile(r"\bsymbol[=:]\s*['\"]?(?P<symbol>[A-Za-z0-9._]+)")
+_ERROR_WORDS_RE = re.compile(r"\b(error|exception|traceback|failed)\b", re.I)
+_WARNING_WORDS_RE = re.compile(r"\bwarn(ing)?\b", re.I)
+
+
+def level_number(level, default=20):
+    if isinstance(level, int):
+        return level
+    return LEVELS.get(str(level or "").upper(), default)
+
+
+def level_name(number):
+    return logging.getLevelName(int(number))
+
+
+def symbol_pattern(symbols):
+    """Regex finding any configured symbol (and broker suffixes like ``XAUUSDm``/``XAUUSD.a``) in a line."""
+    names = sorted({str(s).upper() for s in symbols or () if s}, key=len, reverse=True)
+    if not names:
+        return None
+    return re.compile(r"\b(" + "|".join(re.escape(n) for n in names) + r")(?:\.?[A-Za-z0-9]{0,3})?\b")
+
+
+def parse_line(text, stream="stdout", symbols_re=None):
+    """``(record, is_heartbeat)`` for one output line, or ``(None, False)`` for a blank line."""
+    text = text.rstrip()
+    if not text.strip():
+        return None, False
+    level = symbol = None
+    message = text
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            if data.get("event") == "heartbeat":
+                return None, True
+            level = data.get("level") or data.get("levelname")
+            symbol = data.get("symbol")
+            message = str(data.get("message") or data.get("msg") or text)
+    elif text.strip() == "HEARTBEAT":
+        return None, True
+    if level is None:
+        match = _LOGGING_RE.match(text)
+        if match:
+            level, message = match.group("level"), match.group("message") or text
+    if level is None:
+        # print() output and tracebacks: guess from the stream and wording
+        if stream == "stderr" or _ERROR_WORDS_RE.search(text):
+            level = "ERROR"
+        elif _WARNING_WORDS_RE.search(text):
+            level = "WARNING"
+        else:
+            level = "INFO"
+    if symbol is None:
+        match = _SYMBOL_FIELD_RE.search(message)
+        if match:
+            symbol = match.group("symbol")
+        elif symbols_re is not None:
+            match = symbols_re.search(message.upper())
+            symbol = match.group(1) if match else None
+    record = {
+        "ts": time.time(),
+        "level": level_number(level),
+        "symbol": str(symbol).upper() if symbol else None,
+        "stream": stream,
+        "message": message,
+    }
+    return record, False
+
+
+def to_public(record):
+    """API/SSE shape of a record; keeps the old ``bot_log`` keys (``line``, ``timestamp``)."""
+    return {
+        "id": record.get("id"),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record["ts"])) + f".{int(record['ts'] % 1 * 1000):03d}",
+        "level": level_name(record["level"]),
+        "symbol": record.get("symbol"),
+        "stream": record.get("stream"),
+        "pid": record.get("pid"),
+        "run": record.get("run"),
+        "line": record["message"],
+    }
+
+
+class BotLogStore:
+    def __init__(self, db_file=BOT_LOG_DB_FILE, max_rows=100_000, flush_interval=0.5, max_pending=20_000):
+        self.db_file = db_file
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._local = threading.local()
+        self._connections = []
+        self._since_trim = 0
+        self.dropped = 0
+        self.written = 0
+        row = self.connection().execute("SELECT MAX(id) FROM bot_logs").fetchone()
+        self._ids = itertools.count((row[0] or 0) + 1)
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def append(self, record):
+        """Queue ``record`` for the writer; returns it with its ``id``. Oldest pending records go first if the writer falls behind."""
+        with self._lock:
+            record = dict(record, id=next(self._ids))
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(record)
+        return record
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = list(self._pending), deque()
+        if not batch:
+            return 0
+        conn = self.connection()
+        with conn:
+            conn.executemany(INSERT_SQL, [(r["id"], r["ts"], r["level"], r.get("symbol"), r["stream"], r.get("pid"),
+                                           r.get("run"), r["message"]) for r in batch])
+        self.written += len(batch)
+        self._since_trim += len(batch)
+        if self._since_trim >= max(1, self.max_rows // 10):
+            self.trim()
+        return len(batch)
+
+    def trim(self):
+        conn = self.connection()
+        with conn:
+            conn.execute("DELETE FROM bot_logs WHERE id <= (SELECT MAX(id) FROM bot_logs) - ?", (self.max_rows,))
+        self._since_trim = 0
+
+    def query(self, level=None, symbol=None, since_id=None, before_id=None, start=None, end=None, search=None,
+              run=None, limit=200):
+        """Newest-first records at ``level`` or above, optionally for one ``symbol`` / ``run`` / time range / substring."""
+        self.flush()
+        where, params = [], []
+        if level is not None:
+            where.append("level >= ?")
+            params.append(level_number(level))
+        if symbol:
+            where.append("symbol = ?")
+            params.append(str(symbol).upper())
+        if since_id is not None:
+            where.append("id > ?")
+            params.append(int(since_id))
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(int(before_id))
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(float(start))
+        if end is not None:
+            where.append("ts <= ?")
+            params.append(float(end))
+        if run is not None:
+            where.append("run = ?")
+            params.append(int(run))
+        if search:
+            where.append("message LIKE ? ESCAPE '\\'")
+            params.append("%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        sql = "SELECT id, ts, level, symbol, stream, pid, run, message FROM bot_logs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(max(1, min(int(limit), 5000)))
+        rows = self.connection().execute(sql, params).fetchall()
+        keys = ("id", "ts", "level", "symbol", "stream", "pid", "run", "message")
+        return [to_public(dict(zip(keys, row))) for row in rows]
+
+    def stats(self):
+        self.flush()
+        rows = self.connection().execute("SELECT level, COUNT(*) FROM bot_logs GROUP BY level").fetchall()
+        return {"rows": sum(n for _, n in rows), "by_level": {level_name(level): n for level, n in rows},
+                "written": self.written, "dropped": self.dropped, "max_rows": self.max_rows}
+
+    # --- background flushing ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bot-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Bot log write failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class BotSupervisor:
+    def __init__(self, command, cwd=None, env=None, log_store=None, restart="on-failure", heartbeat_timeout=0.0,
+                 stop_timeout=10.0, backoff_initial=1.0, backoff_max=60.0, stable_seconds=60.0, max_restarts=5,
+                 restart_window=600.0, symbols=(), on_record=None, on_status=None, on_event=None, echo=True,
+                 check_interval=1.0, stop_request=None):
+        if restart not in RESTART_POLICIES:
+            raise ValueError(f"restart must be one of {RESTART_POLICIES}")
+        self.command = list(command)
+        self.cwd = cwd
+        self.env = env
+        self.log_store = log_store
+        self.restart = restart
+        self.heartbeat_timeout = heartbeat_timeout
+        self.stop_timeout = stop_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_seconds = stable_seconds
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.on_record = on_record
+        self.on_status = on_status
+        self.on_event = on_event
+        self.echo = echo
+        self.check_interval = check_interval
+        self.stop_request = stop_request
+        self._symbols_re = symbol_pattern(symbols)
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        self.process = None
+        self.state = "stopped"
+        self.desired = False
+        self.run = 0
+        self.started_at = None
+        self.last_seen = None
+        self.heartbeat_seen = False
+        self.last_exit = None
+        self.next_start_at = None
+        self.failures = 0
+        self.total_restarts = 0
+        self._restart_times = deque()
+        self._kill_reason = None
+
+    # --- control ---
+
+    def start(self):
+        """Start the bot (resetting backoff and the circuit breaker); False if it is already running."""
+        with self._lock:
+            if self._alive():
+                return False
+            self.desired = True
+            self.failures = 0
+            self._restart_times.clear()
+            self.next_start_at = None
+            self._spawn()
+        self._ensure_monitor()
+        return True
+
+    def stop(self, timeout=None):
+        """Stop gracefully and disable restarts; returns the exit code, or None if nothing was running."""
+        with self._lock:
+            self.desired = False
+            self.next_start_at = None
+            proc = self.process
+            if proc is None or proc.poll() is not None:
+                if proc is not None:
+                    self._handle_exit(proc)
+                self._set_state("stopped")
+                return None
+            self._set_state("stopping")
+        code = self._shutdown(proc, self.stop_timeout if timeout is None else timeout)
+        with self._lock:
+            self._handle_exit(proc)
+        self._event("bot_control", "Bot Stopped", f"Trading bot process exited with code {code}.")
+        return code
+
+    def close(self):
+        self.stop()
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def beat(self):
+        """Record a heartbeat received out of band (e.g. from a control channel)."""
+        self.last_seen = time.time()
+        self.heartbeat_seen = True
+
+    def send(self, line):
+        """Write one line to the bot's stdin; False if there is no running bot to take it."""
+        proc = self.process
+        if proc is None or proc.stdin is None or proc.poll() is not None:
+            return False
+        try:
+            proc.stdin.write(line if isinstance(line, bytes) else line.encode() + b"\n")
+            proc.stdin.flush()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def update_config(self, config):
+        advanced = config.get("advanced_settings", {})
+        restart = advanced.get("bot_restart_policy", self.restart)
+        if restart in RESTART_POLICIES:
+            self.restart = restart
+        self.heartbeat_timeout = float(advanced.get("bot_heartbeat_timeout", self.heartbeat_timeout) or 0)
+        self._symbols_re = symbol_pattern(config.get("symbols"))
+
+    def status(self):
+        with self._lock:
+            now = time.time()
+            running = self._alive()
+            self._prune_restarts(now)
+            return {
+                "running": running,
+                "state": self.state,
+                "pid": self.process.pid if running else None,
+                "run": self.run,
+                "uptime": round(now - self.started_at, 1) if running and self.started_at else None,
+                "last_heartbeat_age": round(now - self.last_seen, 1) if running and self.last_seen else None,
+                "liveness_enforced": bool(running and self.heartbeat_timeout and self.heartbeat_seen),
+                "restart_policy": self.restart,
+                "restarts_in_window": len(self._restart_times),
+                "total_restarts": self.total_restarts,
+                "next_restart_in": round(max(0.0, self.next_start_at - now), 1) if self.next_start_at else None,
+                "last_exit": self.last_exit,
+            }
+
+    # --- process handling ---
+
+    def _alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _spawn(self):
+        env = dict(os.environ if self.env is None else self.env)
+        env["PYTHONUNBUFFERED"] = "1"
+        # A process group of its own so CTRL_BREAK_EVENT reaches the bot and not the server
+        creationflags = subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0
+        try:
+            proc = subprocess.Popen(self.command, cwd=self.cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, creationflags=creationflags)
+        except OSError as e:
+            self.last_exit = {"code": None, "reason": f"spawn failed: {e}", "at": time.time()}
+            self._event("error", "Failed to Start Bot", f"Error starting bot process: {e}")
+            self._schedule_restart(failed=True)
+            return
+        self.run += 1
+        self.process = proc
+        self.started_at = self.last_seen = time.time()
+        self.heartbeat_seen = False
+        self.next_start_at = None
+        self._kill_reason = None
+        print(f"Bot process started with PID: {proc.pid} (run {self.run})")
+        for pipe, stream in ((proc.stdout, "stdout"), (proc.stderr, "stderr")):
+            threading.Thread(target=self._read, args=(pipe, stream, proc.pid, self.run),
+                             name=f"bot-{stream}", daemon=True).start()
+        self._set_state("running")
+        self._event("bot_control", "Bot Started", f"Trading bot process initiated (PID {proc.pid}, run {self.run}).")
+
+    def _read(self, pipe, stream, pid, run):
+        prefix = "BOT-STDOUT" if stream == "stdout" else "BOT-STDERR"
+        try:
+            with pipe:
+                for raw in iter(pipe.readline, b""):
+                    self.last_seen = time.time()
+                    text = raw.decode(errors="replace")
+                    record, heartbeat = parse_line(text, stream, self._symbols_re)
+                    if heartbeat:
+                        self.heartbeat_seen = True
+                    if record is None:
+                        continue
+                    if self.echo:
+                        print(f"[{prefix}] {record['message']}")
+                    record.update(pid=pid, run=run)
+                    if self.log_store is not None:
+                        record = self.log_store.append(record)
+                    if self.on_record is not None:
+                        self.on_record(to_public(record))
+        except Exception as e:
+            print(f"Error reading bot {stream}: {e}")
+
+    def _shutdown(self, proc, timeout):
+        """Stop request (control channel or stdin), then interrupt, then terminate, then kill; returns the exit code."""
+        steps = [self._request_stop, lambda: self._interrupt(proc), proc.terminate, proc.kill]
+        waits = [timeout / 2.0, timeout / 2.0, 5.0, None]
+        for step, wait in zip(steps, waits):
+            try:
+                step()
+            except OSError:
+                pass
+            try:
+                return proc.wait(timeout=wait)
+            except subprocess.TimeoutExpired:
+                continue
+        return proc.returncode
+
+    def _request_stop(self):
+        if self.stop_request is not None and self.stop_request():
+            return True
+        return self.send(STOP_REQUEST)
+
+    @staticmethod
+    def _interrupt(proc):
+        if sys.platform == "win32":
+            proc.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            proc.send_signal(signal.SIGINT)
+
+    def _handle_exit(self, proc):
+        """Record ``proc``'s exit once and decide whether (and when) to restart."""
+        if self.process is not proc:
+            return
+        code = proc.poll()
+        now = time.time()
+        reason = self._kill_reason or ("exited" if code == 0 else "crashed")
+        uptime = now - self.started_at if self.started_at else 0.0
+        self.process = None
+        if proc.stdin is not None:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+        self.last_exit = {"code": code, "reason": reason, "at": now, "uptime": round(uptime, 1), "run": self.run}
+        if not self.desired:
+            self._set_state("stopped")
+            return
+        failed = code != 0 or self._kill_reason is not None
+        if self.restart == "never" or (self.restart == "on-failure" and not failed):
+            self.desired = False
+            self._set_state("stopped")
+            self._event("bot_control", "Bot Exited", f"Trading bot process exited with code {code}.")
+            return
+        if uptime >= self.stable_seconds:
+            self.failures = 0
+        self._event("error" if failed else "bot_control", "Bot Exited",
+                    f"Trading bot process {reason} (code {code}) after {uptime:.0f}s.")
+        self._schedule_restart(failed)
+
+    def _schedule_restart(self, failed):
+        now = time.time()
+        self._prune_restarts(now)
+        if len(self._restart_times) >= self.max_restarts:
+            self.desired = False
+            self.next_start_at = None
+            self._set_state("failed")
+            self._event("error", "Bot Restarts Exhausted",
+                        f"{self.max_restarts} restarts within {self.restart_window:.0f}s; not restarting until started again.")
+            return
+        if failed:
+            self.failures += 1
+        delay = min(self.backoff_max, self.backoff_initial * 2 ** max(0, self.failures - 1))
+        self.next_start_at = now + delay
+        self._restart_times.append(now)
+        self.total_restarts += 1
+        self._set_state("backoff")
+        print(f"Restarting bot in {delay:.1f}s")
+        self._wake.set()
+
+    def _prune_restarts(self, now):
+        while self._restart_times and now - self._restart_times[0] > self.restart_window:
+            self._restart_times.popleft()
+
+    # --- monitor ---
+
+    def _ensure_monitor(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._monitor, name="bot-supervisor", daemon=True)
+            self._thread.start()
+
+    def _monitor(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            try:
+                self._check()
+            except Exception as e:
+                print(f"Error in bot supervisor: {e}")
+
+    def _check(self):
+        hung = None
+        with self._lock:
+            proc = self.process
+            if proc is not None and proc.poll() is not None:
+                if self.state != "stopping":
+                    self._handle_exit(proc)
+            elif proc is not None and self.state == "running" and self.heartbeat_timeout and self.heartbeat_seen:
+                silent = time.time() - (self.last_seen or self.started_at)
+                if silent > self.heartbeat_timeout:
+                    self._kill_reason = f"no heartbeat for {silent:.0f}s"
+                    self._set_state("stopping")
+                    hung = proc
+            elif proc is None and self.desired and self.next_start_at is not None and time.time() >= self.next_start_at:
+                self._spawn()
+        if hung is not None:
+            print(f"Bot process {hung.pid}: {self._kill_reason}, restarting")
+            self._shutdown(hung, min(self.stop_timeout, 2.0))
+            with self._lock:
+                self._handle_exit(hung)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if self.on_status is not None:
+                self.on_status(self.status())
+
+    def _event(self, event_type, title, details):
+        if self.on_event is not None:
+            try:
+                self.on_event(event_type, title, details)
+            except Exception as e:
+                print(f"Error recording bot event: {e}")
+
+
+_DEMO_CHILD = r"""
+import json, sys, time
+run = int(sys.argv[1])
+print("2025-01-02 10:00:00,000 - STOCKDATA - INFO - run %d starting" % run, flush=True)
+print(json.dumps({"level": "WARNING", "symbol": "XAUUSD", "message": "spread 41 > max 33, skipping"}), flush=True)
+print("Placing BUY on GBPJPY 0.10 lots", flush=True)
+print("HEARTBEAT", flush=True)
+if run < 3:
+    print("Traceback (most recent call last):", file=sys.stderr, flush=True)
+    print("RuntimeError: MT5 connection lost", file=sys.stderr, flush=True)
+    sys.exit(1)
+for line in sys.stdin:
+    if json.loads(line).get("cmd") == "stop":
+        print("INFO: stop requested, closing", flush=True)
+        break
+"""
+
+
+def demo():
+    workdir = tempfile.mkdtemp(prefix="bot-supervisor-demo-")
+    script = os.path.join(workdir, "child.py")
+    counter = os.path.join(workdir, "runs")
+    with open(script, "w") as f:
+        f.write("import os\nn = int(open(%r).read()) + 1 if os.path.exists(%r) else 1\nopen(%r, 'w').write(str(n))\n"
+                "import sys; sys.argv[1:] = [str(n)]\n" % (counter, counter, counter) + _DEMO_CHILD)
+    store = BotLogStore(os.path.join(workdir, "bot_logs.db"), max_rows=1000)
+    store.start()
+    states = []
+    supervisor = BotSupervisor([sys.executable, script], log_store=store, backoff_initial=0.2, check_interval=0.05,
+                               symbols=["XAUUSD", "GBPJPY"], echo=False,
+                               on_status=lambda s: states.append(s["state"]),
+                               on_event=lambda kind, title, details: print(f"  event: {title}: {details}"))
+    supervisor.start()
+    deadline = time.time() + 10
+    while time.time() < deadline and not (supervisor.run >= 3 and supervisor.state == "running"):
+        time.sleep(0.05)
+    time.sleep(0.3)
+    status = supervisor.status()
+    print(f"state after crashes: {status['state']}, run {status['run']}, restarts {status['total_restarts']}")
+    code = supervisor.stop(timeout=4)
+    print(f"graceful stop exit code: {code}, transitions: {' -> '.join(states)}")
+    print("errors:", [(r["run"], r["line"]) for r in store.query(level="ERROR")])
+    print("XAUUSD:", [(r["level"], r["line"]) for r in store.query(symbol="XAUUSD", limit=1)])
+    print("stats:", store.stats())
+    ok = status["run"] == 3 and code == 0 and len(store.query(level="ERROR")) == 4
+    supervisor.close()
+    store.close()
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot supervisor and structured bot log.")
+    parser.add_argument("--demo", action="store_true", help="supervise a crashing child and query its log")
+    parser.add_argument("--db", default=BOT_LOG_DB_FILE)
+    parser.add_argument("--level")
+    parser.add_argument("--symbol")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    if args.demo:
+        sys.exit(0 if demo() else 1)
+    store = BotLogStore(args.db)
+    for record in reversed(store.query(level=args.level, symbol=args.symbol, limit=args.limit)):
+        print(f"{record['timestamp']} {record['level']:<8} {record['symbol'] or '-':<8} run {record['run']}: {record['line']}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
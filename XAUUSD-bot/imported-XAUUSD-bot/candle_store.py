@@ -0,0 +1,273 @@
+"""Append-only columnar candle store shared by the bot, the API and backtests.
+
+Each symbol/timeframe lives in ``<root>/<SYMBOL>/<TF>/`` as one raw
+little-endian file per MT5 rates field (``time.bin``, ``close.bin``, ...)
+plus ``meta.json`` holding the committed row count. Appends write the column
+bytes first and then replace ``meta.json`` atomically, so readers in other
+processes never see a half-written bar; bytes past the committed count (a
+crash mid-append) are truncated on the next append.
+
+Reads are ``numpy.memmap`` slices of the column files: no parsing and no
+copy. Only closed bars are stored; :meth:`CandleStore.sync` fetches the
+tail beyond the last stored bar, starting at position 1 so the forming bar
+is never written.
+
+Bar times are broker server time, which is usually a few hours off UTC.
+Each sync measures that offset from the symbol's last tick, and
+:meth:`CandleStore.needs_sync` compares bars against the server clock it
+implies.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CANDLE_DIR = "candles"
+COLUMNS = (
+    ("time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("tick_volume", "<i8"),
+    ("spread", "<i4"),
+    ("real_volume", "<i8"),
+)
+TIMEFRAME_SECONDS = {
+    "M1": 60, "M2": 120, "M3": 180, "M4": 240, "M5": 300, "M6": 360, "M10": 600, "M12": 720, "M15": 900,
+    "M20": 1200, "M30": 1800, "H1": 3600, "H2": 7200, "H3": 10800, "H4": 14400, "H6": 21600, "H8": 28800,
+    "H12": 43200, "D1": 86400, "W1": 604800,
+}
+
+
+def check_symbol(symbol):
+    """``symbol`` if it is safe as one directory name under the store root, else ValueError."""
+    name = str(symbol)
+    if name in ("", ".", "..") or "/" in name or "\\" in name or "\0" in name or os.path.isabs(name):
+        raise ValueError(f"Invalid symbol: {symbol!r}")
+    return name
+
+
+def normalize_timeframe(timeframe):
+    """'TIMEFRAME_M15' or 'm15' -> 'M15'."""
+    tf = str(timeframe).upper().replace("TIMEFRAME_", "")
+    if tf not in TIMEFRAME_SECONDS:
+        raise ValueError(f"Unknown timeframe: {timeframe}")
+    return tf
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive cross-process lock on ``path`` (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CandleSeries:
+    """Bars of one symbol/timeframe."""
+
+    def __init__(self, root, symbol, timeframe):
+        if np is None:
+            raise RuntimeError("numpy is required for the candle store")
+        self.symbol = check_symbol(symbol)
+        self.timeframe = normalize_timeframe(timeframe)
+        self.seconds = TIMEFRAME_SECONDS[self.timeframe]
+        # Created by the first append, so reads never touch the disk layout
+        self.path = os.path.join(root, self.symbol, self.timeframe)
+        self._meta_path = os.path.join(self.path, "meta.json")
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._mapped_rows = 0
+
+    def __len__(self):
+        return self._rows()
+
+    def _rows(self):
+        try:
+            with open(self._meta_path) as f:
+                return int(json.load(f)["rows"])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def columns(self, start=None, stop=None, names=None):
+        """Zero-copy memmap slices ``{name: array}`` for rows ``start:stop``."""
+        rows = self._rows()
+        names = names or [name for name, _ in COLUMNS]
+        with self._lock:
+            if rows != self._mapped_rows:
+                self._maps = {}
+                self._mapped_rows = rows
+            result = {}
+            for name, dtype in COLUMNS:
+                if name not in names:
+                    continue
+                if rows == 0:
+                    result[name] = np.empty(0, dtype=dtype)
+                    continue
+                mapped = self._maps.get(name)
+                if mapped is None:
+                    mapped = np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(rows,))
+                    self._maps[name] = mapped
+                result[name] = mapped[start:stop]
+        return result
+
+    def tail(self, count, names=None):
+        return self.columns(start=-count if count else None, names=names)
+
+    def since(self, ts, names=None):
+        """Bars with ``time >= ts``; binary search on the time column."""
+        times = self.columns(names=["time"])["time"]
+        return self.columns(start=int(np.searchsorted(times, ts, side="left")), names=names)
+
+    def last_time(self):
+        times = self.tail(1, names=["time"])["time"]
+        return int(times[-1]) if len(times) else None
+
+    def append(self, rates):
+        """Append closed bars newer than the last stored bar; returns how many were written.
+
+        ``rates`` is an MT5 rates structured array or a ``{column: array}`` mapping.
+        """
+        if rates is None or len(rates) == 0:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        lock_path = os.path.join(self.path, ".lock")
+        with _file_lock(lock_path):
+            rows = self._rows()
+            last = self.last_time() if rows else None
+            times = np.asarray(rates["time"], dtype="<i8")
+            order = np.argsort(times, kind="stable")
+            times = times[order]
+            keep = np.ones(len(times), dtype=bool)
+            keep[1:] = times[1:] != times[:-1]  # drop duplicate timestamps
+            if last is not None:
+                keep &= times > last
+            if not keep.any():
+                return 0
+            selected = order[keep]
+            for name, dtype in COLUMNS:
+                path = self._column_path(name)
+                itemsize = np.dtype(dtype).itemsize
+                with open(path, "ab") as f:
+                    if f.tell() != rows * itemsize:
+                        f.truncate(rows * itemsize)
+                        f.seek(rows * itemsize)
+                    values = _field(rates, name, dtype)
+                    f.write(np.ascontiguousarray(values[selected], dtype=dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            added = int(keep.sum())
+            tmp = self._meta_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"symbol": self.symbol, "timeframe": self.timeframe, "rows": rows + added,
+                           "columns": dict(COLUMNS)}, f)
+            os.replace(tmp, self._meta_path)
+            return added
+
+
+def _field(rates, name, dtype):
+    try:
+        return np.asarray(rates[name])
+    except (KeyError, ValueError, IndexError):
+        return np.zeros(len(rates["time"]), dtype=dtype)
+
+
+# Server offsets are whole half hours; a tick further off than this is stale (market closed)
+OFFSET_STEP = 1800
+MAX_SERVER_OFFSET = 14 * 3600
+
+
+class CandleStore:
+    def __init__(self, root=CANDLE_DIR, bootstrap_bars=5000):
+        self.root = root
+        self.bootstrap_bars = bootstrap_bars
+        self._series = {}
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+    def series(self, symbol, timeframe):
+        key = (symbol, normalize_timeframe(timeframe))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = CandleSeries(self.root, symbol, key[1])
+            return series
+
+    def server_time(self, symbol, now=None):
+        """``now`` (default: the local clock) on the symbol's server clock, or None before the first sync."""
+        offset = self._offsets.get(symbol)
+        return None if offset is None else (now or time.time()) + offset
+
+    def needs_sync(self, symbol, timeframe, now=None):
+        """True when a newer closed bar may exist than the last stored one."""
+        series = self.series(symbol, timeframe)
+        last = series.last_time()
+        server_now = self.server_time(symbol, now)
+        # Until a sync has measured the server offset, the stored bars cannot be aged
+        return last is None or server_now is None or server_now - last >= 2 * series.seconds
+
+    def _measure_offset(self, mt5, symbol):
+        tick = mt5.symbol_info_tick(symbol)
+        offset = None
+        if tick is not None and tick.time:
+            offset = int(round((tick.time - time.time()) / OFFSET_STEP)) * OFFSET_STEP
+        if offset is not None and abs(offset) <= MAX_SERVER_OFFSET:
+            self._offsets[symbol] = offset
+        else:
+            # No usable tick: keep the last measurement, or assume UTC
+            self._offsets.setdefault(symbol, 0)
+
+    def sync(self, mt5, symbol, timeframe):
+        """Fetch closed bars after the last stored one from the terminal; returns bars added.
+
+        Runs wherever terminal calls are allowed (the MT5 session thread in the API).
+        """
+        series = self.series(symbol, timeframe)
+        mt5_timeframe = getattr(mt5, f"TIMEFRAME_{series.timeframe}")
+        self._measure_offset(mt5, symbol)
+        last = series.last_time()
+        if last is None:
+            count = self.bootstrap_bars
+        else:
+            # Overshoot by a bar and trim by time; the loop below widens if the offset was off
+            count = min(self.bootstrap_bars, max(2, int((self.server_time(symbol) - last) // series.seconds) + 2))
+        while True:
+            rates = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 1, count)
+            if rates is None or len(rates) == 0:
+                return 0
+            if last is None or int(rates["time"][0]) <= last or len(rates) < count or count >= self.bootstrap_bars:
+                return series.append(rates)
+            count = min(self.bootstrap_bars, count * 2)
+
+
+def to_records(columns):
+    """Column slices -> list of bar dicts for JSON responses."""
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[n].tolist() for n in names))]
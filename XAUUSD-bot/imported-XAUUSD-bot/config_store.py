@@ -0,0 +1,217 @@
+"""In-memory, versioned view of config.json.
+
+The file is parsed and validated once per change, either when it is written
+through :meth:`ConfigStore.update` or when a watcher thread sees its mtime or
+size move. Readers get the cached dict (treat it as read-only), its
+pre-serialized JSON and an ETag for conditional GETs.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+
+# Expected types for known keys; unknown keys are allowed so the UI can add
+# new settings without a schema change.
+NUMBER = (int, float)
+CONFIG_SCHEMA = {
+    "symbols": list,
+    "timeframe": str,
+    "candle_count": int,
+    "candle_freshness_threshold_seconds": NUMBER,
+    "risk_settings": {
+        "max_daily_loss": NUMBER,
+        "max_daily_profit": NUMBER,
+        "risk_per_trade": NUMBER,
+        "max_daily_trades": int,
+        "default_lot_size": NUMBER,
+        "max_open_trades": int,
+        "allow_multiple_trades": bool,
+    },
+    "trading_sessions": {
+        "enable_trading": bool,
+    },
+    "strategy_filters": {
+        "killzone_filter": bool,
+        "news_filter": bool,
+        "volatility_filter": bool,
+        "trend_filter": bool,
+    },
+    "notifications": dict,
+    "advanced_settings": {
+        "max_slippage": NUMBER,
+        "max_spread": NUMBER,
+        "auto_reconnect": bool,
+        "emergency_stop": bool,
+        "bot_restart_policy": str,
+        "bot_heartbeat_timeout": NUMBER,
+    },
+    "logging": dict,
+    "mt5": {
+        "login": (int, str),
+        "password": str,
+        "server": str,
+    },
+    "copy_trading": {
+        "enabled": bool,
+        "timeout": NUMBER,
+        "accounts": list,
+    },
+}
+
+
+class ConfigValidationError(ValueError):
+    pass
+
+
+def validate_config(data, schema=CONFIG_SCHEMA, path=""):
+    """Raise ConfigValidationError if a known key has the wrong type."""
+    if not isinstance(data, dict):
+        raise ConfigValidationError(f"{path or 'config'} must be an object")
+    for key, expected in schema.items():
+        if key not in data:
+            continue
+        value = data[key]
+        where = f"{path}.{key}" if path else key
+        if isinstance(expected, dict):
+            validate_config(value, expected, where)
+            continue
+        types = expected if isinstance(expected, tuple) else (expected,)
+        # bool is an int subclass; only accept it where bool is expected
+        if isinstance(value, bool) and bool not in types:
+            raise ConfigValidationError(f"{where} must be {_type_names(types)}, got bool")
+        if not isinstance(value, types):
+            raise ConfigValidationError(f"{where} must be {_type_names(types)}, got {type(value).__name__}")
+
+
+def _type_names(types):
+    return " or ".join(t.__name__ for t in types)
+
+
+class ConfigStore:
+    def __init__(self, path, defaults=None, schema=CONFIG_SCHEMA, poll_interval=1.0):
+        self.path = path
+        self.defaults = defaults or {}
+        self.schema = schema
+        self.poll_interval = poll_interval
+        self.version = 0
+        self.last_error = None
+        self._data = {}
+        self._json = b"{}"
+        self._etag = None
+        self._stat = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._load(initial=True)
+
+    # --- reads ---
+
+    def get(self):
+        """Current config; shared between callers, do not mutate."""
+        return self._data
+
+    def snapshot(self):
+        """Return ``(data, json_bytes, etag, version)`` from one consistent version."""
+        with self._lock:
+            return self._data, self._json, self._etag, self.version
+
+    @property
+    def etag(self):
+        return self._etag
+
+    # --- writes ---
+
+    def update(self, changes):
+        """Shallow-merge ``changes`` into the config, validate and persist it."""
+        with self._lock:
+            merged = copy.deepcopy(self._data)
+            merged.update(changes)
+            validate_config(merged, self.schema)
+            tmp_file = self.path + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(merged, f, indent=2)
+            os.replace(tmp_file, self.path)
+            self._stat = self._file_stat()
+            changed = self._swap(merged)
+        if changed:
+            self._notify()
+        return self._data
+
+    def subscribe(self, callback):
+        """Call ``callback(config)`` after every change, from the writing thread."""
+        self._listeners.append(callback)
+
+    # --- file watching ---
+
+    def start(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="config-watch", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        """Reload if the file changed on disk; returns True if the config changed."""
+        if self._file_stat() == self._stat:
+            return False
+        return self._load()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error watching config file: {e}")
+
+    def _load(self, initial=False):
+        with self._lock:
+            stat = self._file_stat()
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                validate_config(data, self.schema)
+            except (FileNotFoundError, json.JSONDecodeError, ConfigValidationError) as e:
+                self._stat = stat
+                self.last_error = str(e)
+                if initial:
+                    print(f"Config file not found or invalid at {self.path}: {e}. Using default config.")
+                    self._swap(copy.deepcopy(self.defaults))
+                else:
+                    # Keep serving the last good version (e.g. an editor's half-written save)
+                    print(f"Ignoring invalid config file change at {self.path}: {e}")
+                return False
+            self._stat = stat
+            self.last_error = None
+            changed = self._swap(data)
+        if changed and not initial:
+            print(f"Config reloaded from {self.path} (version {self.version}).")
+            self._notify()
+        return changed
+
+    def _swap(self, data):
+        encoded = json.dumps(data, indent=2).encode()
+        etag = '"' + hashlib.sha1(encoded).hexdigest()[:20] + '"'
+        if etag == self._etag:
+            return False
+        self._data = data
+        self._json = encoded
+        self._etag = etag
+        self.version += 1
+        return True
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            try:
+                callback(self._data)
+            except Exception as e:
+                print(f"Error in config listener: {e}")
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,375 @@
+"""Copy-trading fan-out: one signal, sized and sent to every account at once.
+
+The MetaTrader5 package drives one terminal per process, so each account
+gets its own worker process (spawned, so nothing is shared with the parent)
+that initializes its own terminal (``terminal_path`` per account for real
+installs) and stays logged in. :meth:`CopyTrader.dispatch` hands the signal
+to every worker at the same time; each one sizes the order from its own
+``account_info`` and sends it, and the report carries per-account volume,
+fill latency and slippage.
+
+An account that has not answered within ``timeout`` is reported as
+``"timeout"`` with ``"pending": true``; its order may still fill. Answers
+that arrive later are logged with their ticket, passed to
+``on_late_result(order_id, login, result)`` when given, and returned in the
+next report's ``late_results`` (or by :meth:`CopyTrader.collect_late`).
+
+The accounts are the dashboard's MT5 account store (``mt5_accounts.json``,
+see :meth:`CopyTrader.from_config`). Passwords are never written to disk:
+they come from the API server's logged-in sessions, so an account takes part
+once it has been logged in through ``/api/mt5/login``. config.json only holds
+non-secret per-login overrides::
+
+    "copy_trading": {"enabled": true, "timeout": 10, "accounts": [
+        {"login": 123, "terminal_path": "C:/MT5-a/terminal64.exe", "risk_per_trade": 0.5}
+    ]}
+
+Events (unavailable accounts, late fills) go to ``log_event(event_type,
+title, details, tag)``, the API server's activity log when it runs the
+fan-out (``/api/copy/start``, ``/api/copy/dispatch``, ``/api/copy/report``).
+
+A signal is ``{"symbol", "side": "buy"|"sell", "sl", "tp", "comment"}``,
+optionally with the ``price`` it was generated at (for ``max_slippage``).
+Sizing risks ``risk_per_trade`` percent of the smaller of balance and
+equity over the stop distance, rounded down to the symbol's volume step.
+Each order then goes through the account's own
+:class:`pretrade_risk.PreTradeRiskEngine` (the ``risk_settings`` /
+``advanced_settings`` rules); a failed check is reported as ``"blocked"``
+with the failing rules and nothing is sent.
+
+    python copy_trading.py --accounts 5 --latency 0.05 --slippage 3   # fake brokers
+"""
+import argparse
+import collections
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+
+from pretrade_risk import PreTradeRiskEngine
+
+MAGIC = 240611
+# Config sections the per-account pre-trade risk engine is compiled from
+RISK_SECTIONS = ("risk_settings", "advanced_settings", "risk")
+
+
+def print_event(event_type, title, details, tag):
+    """Default ``log_event``: the console, for the demo and scripts."""
+    print(f"{title}: {details}")
+
+
+def real_terminal(account):
+    import MetaTrader5
+    return MetaTrader5
+
+
+class FakeBroker:
+    """Picklable factory for a per-process :class:`fake_mt5.FakeMT5` that accepts ``account``."""
+
+    def __init__(self, latency=0.02, slippage_points=3, balance=10000.0):
+        self.latency = latency
+        self.slippage_points = slippage_points
+        self.balance = balance
+
+    def __call__(self, account):
+        import fake_mt5
+        return fake_mt5.FakeMT5(
+            latency=self.latency, slippage_points=self.slippage_points,
+            accounts={int(account["login"]): {"password": account.get("password"), "server": account.get("server"),
+                                              "balance": float(account.get("balance", self.balance))}})
+
+
+def size_order(account_info, symbol_info, price, sl, risk_per_trade):
+    """Volume risking ``risk_per_trade`` percent of min(balance, equity) between ``price`` and ``sl``."""
+    distance = abs(price - sl)
+    if distance <= 0:
+        return None, "stop loss at entry"
+    value_per_price_unit = symbol_info.trade_tick_value / symbol_info.trade_tick_size
+    basis = min(account_info.balance, account_info.equity)
+    raw = basis * risk_per_trade / 100.0 / (distance * value_per_price_unit)
+    step = symbol_info.volume_step
+    volume = round(int(raw / step + 1e-9) * step, 8)
+    if volume < symbol_info.volume_min:
+        return None, f"size {raw:.4f} below volume_min {symbol_info.volume_min}"
+    return min(volume, symbol_info.volume_max), None
+
+
+def execute_signal(mt5, account, signal, default_risk, max_slippage, risk=None):
+    """Size, risk-check and send one market order on this process's terminal.
+
+    ``risk`` is the account's :class:`pretrade_risk.PreTradeRiskEngine`; its
+    book is rebuilt from the terminal's open positions before each check, so
+    trades placed by the bot or by hand count toward the exposure limits.
+    """
+    account_info = mt5.account_info()
+    symbol_info = mt5.symbol_info(signal["symbol"])
+    tick = mt5.symbol_info_tick(signal["symbol"])
+    if account_info is None or symbol_info is None or tick is None:
+        return {"status": "error", "error": f"terminal data unavailable: {mt5.last_error()}"}
+    buy = signal["side"] == "buy"
+    price = tick.ask if buy else tick.bid
+    volume, reason = size_order(account_info, symbol_info, price, float(signal["sl"]),
+                                float(account.get("risk_per_trade", default_risk)))
+    if volume is None:
+        return {"status": "skipped", "error": reason, "balance": account_info.balance}
+    if risk is not None:
+        risk.set_symbol_info(symbol_info)
+        risk.sync_positions(mt5.positions_get(), account_info.equity)
+        verdict = risk.check(signal["symbol"], signal["side"], volume, price, float(signal["sl"]), account_info.equity,
+                             spread_points=(tick.ask - tick.bid) / symbol_info.point,
+                             signal_price=signal.get("price"))
+        if not verdict["allowed"]:
+            return {"status": "blocked", "volume": volume, "balance": account_info.balance,
+                    "rules": [r["rule"] for r in verdict["reasons"]],
+                    "error": "; ".join(r["message"] for r in verdict["reasons"])}
+    request = {
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": signal["symbol"],
+        "volume": volume,
+        "type": mt5.ORDER_TYPE_BUY if buy else mt5.ORDER_TYPE_SELL,
+        "price": price,
+        "sl": float(signal["sl"]),
+        "tp": float(signal["tp"]) if signal.get("tp") else 0.0,
+        "deviation": int(max_slippage),
+        "magic": MAGIC,
+        "comment": signal.get("comment", "copy"),
+        "type_time": mt5.ORDER_TIME_GTC,
+        "type_filling": mt5.ORDER_FILLING_IOC,
+    }
+    started = time.perf_counter()
+    result = mt5.order_send(request)
+    order_ms = (time.perf_counter() - started) * 1000.0
+    if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+        return {"status": "rejected", "volume": volume, "order_ms": round(order_ms, 2),
+                "error": getattr(result, "comment", None) or str(mt5.last_error())}
+    # Positive slippage = filled worse than the quote the order was sized on
+    slippage = (result.price - price) / symbol_info.point * (1 if buy else -1)
+    return {"status": "filled", "volume": volume, "requested_price": price, "fill_price": result.price,
+            "slippage_points": round(slippage, 1) + 0.0, "order_ms": round(order_ms, 2), "ticket": result.order,
+            "balance": account_info.balance, "equity": account_info.equity}
+
+
+def _account_worker(account, factory, default_risk, max_slippage, risk_config, requests, responses):
+    login = str(account["login"])
+    try:
+        risk = PreTradeRiskEngine(risk_config)
+        mt5 = factory(account)
+        kwargs = {"login": int(account["login"]), "password": account.get("password"), "server": account.get("server")}
+        if account.get("terminal_path"):
+            kwargs["path"] = account["terminal_path"]
+        if not mt5.initialize(**kwargs):
+            responses.put(("ready", login, False, str(mt5.last_error())))
+            return
+    except Exception as e:
+        responses.put(("ready", login, False, str(e)))
+        return
+    responses.put(("ready", login, True, None))
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        order_id, signal, dispatched_at = message
+        picked_up = time.time()
+        try:
+            result = execute_signal(mt5, account, signal, default_risk, max_slippage, risk)
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        result["pickup_ms"] = round((picked_up - dispatched_at) * 1000.0, 2)
+        responses.put(("result", login, order_id, result))
+    mt5.shutdown()
+
+
+class CopyTrader:
+    def __init__(self, accounts, factory=real_terminal, default_risk=1.0, max_slippage=20, timeout=10.0,
+                 on_late_result=None, risk_config=None, log_event=print_event):
+        self.accounts = [a for a in accounts if a.get("enabled", True)]
+        self.log_event = log_event
+        self.factory = factory
+        self.default_risk = default_risk
+        self.max_slippage = max_slippage
+        self.risk_config = risk_config or {}
+        self.timeout = timeout
+        self.on_late_result = on_late_result
+        self._ctx = multiprocessing.get_context("spawn")
+        self._responses = self._ctx.Queue()
+        self._workers = {}  # login -> (process, request queue)
+        self.connected = {}
+        self.errors = {}
+        self._order_ids = itertools.count(1)
+        self._pending = {}  # order_id -> {login: dispatched_at} for accounts that timed out
+        self._late = collections.deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, stored_accounts, password_for, factory=real_terminal, log_event=print_event):
+        """Copy targets from the MT5 account store, risk and slippage defaults from ``risk_settings``.
+
+        ``stored_accounts`` are the ``mt5_accounts.json`` records (``login``,
+        ``server``, ``name``); ``password_for(login, server)`` returns the
+        password of a logged-in session or None, and accounts without one are
+        left out. ``copy_trading.accounts`` entries add ``terminal_path``,
+        ``risk_per_trade`` or ``enabled`` to the account with the same login.
+        """
+        copy_cfg = config.get("copy_trading") or {}
+        risk = config.get("risk_settings", {})
+        overrides = {str(a.get("login")): a for a in copy_cfg.get("accounts", []) if isinstance(a, dict)}
+        accounts = []
+        for stored in stored_accounts if copy_cfg.get("enabled", True) else []:
+            login, server = str(stored["login"]), stored["server"]
+            password = password_for(login, server)
+            if password is None:
+                log_event("status", "Copy Account Skipped", f"Account ****{login[-4:]} ({server}) is not logged in",
+                          "status")
+                continue
+            extra = {k: v for k, v in overrides.get(login, {}).items() if k not in ("login", "server", "password")}
+            accounts.append(dict(extra, login=login, server=server, name=stored.get("name"), password=password))
+        return cls(accounts, factory=factory, default_risk=float(risk.get("risk_per_trade", 1.0)),
+                   max_slippage=risk.get("max_slippage", 20), timeout=float(copy_cfg.get("timeout", 10.0)),
+                   risk_config={key: config.get(key) or {} for key in RISK_SECTIONS}, log_event=log_event)
+
+    def start(self):
+        """Spawn one worker per account and wait for their logins."""
+        for account in self.accounts:
+            requests = self._ctx.Queue()
+            process = self._ctx.Process(
+                target=_account_worker, name=f"copy-{account['login']}", daemon=True,
+                args=(account, self.factory, self.default_risk, self.max_slippage, self.risk_config, requests,
+                      self._responses))
+            process.start()
+            self._workers[str(account["login"])] = (process, requests)
+        deadline = time.monotonic() + self.timeout
+        while len(self.connected) + len(self.errors) < len(self._workers):
+            try:
+                kind, login, ok, error = self._responses.get(timeout=max(0.01, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if kind != "ready":
+                continue
+            if ok:
+                self.connected[login] = True
+            else:
+                self.errors[login] = error
+        for login in self._workers:
+            if login not in self.connected and login not in self.errors:
+                self.errors[login] = "login timed out"
+        for login, error in self.errors.items():
+            self.log_event("error", "Copy Account Unavailable", f"Account ****{login[-4:]}: {error}", "error")
+        return dict(self.connected)
+
+    def dispatch(self, signal):
+        """Send ``signal`` to every connected account in parallel; returns the per-account report."""
+        with self._lock:
+            order_id = next(self._order_ids)
+            dispatched_at = time.time()
+            started = time.perf_counter()
+            for login in self.connected:
+                self._workers[login][1].put((order_id, signal, dispatched_at))
+            report = {}
+            deadline = time.monotonic() + self.timeout
+            while len(report) < len(self.connected):
+                try:
+                    kind, login, result_id, result = self._responses.get(
+                        timeout=max(0.01, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if kind != "result":
+                    continue
+                if result_id != order_id:
+                    self._record_late(login, result_id, result)
+                    continue
+                result["latency_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+                report[login] = result
+            for login in self.connected:
+                if login not in report:
+                    report[login] = {"status": "timeout", "pending": True,
+                                     "latency_ms": round(self.timeout * 1000.0, 2)}
+                    self._pending.setdefault(order_id, {})[login] = dispatched_at
+            return {"order_id": order_id, "signal": signal, "accounts": report,
+                    "fanout_ms": round((time.perf_counter() - started) * 1000.0, 2),
+                    "late_results": self._take_late()}
+
+    def collect_late(self):
+        """Answers that arrived after their order was reported as timed out, since the last report."""
+        with self._lock:
+            while True:
+                try:
+                    kind, login, order_id, result = self._responses.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "result":
+                    self._record_late(login, order_id, result)
+            return self._take_late()
+
+    def pending(self):
+        """``{order_id: [login, ...]}`` for timed-out orders still waiting for an answer."""
+        with self._lock:
+            return {order_id: sorted(logins) for order_id, logins in self._pending.items()}
+
+    def _record_late(self, login, order_id, result):
+        dispatched_at = self._pending.get(order_id, {}).pop(login, None)
+        if order_id in self._pending and not self._pending[order_id]:
+            del self._pending[order_id]
+        if dispatched_at is not None:
+            result["latency_ms"] = round((time.time() - dispatched_at) * 1000.0, 2)
+        late = {"order_id": order_id, "login": login, "result": result}
+        self._late.append(late)
+        self.log_event("trade", "Late Copy Result", f"Account ****{login[-4:]}: {result.get('status')} for order "
+                       f"{order_id} (ticket {result.get('ticket')}, volume {result.get('volume')})", "trade")
+        if self.on_late_result is not None:
+            try:
+                self.on_late_result(order_id, login, result)
+            except Exception as e:
+                self.log_event("error", "Late Copy Callback Failed", str(e), "error")
+
+    def _take_late(self):
+        late = list(self._late)
+        self._late.clear()
+        return late
+
+    def close(self, timeout=5.0):
+        for process, requests in self._workers.values():
+            requests.put(None)
+        for process, _ in self._workers.values():
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self._workers.clear()
+        self.connected.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan a test signal out to fake broker accounts.")
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake terminal call")
+    parser.add_argument("--slippage", type=int, default=3, help="max random slippage in points")
+    parser.add_argument("--orders", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for each account's answer")
+    args = parser.parse_args()
+
+    accounts = [{"login": 7000 + i, "password": "demo", "server": "Fake-Demo", "balance": 5000.0 * (i + 1),
+                 "risk_per_trade": 0.5 + 0.25 * i} for i in range(args.accounts)]
+    trader = CopyTrader(accounts, factory=FakeBroker(args.latency, args.slippage))
+    trader.start()
+    trader.timeout = args.timeout  # logins keep the default
+    try:
+        for n in range(args.orders):
+            side = "buy" if n % 2 == 0 else "sell"
+            tick = FakeBroker(0)(accounts[0])._tick("XAUUSD")
+            sl = tick.bid - 5.0 if side == "buy" else tick.ask + 5.0
+            report = trader.dispatch({"symbol": "XAUUSD", "side": side, "sl": sl, "comment": "fanout test"})
+            print(f"order {report['order_id']} ({side}) fanned out in {report['fanout_ms']} ms")
+            for login, r in sorted(report["accounts"].items()):
+                print(f"  {login}: {r['status']:<8} vol {r.get('volume')}  latency {r['latency_ms']} ms  "
+                      f"order {r.get('order_ms')} ms  slippage {r.get('slippage_points')} pts"
+                      + (f"  ({r['error']})" if r.get("error") else ""))
+        time.sleep(args.timeout)
+        late = trader.collect_late()
+        if late or trader.pending():
+            print(f"late answers: {len(late)}, still pending: {trader.pending()}")
+    finally:
+        trader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Incremental cache of closed MT5 deals.
+
+The first refresh pulls the full lookback window; later refreshes only ask the
+terminal for deals at or after the high-water mark (minus a small overlap so
+deals booked late within the same second are not missed). Deals are stored
+once, already converted to the API's dict shape, keyed by ticket and kept in
+(time, ticket) order for paging.
+"""
+import bisect
+import datetime
+import threading
+import time
+
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+
+
+class DealCache:
+    def __init__(self, lookback_days=365, overlap_seconds=300):
+        self.lookback_days = lookback_days
+        self.overlap_seconds = overlap_seconds
+        self.high_water = None  # newest deal time (epoch seconds) seen so far
+        self.last_refresh = None
+        self._keys = []   # sorted (time, ticket)
+        self._items = []  # deal dicts, parallel to _keys
+        self._tickets = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def refresh(self, mt5):
+        """Fetch deals newer than the high-water mark; returns how many were added."""
+        now = datetime.datetime.now()
+        if self.high_water is None:
+            date_from = now - datetime.timedelta(days=self.lookback_days)
+        else:
+            date_from = datetime.datetime.fromtimestamp(self.high_water - self.overlap_seconds)
+        # Deal times are terminal server time, which can run ahead of local time
+        date_to = now + datetime.timedelta(days=1)
+        deals = mt5.history_deals_get(date_from, date_to)
+        if deals is None:
+            return 0
+        added = 0
+        with self._lock:
+            for deal in deals:
+                if deal.ticket in self._tickets:
+                    continue
+                if deal.type not in (DEAL_TYPE_BUY, DEAL_TYPE_SELL) or deal.volume <= 0:
+                    continue
+                deal_time = int(getattr(deal, 'time', 0) or 0)
+                key = (deal_time, deal.ticket)
+                index = bisect.bisect(self._keys, key)
+                self._keys.insert(index, key)
+                self._items.insert(index, {
+                    "ticket": deal.ticket,
+                    "symbol": deal.symbol,
+                    "volume": deal.volume,
+                    "price": deal.price,
+                    "profit": float(deal.profit),
+                    "type": deal.type,
+                    "time": datetime.datetime.fromtimestamp(deal_time).isoformat() if deal_time else None,
+                    "comment": getattr(deal, 'comment', "")
+                })
+                self._tickets.add(deal.ticket)
+                if self.high_water is None or deal_time > self.high_water:
+                    self.high_water = deal_time
+                added += 1
+            if self.high_water is None:
+                self.high_water = int(date_from.timestamp())
+            self.last_refresh = time.time()
+        return added
+
+    def page(self, since=None, limit=None, cursor=None):
+        """Return ``(deals, next_cursor)`` in ascending time order.
+
+        ``since`` keeps deals strictly after that epoch time, ``cursor`` keeps
+        deals strictly before a previous page's ``next_cursor`` and ``limit``
+        keeps the newest N of what remains. ``next_cursor`` is set when older
+        deals are left to page through.
+        """
+        with self._lock:
+            lo = 0 if since is None else bisect.bisect(self._keys, (int(since), float("inf")))
+            hi = len(self._keys) if cursor is None else bisect.bisect_left(self._keys, decode_cursor(cursor))
+            if hi < lo:
+                hi = lo
+            if limit is not None and hi - lo > limit:
+                start = hi - limit
+            else:
+                start = lo
+            items = self._items[start:hi]
+            next_cursor = encode_cursor(self._keys[start]) if start > lo else None
+        return items, next_cursor
+
+
+def encode_cursor(key):
+    return f"{key[0]}-{key[1]}"
+
+
+def decode_cursor(cursor):
+    try:
+        deal_time, ticket = str(cursor).split("-", 1)
+        return int(deal_time), int(ticket)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_since(value):
+    """Accept an ISO timestamp (as returned in ``time``) or epoch seconds."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
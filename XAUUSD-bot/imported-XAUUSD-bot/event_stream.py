@@ -0,0 +1,136 @@
+"""Fan-out of server events to Server-Sent Events clients.
+
+Every client gets its own bounded queue. Publishing never blocks: when a
+client's queue is full its oldest event is dropped and the client is sent a
+``dropped`` event with the count, so it knows to refetch over REST. A slow
+browser therefore only loses its own backlog and never stalls the others.
+``publish`` is safe to call from any thread.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+
+TOPICS = ("activity", "positions", "bot_status", "bot_log", "bot_metrics", "accounts")
+
+
+class Subscriber:
+    def __init__(self, topics, maxsize):
+        self.topics = set(topics)
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.delivered = 0
+        self.connected_at = time.time()
+
+    def offer(self, event):
+        if event["topic"] not in self.topics:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    def __init__(self, queue_size=256, keepalive=15.0):
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._loop = None
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def bind(self, loop):
+        """Attach to the server's event loop; events published before this are dropped."""
+        self._loop = loop
+
+    def has_subscribers(self, topic=None):
+        return any(topic is None or topic in s.topics for s in list(self._subscribers))
+
+    def publish(self, topic, data):
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._subscribers:
+            return
+        with self._lock:
+            event = {"id": next(self._ids), "topic": topic, "data": data}
+        self.published += 1
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(event)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, event)
+
+    def _fan_out(self, event):
+        for subscriber in list(self._subscribers):
+            subscriber.offer(event)
+
+    def subscribe(self, topics=None):
+        subscriber = Subscriber(topics or TOPICS, self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def sse(self, subscriber, is_disconnected):
+        """Yield SSE frames for ``subscriber`` until the client goes away."""
+        try:
+            yield "retry: 3000\n\n"
+            reported_drops = 0
+            while not await is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscriber.dropped != reported_drops:
+                    yield _frame(None, "dropped", {"count": subscriber.dropped - reported_drops})
+                    reported_drops = subscriber.dropped
+                subscriber.delivered += 1
+                yield _frame(event["id"], event["topic"], event["data"])
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "subscribers": [
+                {
+                    "topics": sorted(s.topics),
+                    "queued": s.queue.qsize(),
+                    "delivered": s.delivered,
+                    "dropped": s.dropped,
+                    "connected_at": s.connected_at,
+                }
+                for s in list(self._subscribers)
+            ],
+        }
+
+
+def _frame(event_id, topic, data):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {topic}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def diff_positions(previous, current):
+    """Compare two ``{ticket: position_dict}`` maps; returns the delta or None."""
+    opened = [p for t, p in current.items() if t not in previous]
+    closed = [t for t in previous if t not in current]
+    updated = [
+        {"ticket": t, "profit": p["profit"], "volume": p["volume"]}
+        for t, p in current.items()
+        if t in previous and (p["profit"] != previous[t]["profit"] or p["volume"] != previous[t]["volume"])
+    ]
+    if not (opened or closed or updated):
+        return None
+    return {
+        "opened": opened,
+        "closed": closed,
+        "updated": updated,
+        "floating_pnl": round(sum(p["profit"] for p in current.values()), 2),
+    }
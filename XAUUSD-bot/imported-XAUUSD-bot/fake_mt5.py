@@ -0,0 +1,231 @@
+"""In-process stand-in for the ``MetaTrader5`` package.
+
+Used to exercise the API server and the session manager without a Windows
+terminal::
+
+    import sys, fake_mt5
+    sys.modules["MetaTrader5"] = fake_mt5.FakeMT5()
+    import api_server
+
+Every call can be given an artificial latency so load tests see realistic
+terminal round trips.
+"""
+import datetime
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+
+AccountInfo = namedtuple("AccountInfo", "login server balance equity margin margin_free currency leverage")
+TerminalInfo = namedtuple("TerminalInfo", "connected trade_allowed name")
+TradePosition = namedtuple("TradePosition", "ticket symbol volume price_open profit type time comment")
+TradeDeal = namedtuple("TradeDeal", "ticket order position_id symbol volume price profit type entry time comment")
+SymbolInfo = namedtuple("SymbolInfo", "name point digits spread trade_tick_value trade_tick_size trade_contract_size "
+                                      "volume_min volume_max volume_step")
+Tick = namedtuple("Tick", "time bid ask last")
+OrderSendResult = namedtuple("OrderSendResult", "retcode deal order volume price bid ask comment request_id")
+
+
+class FakeMT5:
+    DEAL_TYPE_BUY = 0
+    DEAL_TYPE_SELL = 1
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    TRADE_ACTION_DEAL = 1
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_IOC = 1
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_NO_MONEY = 10019
+    TIMEFRAME_M1, TIMEFRAME_M5, TIMEFRAME_M15, TIMEFRAME_M30 = 1, 5, 15, 30
+    TIMEFRAME_H1, TIMEFRAME_H4, TIMEFRAME_D1 = 16385, 16388, 16408
+    _TIMEFRAME_SECONDS = {1: 60, 5: 300, 15: 900, 30: 1800, 16385: 3600, 16388: 14400, 16408: 86400}
+
+    def __init__(self, latency=0.0, accounts=None, symbols=("XAUUSD", "USDJPY", "GBPJPY", "EURJPY"),
+                 slippage_points=0):
+        self.latency = latency
+        self.slippage_points = slippage_points
+        self.accounts = accounts or {5036996416: {"password": "demo", "server": "MetaQuotes-Demo", "balance": 10000.0}}
+        self.symbols = list(symbols)
+        self.initialized = False
+        self.current_login = None
+        self.calls = {}
+        self.positions = []
+        self.deals = []
+        self._error = (1, "Success")
+        self._lock = threading.Lock()
+        self._next_ticket = 1000
+
+    # --- helpers for tests/load harnesses ---
+
+    def add_position(self, symbol="XAUUSD", volume=0.1, price_open=2000.0, profit=0.0, type=0):
+        ticket = self._ticket()
+        self.positions.append(TradePosition(ticket, symbol, volume, price_open, profit, type, int(time.time()), ""))
+        return ticket
+
+    def add_deal(self, symbol="XAUUSD", volume=0.1, price=2000.0, profit=0.0, type=0, when=None):
+        ticket = self._ticket()
+        ts = int(when if when is not None else time.time())
+        self.deals.append(TradeDeal(ticket, ticket, ticket, symbol, volume, price, profit, type, self.DEAL_ENTRY_OUT, ts, ""))
+        return ticket
+
+    def seed(self, positions=5, deals=500, days=365):
+        now = time.time()
+        for _ in range(positions):
+            self.add_position(symbol=random.choice(self.symbols), profit=round(random.uniform(-50, 50), 2))
+        for _ in range(deals):
+            self.add_deal(symbol=random.choice(self.symbols), profit=round(random.uniform(-80, 120), 2),
+                          type=random.choice((0, 1)), when=now - random.uniform(0, days * 86400))
+        self.deals.sort(key=lambda d: d.time)
+
+    def disconnect(self):
+        """Simulate the terminal dropping its connection."""
+        self.initialized = False
+        self.current_login = None
+
+    # --- MetaTrader5 API surface ---
+
+    def initialize(self, path=None, login=None, password=None, server=None, timeout=None, portable=False):
+        self._call("initialize")
+        self.initialized = True
+        if login is not None:
+            return self.login(login=login, password=password, server=server)
+        return True
+
+    def login(self, login, password=None, server=None, timeout=None):
+        self._call("login")
+        account = self.accounts.get(int(login))
+        if not self.initialized or account is None or account["password"] != password or account["server"] != server:
+            self._error = (-6, "Terminal: Authorization failed")
+            return False
+        self.current_login = int(login)
+        self._error = (1, "Success")
+        return True
+
+    def shutdown(self):
+        self._call("shutdown")
+        self.initialized = False
+        self.current_login = None
+        return True
+
+    def last_error(self):
+        return self._error
+
+    def terminal_info(self):
+        self._call("terminal_info")
+        if not self.initialized:
+            return None
+        return TerminalInfo(True, True, "FakeMT5")
+
+    def account_info(self):
+        self._call("account_info")
+        if not self.initialized or self.current_login is None:
+            self._error = (-10004, "No IPC connection")
+            return None
+        account = self.accounts[self.current_login]
+        profit = sum(p.profit for p in self.positions)
+        return AccountInfo(self.current_login, account["server"], account["balance"], account["balance"] + profit,
+                           0.0, account["balance"] + profit, "USD", 100)
+
+    def positions_get(self, symbol=None, group=None, ticket=None):
+        self._call("positions_get")
+        if not self.initialized:
+            return None
+        return tuple(p for p in self.positions if symbol is None or p.symbol == symbol)
+
+    def history_deals_get(self, date_from=None, date_to=None, group=None, ticket=None, position=None):
+        self._call("history_deals_get")
+        if not self.initialized:
+            return None
+        lo = self._ts(date_from) if date_from is not None else float("-inf")
+        hi = self._ts(date_to) if date_to is not None else float("inf")
+        return tuple(d for d in self.deals if lo <= d.time <= hi)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        """Deterministic bars ending ``start_pos`` bars before the forming one."""
+        self._call("copy_rates_from_pos")
+        if not self.initialized or symbol not in self.symbols:
+            return None
+        import numpy as np
+        seconds = self._TIMEFRAME_SECONDS[timeframe]
+        forming = int(time.time()) // seconds * seconds
+        times = forming - seconds * np.arange(start_pos + count - 1, start_pos - 1, -1, dtype=np.int64)
+        base = 100.0 + 20.0 * (sum(map(ord, symbol)) % 100)
+        close = base + 5.0 * np.sin(times / 7200.0) + 2.0 * np.sin(times / 1300.0)
+        opens = base + 5.0 * np.sin((times - seconds) / 7200.0) + 2.0 * np.sin((times - seconds) / 1300.0)
+        rates = np.zeros(count, dtype=[("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+                                       ("close", "<f8"), ("tick_volume", "<u8"), ("spread", "<i4"),
+                                       ("real_volume", "<u8")])
+        rates["time"], rates["open"], rates["close"] = times, opens, close
+        rates["high"] = np.maximum(opens, close) + 0.5
+        rates["low"] = np.minimum(opens, close) - 0.5
+        rates["tick_volume"] = 100 + (times // seconds) % 50
+        return rates
+
+    def symbol_info(self, symbol):
+        self._call("symbol_info")
+        if not self.initialized or symbol not in self.symbols:
+            return None
+        return self._symbol_info(symbol)
+
+    def symbol_info_tick(self, symbol):
+        self._call("symbol_info_tick")
+        if not self.initialized or symbol not in self.symbols:
+            return None
+        return self._tick(symbol)
+
+    def order_send(self, request):
+        """Market deals only; fills at the current tick plus up to ``slippage_points`` of random slippage."""
+        self._call("order_send")
+        if not self.initialized or self.current_login is None:
+            self._error = (-10004, "No IPC connection")
+            return None
+        if request.get("symbol") not in self.symbols:
+            self._error = (-2, "Invalid symbol")
+            return None
+        info = self._symbol_info(request["symbol"])
+        tick = self._tick(request["symbol"])
+        buy = request["type"] == self.ORDER_TYPE_BUY
+        slip = random.randint(0, self.slippage_points) * info.point if self.slippage_points else 0.0
+        price = round((tick.ask + slip) if buy else (tick.bid - slip), info.digits)
+        ticket = self._ticket()
+        with self._lock:
+            self.positions.append(TradePosition(ticket, request["symbol"], request["volume"], price, 0.0,
+                                                request["type"], int(time.time()), request.get("comment", "")))
+        return OrderSendResult(self.TRADE_RETCODE_DONE, ticket, ticket, request["volume"], price, tick.bid, tick.ask,
+                               "Request executed", 0)
+
+    # --- internals ---
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _ticket(self):
+        with self._lock:
+            self._next_ticket += 1
+            return self._next_ticket
+
+    @staticmethod
+    def _symbol_info(symbol):
+        digits = 3 if "JPY" in symbol else 2
+        point = 10.0 ** -digits
+        return SymbolInfo(symbol, point, digits, 20, 1.0 if digits == 2 else 0.67, point,
+                          100.0 if digits == 2 else 100000.0, 0.01, 100.0, 0.01)
+
+    def _tick(self, symbol):
+        now = time.time()
+        info = self._symbol_info(symbol)
+        base = 100.0 + 20.0 * (sum(map(ord, symbol)) % 100)
+        bid = round(base + 5.0 * math.sin(now / 7200.0) + 2.0 * math.sin(now / 1300.0), info.digits)
+        return Tick(int(now), bid, round(bid + info.spread * info.point, info.digits), bid)
+
+    @staticmethod
+    def _ts(value):
+        if isinstance(value, datetime.datetime):
+            return value.timestamp()
+        return float(value)
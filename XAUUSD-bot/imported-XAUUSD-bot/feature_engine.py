@@ -0,0 +1,397 @@
+"""Streaming ML-filter features, updated in O(1) per closed bar.
+
+:class:`FeatureEngine` keeps each symbol's recent bars in fixed-size
+``array``-backed ring buffers and updates its indicators from the newest
+bar only:
+
+- EMAs (``adjust=False`` recursion, seeded with the first close)
+- ATR (Wilder smoothing, seeded with the mean true range of the first
+  ``atr_period`` bars)
+- swing highs/lows (a fractal of ``swing_strength`` bars on each side,
+  confirmed ``swing_strength`` bars later)
+- fair value gaps (bar ``t`` low above bar ``t-2`` high, or high below its low)
+- order blocks (the last opposite-colour candle before the close that first
+  breaks the latest swing level)
+
+:func:`batch_features` recomputes the same columns from whole arrays with
+NumPy (each EMA is one ``scipy.signal.lfilter`` pass when SciPy is
+installed) and :func:`batch_feature_vectors` the ML rows for every bar (used
+to build training sets); :func:`batch_atr` also gives the backtest and
+optimizer their default stops. ``test_feature_engine.py`` checks the batch
+and streaming results agree bar for bar, as does running this module::
+
+    python feature_engine.py --bars 20000
+"""
+import argparse
+import math
+import random
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None  # batch_ema falls back to a Python loop
+
+class RingBuffer:
+    """Fixed-capacity float ring; index 0 is the oldest value kept, -1 the newest."""
+
+    __slots__ = ("_data", "_capacity", "_start", "_size")
+
+    def __init__(self, capacity):
+        self._data = array("d", [0.0]) * capacity
+        self._capacity = capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        if self._size < self._capacity:
+            self._data[(self._start + self._size) % self._capacity] = value
+            self._size += 1
+        else:
+            self._data[self._start] = value
+            self._start = (self._start + 1) % self._capacity
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("ring buffer index out of range")
+        return self._data[(self._start + index) % self._capacity]
+
+    def values(self):
+        return [self[i] for i in range(self._size)]
+
+
+class FeatureEngine:
+    """Indicators for one symbol/timeframe; feed closed bars in order with :meth:`update`."""
+
+    def __init__(self, ema_periods=(9, 21, 50), atr_period=14, swing_strength=2, sequence_length=10):
+        self.ema_periods = tuple(ema_periods)
+        self.atr_period = atr_period
+        self.swing_strength = swing_strength
+        self.sequence_length = sequence_length
+        window = max(2 * swing_strength + 1, sequence_length + 1, 3)
+        self.open = RingBuffer(window)
+        self.high = RingBuffer(window)
+        self.low = RingBuffer(window)
+        self.close = RingBuffer(window)
+        self.bars = 0
+        self.emas = [math.nan] * len(self.ema_periods)
+        self.atr = math.nan
+        self._tr_sum = 0.0
+        self.swing_high = math.nan
+        self.swing_low = math.nan
+        self.fvg_bull = 0.0
+        self.fvg_bear = 0.0
+        self.ob_bull = (math.nan, math.nan)
+        self.ob_bear = (math.nan, math.nan)
+        self._last_bear_candle = (math.nan, math.nan)
+        self._last_bull_candle = (math.nan, math.nan)
+
+    def update(self, o, h, l, c):
+        """Fold in one closed bar and return the feature snapshot for it."""
+        prev_close = self.close[-1] if self.bars else None
+        prev_swing_high, prev_swing_low = self.swing_high, self.swing_low
+        self.open.append(o)
+        self.high.append(h)
+        self.low.append(l)
+        self.close.append(c)
+        self.bars += 1
+
+        for i, period in enumerate(self.ema_periods):
+            if self.bars == 1:
+                self.emas[i] = c
+            else:
+                # alpha * x + decay * y, the order lfilter evaluates, so the batch EMA matches bit for bit
+                alpha = 2.0 / (period + 1.0)
+                self.emas[i] = alpha * c + (1.0 - alpha) * self.emas[i]
+
+        tr = h - l if prev_close is None else max(h - l, abs(h - prev_close), abs(l - prev_close))
+        if self.bars < self.atr_period:
+            self._tr_sum += tr
+        elif self.bars == self.atr_period:
+            self.atr = (self._tr_sum + tr) / self.atr_period
+        else:
+            self.atr = (self.atr * (self.atr_period - 1) + tr) / self.atr_period
+
+        k = self.swing_strength
+        if self.bars >= 2 * k + 1:
+            pivot = -k - 1
+            ph, pl = self.high[pivot], self.low[pivot]
+            others = [j for j in range(-2 * k - 1, 0) if j != pivot]
+            if all(ph > self.high[j] for j in others):
+                self.swing_high = ph
+            if all(pl < self.low[j] for j in others):
+                self.swing_low = pl
+
+        if self.bars >= 3:
+            gap_up = l - self.high[-3]
+            gap_down = self.low[-3] - h
+            self.fvg_bull = gap_up if gap_up > 0 else 0.0
+            self.fvg_bear = gap_down if gap_down > 0 else 0.0
+
+        # Structure breaks use the swing levels known before this bar
+        if prev_close is not None:
+            if not math.isnan(prev_swing_high) and prev_close <= prev_swing_high < c:
+                self.ob_bull = self._last_bear_candle
+            if not math.isnan(prev_swing_low) and prev_close >= prev_swing_low > c:
+                self.ob_bear = self._last_bull_candle
+        if c < o:
+            self._last_bear_candle = (h, l)
+        elif c > o:
+            self._last_bull_candle = (h, l)
+        return self.snapshot()
+
+    def snapshot(self):
+        values = {f"ema_{p}": self.emas[i] for i, p in enumerate(self.ema_periods)}
+        values.update({
+            "atr": self.atr,
+            "swing_high": self.swing_high,
+            "swing_low": self.swing_low,
+            "fvg_bull": self.fvg_bull,
+            "fvg_bear": self.fvg_bear,
+            "ob_bull_high": self.ob_bull[0],
+            "ob_bull_low": self.ob_bull[1],
+            "ob_bear_high": self.ob_bear[0],
+            "ob_bear_low": self.ob_bear[1],
+        })
+        return values
+
+    def feature_vector(self):
+        """Scale-free row for the ML filter: indicator distances in ATRs plus the last returns."""
+        c = self.close[-1]
+        atr = self.atr if self.atr and not math.isnan(self.atr) else 1.0
+        row = [(c - ema) / atr for ema in self.emas]
+        row.append(atr / c if c else 0.0)
+        for level in (self.swing_high, self.swing_low, self.ob_bull[0], self.ob_bear[1]):
+            row.append(0.0 if math.isnan(level) else (c - level) / atr)
+        row.extend((self.fvg_bull / atr, self.fvg_bear / atr))
+        closes = self.close.values()[-self.sequence_length - 1:]
+        returns = [(b - a) / a if a else 0.0 for a, b in zip(closes, closes[1:])]
+        row.extend([0.0] * (self.sequence_length - len(returns)) + returns)
+        return row
+
+    def feature_names(self):
+        return ([f"ema_{p}_dist" for p in self.ema_periods] + ["atr_pct", "swing_high_dist", "swing_low_dist",
+                "ob_bull_dist", "ob_bear_dist", "fvg_bull", "fvg_bear"]
+                + [f"ret_{i}" for i in range(self.sequence_length, 0, -1)])
+
+
+def batch_features(o, h, l, c, ema_periods=(9, 21, 50), atr_period=14, swing_strength=2):
+    """The :class:`FeatureEngine` columns for every bar, recomputed from full arrays."""
+    o, h, l, c = (np.asarray(a, dtype=np.float64) for a in (o, h, l, c))
+    n = len(c)
+    out = {}
+
+    for period in ema_periods:
+        out[f"ema_{period}"] = batch_ema(c, period)
+
+    prev_close = np.concatenate(([np.nan], c[:-1]))
+    out["atr"] = batch_atr(h, l, c, atr_period)
+
+    # Pivot at t-k is confirmed on bar t when it beats the k bars on either side
+    k = swing_strength
+    is_high = np.zeros(n, dtype=bool)
+    is_low = np.zeros(n, dtype=bool)
+    if n >= 2 * k + 1:
+        pivots = np.arange(k, n - k)
+        high_ok = np.ones(len(pivots), dtype=bool)
+        low_ok = np.ones(len(pivots), dtype=bool)
+        for offset in list(range(-k, 0)) + list(range(1, k + 1)):
+            high_ok &= h[pivots] > h[pivots + offset]
+            low_ok &= l[pivots] < l[pivots + offset]
+        is_high[pivots[high_ok] + k] = True
+        is_low[pivots[low_ok] + k] = True
+    out["swing_high"] = _forward_fill(np.where(is_high, np.roll(h, k), np.nan))
+    out["swing_low"] = _forward_fill(np.where(is_low, np.roll(l, k), np.nan))
+
+    fvg_bull = np.zeros(n)
+    fvg_bear = np.zeros(n)
+    if n >= 3:
+        fvg_bull[2:] = np.maximum(l[2:] - h[:-2], 0.0)
+        fvg_bear[2:] = np.maximum(l[:-2] - h[2:], 0.0)
+    out["fvg_bull"] = fvg_bull
+    out["fvg_bear"] = fvg_bear
+
+    prev_swing_high = np.concatenate(([np.nan], out["swing_high"][:-1]))
+    prev_swing_low = np.concatenate(([np.nan], out["swing_low"][:-1]))
+    with np.errstate(invalid="ignore"):
+        break_up = (prev_close <= prev_swing_high) & (c > prev_swing_high)
+        break_down = (prev_close >= prev_swing_low) & (c < prev_swing_low)
+    # Last bearish / bullish candle strictly before each bar
+    bear_idx = _last_index_before(c < o)
+    bull_idx = _last_index_before(c > o)
+    for side, breaks, idx in (("bull", break_up, bear_idx), ("bear", break_down, bull_idx)):
+        valid = breaks & (idx >= 0)
+        src = np.where(valid, idx, 0)
+        high_at = np.where(valid, h[src], np.nan)
+        low_at = np.where(valid, l[src], np.nan)
+        # A break before any opposite candle resets the block to "none"
+        high_at[breaks & (idx < 0)] = np.nan
+        low_at[breaks & (idx < 0)] = np.nan
+        out[f"ob_{side}_high"] = _forward_fill_where(high_at, breaks)
+        out[f"ob_{side}_low"] = _forward_fill_where(low_at, breaks)
+    return out
+
+
+def batch_ema(c, period):
+    """The stream's ``adjust=False`` EMA for every bar, seeded with the first close."""
+    c = np.asarray(c, dtype=np.float64)
+    alpha = 2.0 / (period + 1.0)
+    decay = 1.0 - alpha
+    ema = np.empty(len(c))
+    if not len(c):
+        return ema
+    ema[0] = c[0]
+    if lfilter is not None:
+        # y[t] = alpha * c[t] + decay * y[t-1], the filter state carrying y[0] = c[0]
+        ema[1:], _ = lfilter([alpha], [1.0, -decay], c[1:], zi=[decay * c[0]])
+        return ema
+    for t in range(1, len(c)):
+        ema[t] = alpha * c[t] + decay * ema[t - 1]
+    return ema
+
+
+def batch_atr(h, l, c, period=14):
+    """The stream's Wilder ATR for every bar; NaN until ``period`` bars have closed."""
+    h, l, c = (np.asarray(a, dtype=np.float64) for a in (h, l, c))
+    n = len(c)
+    prev_close = np.concatenate(([np.nan], c[:-1]))
+    tr = np.where(np.isnan(prev_close), h - l,
+                  np.maximum(h - l, np.maximum(np.abs(h - prev_close), np.abs(l - prev_close))))
+    atr = np.full(n, np.nan)
+    if n >= period:
+        # Left-to-right sum, as the stream accumulates it
+        atr[period - 1] = sum(tr[:period].tolist()) / period
+        for t in range(period, n):
+            atr[t] = (atr[t - 1] * (period - 1) + tr[t]) / period
+    return atr
+
+
+def batch_feature_vectors(o, h, l, c, ema_periods=(9, 21, 50), atr_period=14, swing_strength=2,
+                          sequence_length=10):
+    """(n, features) matrix whose row ``t`` equals :meth:`FeatureEngine.feature_vector` after bar ``t``."""
+    cols = batch_features(o, h, l, c, ema_periods, atr_period, swing_strength)
+    c = np.asarray(c, dtype=np.float64)
+    n = len(c)
+    atr = cols["atr"]
+    atr = np.where(np.isnan(atr) | (atr == 0), 1.0, atr)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        blocks = [(c - cols[f"ema_{p}"]) / atr for p in ema_periods]
+        blocks.append(np.where(c != 0, atr / c, 0.0))
+        for name in ("swing_high", "swing_low", "ob_bull_high", "ob_bear_low"):
+            level = cols[name]
+            blocks.append(np.where(np.isnan(level), 0.0, (c - level) / atr))
+        blocks.extend((cols["fvg_bull"] / atr, cols["fvg_bear"] / atr))
+        prev = np.concatenate(([0.0], c[:-1]))
+        returns = np.where(prev != 0, (c - prev) / prev, 0.0)
+    returns[:1] = 0.0
+    for lag in range(sequence_length - 1, -1, -1):
+        shifted = np.zeros(n)
+        if lag < n:
+            shifted[lag:] = returns[:n - lag]
+        # Bars before the window is full have fewer returns; the stream left-pads with zeros
+        shifted[:lag + 1] = 0.0
+        blocks.append(shifted)
+    return np.column_stack(blocks) if n else np.empty((0, len(blocks)))
+
+
+def _forward_fill(values):
+    """Carry the last non-NaN value forward."""
+    idx = np.where(~np.isnan(values), np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], np.nan)
+
+
+def _forward_fill_where(values, set_mask):
+    """Carry ``values`` forward from the bars where ``set_mask`` is true (even when NaN)."""
+    idx = np.where(set_mask, np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], np.nan)
+
+
+def _last_index_before(mask):
+    """For each bar, the index of the last earlier bar where ``mask`` holds (-1 if none)."""
+    idx = np.where(mask, np.arange(len(mask)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.concatenate(([-1], idx[:-1]))
+
+
+def _random_bars(n, seed):
+    rng = random.Random(seed)
+    price = 2000.0
+    bars = []
+    for _ in range(n):
+        o = price
+        c = o + rng.gauss(0, 2.0)
+        if rng.random() < 0.05:
+            c = o  # doji: neither bull nor bear candle
+        h = max(o, c) + abs(rng.gauss(0, 1.0))
+        l = min(o, c) - abs(rng.gauss(0, 1.0))
+        if rng.random() < 0.1:
+            o, h, l, c = [round(x) for x in (o, h, l, c)]  # ties in highs/lows
+            h, l = max(h, o, c), min(l, o, c)
+        bars.append((o, h, l, c))
+        price = c + rng.gauss(0, 0.5)
+    return bars
+
+
+def check_equivalence(n=5000, seed=1, **params):
+    """Stream ``n`` random bars and compare every snapshot with the batch recompute."""
+    bars = _random_bars(n, seed)
+    engine = FeatureEngine(**params)
+    streamed, vectors = [], []
+    for bar in bars:
+        streamed.append(engine.update(*bar))
+        vectors.append(engine.feature_vector())
+    batch_params = {k: v for k, v in params.items() if k != "sequence_length"}
+    columns = list(zip(*bars)) if bars else [(), (), (), ()]
+    batch = batch_features(*columns, **batch_params)
+    mismatches = []
+    for name, column in batch.items():
+        for t in range(n):
+            a, b = streamed[t][name], column[t]
+            same = (math.isnan(a) and math.isnan(b)) or a == b
+            if not same:
+                mismatches.append((name, t, a, b))
+                break
+    matrix = batch_feature_vectors(*columns, **params)
+    for t in range(n):
+        if matrix[t].tolist() != vectors[t]:
+            mismatches.append(("feature_vector", t, vectors[t], matrix[t].tolist()))
+            break
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check streaming features against the batch recompute.")
+    parser.add_argument("--bars", type=int, default=20000)
+    parser.add_argument("--seeds", type=int, default=5)
+    args = parser.parse_args()
+    cases = [
+        {},
+        {"ema_periods": (3, 200), "atr_period": 5, "swing_strength": 1},
+        {"ema_periods": (20,), "atr_period": 30, "swing_strength": 5, "sequence_length": 3},
+    ]
+    failed = False
+    for params in cases:
+        for seed in range(args.seeds):
+            for n in (0, 1, 2, 3, 10, args.bars):
+                mismatches = check_equivalence(n, seed, **params)
+                if mismatches:
+                    failed = True
+                    print(f"MISMATCH params={params} seed={seed} n={n}: {mismatches[:3]}")
+    print("streaming == batch" if not failed else "streaming != batch")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
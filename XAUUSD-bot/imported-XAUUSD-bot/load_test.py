@@ -0,0 +1,248 @@
+"""Dashboard load test against the API with a fake MT5 terminal.
+
+Drives the ASGI app in-process (no network, no uvicorn) with N concurrent
+"dashboard" clients, each cycling through the endpoints the UI polls, and
+prints p50/p99 latency per endpoint. The fake terminal adds ``--mt5-latency``
+seconds to every call so terminal round trips behave like a real one.
+
+Clients yield to the loop after every response (a real client would be
+waiting on its socket) and pause ``--think`` seconds between requests, so
+the loop-lag probe measures how long a single step holds the loop rather
+than how many in-process clients are ready to run. With ``--steps`` the
+loop runs in asyncio debug mode (slower) and ``max_step_ms`` reports the
+longest single callback it ran.
+
+    python load_test.py --clients 50 --duration 20
+    python load_test.py --clients 50 --think 0     # closed loop, as fast as the server answers
+    python load_test.py --clients 50 --app api_server:app --mt5-latency 0.02
+
+For a before/after comparison, run the same command from a checkout of the
+older revision (``git worktree add ../before <rev>``) and compare the tables.
+Run it from this directory so config.json and logs/ resolve as they do for
+the server.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import sys
+import time
+
+import fake_mt5
+
+DASHBOARD_ENDPOINTS = [
+    "/api/activity-log",
+    "/api/mt5/trades",
+    "/api/bot/status",
+    "/api/mt5/accounts",
+    "/api/bot/settings",
+]
+
+
+class ASGIClient:
+    """Minimal in-process HTTP client for an ASGI app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, path, body=b"", headers=()):
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"loadtest")] + [(k.encode(), v.encode()) for k, v in headers],
+            "client": ("127.0.0.1", 0),
+            "server": ("loadtest", 80),
+        }
+        sent = False
+        done = asyncio.Event()
+        response = {"status": None, "body": b""}
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+                if not message.get("more_body"):
+                    done.set()
+
+        await self.app(scope, receive, send)
+        done.set()
+        return response["status"], response["body"]
+
+    async def startup(self):
+        """Run the app's startup handlers; ``shutdown`` later reuses the same lifespan."""
+        self._lifespan_queue = asyncio.Queue()
+        self._lifespan_events = {"startup": asyncio.Event(), "shutdown": asyncio.Event()}
+
+        async def receive():
+            return await self._lifespan_queue.get()
+
+        async def send(message):
+            phase = message["type"].split(".")[1]
+            if phase in self._lifespan_events:
+                self._lifespan_events[phase].set()
+
+        self._lifespan_task = asyncio.ensure_future(
+            self.app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        await self._lifespan_events["startup"].wait()
+
+    async def shutdown(self):
+        await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+        await self._lifespan_events["shutdown"].wait()
+        await self._lifespan_task
+
+
+def _watch_slow_steps(threshold=0.005):
+    """Durations (ms) of loop callbacks longer than ``threshold`` s, from asyncio's debug mode."""
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold
+    steps = []
+
+    class _Collector(logging.Handler):
+        def emit(self, record):
+            # "Executing <Task ...> took 0.123 seconds"
+            if record.msg.startswith("Executing") and len(record.args) >= 2:
+                steps.append(record.args[-1] * 1000.0)
+
+    logger = logging.getLogger("asyncio")
+    logger.addHandler(_Collector())
+    logger.propagate = False
+    return steps
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def dashboard_client(client, endpoints, deadline, samples, errors, think=0.0):
+    while time.perf_counter() < deadline:
+        for path in endpoints:
+            start = time.perf_counter()
+            try:
+                status, _ = await client.request("GET", path)
+                ok = status is not None and status < 500
+            except Exception:
+                ok = False
+            samples[path].append((time.perf_counter() - start) * 1000.0)
+            if not ok:
+                errors[path] += 1
+            # An in-process request may finish without ever suspending; without this the
+            # client would hold the loop and the probe would report its whole run as lag
+            await asyncio.sleep(think)
+
+
+async def probe_loop(deadline, interval, lags):
+    """Measure event-loop stalls: how late a short sleep wakes up."""
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000.0)
+
+
+async def run(args):
+    terminal = fake_mt5.FakeMT5(latency=args.mt5_latency)
+    terminal.seed(positions=args.positions, deals=args.deals)
+    # Accept whatever credentials the server will log in with
+    try:
+        with open(args.config) as f:
+            creds = json.load(f).get("mt5", {})
+        terminal.accounts[int(creds["login"])] = {"password": creds.get("password"), "server": creds.get("server"),
+                                                 "balance": 10000.0}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    sys.modules["MetaTrader5"] = terminal
+    module_name, _, attr = args.app.partition(":")
+    app = getattr(importlib.import_module(module_name), attr or "app")
+
+    client = ASGIClient(app)
+    await client.startup()
+    samples = {path: [] for path in args.endpoints}
+    errors = {path: 0 for path in args.endpoints}
+    lags = []
+    steps = _watch_slow_steps() if args.steps else None
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(
+        probe_loop(deadline, 0.01, lags),
+        *(dashboard_client(client, args.endpoints, deadline, samples, errors, args.think) for _ in range(args.clients)),
+    )
+    elapsed = time.perf_counter() - started
+
+    report = {"app": args.app, "clients": args.clients, "duration_s": round(elapsed, 2),
+              "mt5_latency_s": args.mt5_latency, "think_s": args.think, "endpoints": {}}
+    total = 0
+    for path in args.endpoints:
+        ordered = sorted(samples[path])
+        total += len(ordered)
+        report["endpoints"][path] = {
+            "requests": len(ordered),
+            "errors": errors[path],
+            "p50_ms": round(percentile(ordered, 0.50), 2),
+            "p99_ms": round(percentile(ordered, 0.99), 2),
+        }
+    ordered_lags = sorted(lags)
+    report["requests_per_s"] = round(total / elapsed, 1)
+    report["loop_lag_p99_ms"] = round(percentile(ordered_lags, 0.99), 2)
+    report["max_step_ms"] = round(max(steps, default=0.0), 2) if steps is not None else None
+    report["terminal_calls"] = dict(terminal.calls)
+
+    await client.shutdown()
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['app']}: {report['clients']} clients, {report['duration_s']}s, "
+          f"fake MT5 latency {report['mt5_latency_s'] * 1000:.0f} ms")
+    print(f"{'endpoint':<22}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for path, row in report["endpoints"].items():
+        print(f"{path:<22}{row['requests']:>10}{row['errors']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}")
+    print(f"throughput: {report['requests_per_s']} req/s, event-loop lag p99: {report['loop_lag_p99_ms']} ms"
+          + (f", longest loop step: {report['max_step_ms']} ms" if report["max_step_ms"] is not None else ""))
+    print(f"terminal calls: {report['terminal_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="api_server:app", help="module:attribute of the ASGI app")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mt5-latency", type=float, default=0.01, help="seconds added to each fake terminal call")
+    parser.add_argument("--think", type=float, default=0.05, help="seconds each client waits between requests")
+    parser.add_argument("--steps", action="store_true", help="asyncio debug mode: report the longest loop step")
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--deals", type=int, default=2000)
+    parser.add_argument("--endpoints", nargs="+", default=DASHBOARD_ENDPOINTS)
+    parser.add_argument("--config", default="config.json", help="config whose mt5 credentials the fake accepts")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
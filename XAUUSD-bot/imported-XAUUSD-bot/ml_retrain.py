@@ -0,0 +1,422 @@
+"""Incremental retraining of the ML trade filter from closed trades.
+
+Each round:
+
+1. pulls closed trades from ``trades/trades.db`` (label: profit > 0);
+2. builds feature rows in batches, preferring the vector the bot logged
+   with the trade (a ``features`` JSON column) and otherwise recomputing
+   it from the candle store with :func:`feature_engine.batch_feature_vectors`
+   at the last bar closed before entry, plus the trade direction;
+3. holds out the most recent ``holdout`` fraction and trains on the rest,
+   continuing the published model: forests grow ``trees_per_round`` new
+   trees on the latest ``window`` rows (``warm_start``; the oldest trees
+   beyond ``max_trees`` are dropped), estimators with ``partial_fit`` take
+   only the rows since the last round, and anything else is refit;
+4. scores candidate and published model on the same holdout and publishes
+   only if the candidate's ROC AUC (or log loss) is no worse than
+   ``tolerance``.
+
+Every candidate is kept as ``models/versions/ml_trade_filter-vNNNN.pkl``
+with a JSON sidecar of its metrics. Publishing writes a temp file next to
+``advanced_settings.ml_model_path`` and ``os.replace``s it into place, so
+:class:`ml_scorer.MLScorer` in the running bot hot-swaps it on its next
+poll. A pickle-free ``.npz`` bundle (:mod:`model_bundle`) is published
+the same way next to it; the ``.pkl`` stays, since warm starts need the
+estimator. Everything runs on CPU (scikit-learn).
+
+    python ml_retrain.py                 # one round
+    python ml_retrain.py --every 3600    # hourly
+    python ml_retrain.py --demo          # synthetic trades, three rounds, hot-swap check
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import joblib
+except ImportError:
+    joblib = None
+
+from analytics_store import DB_FILE, SIDE_COLUMNS, TradeStore
+from candle_store import CANDLE_DIR, TIMEFRAME_SECONDS, CandleStore, normalize_timeframe
+from feature_engine import batch_feature_vectors
+from ml_scorer import _load_model
+from model_bundle import BundleError, save_bundle
+
+CONFIG_FILE = "config.json"
+MODEL_FILE = os.path.join("models", "ml_trade_filter.pkl")
+FEATURE_COLUMNS = ("features", "ml_features", "feature_vector")
+MIN_BARS = 60
+
+
+def _side_value(value):
+    text = str(value).strip().lower()
+    if text in ("buy", "long", "0", "bullish"):
+        return 1.0
+    if text in ("sell", "short", "1", "bearish"):
+        return -1.0
+    return 0.0
+
+
+def load_outcomes(trade_store, since_rowid=0):
+    """Closed trades after ``since_rowid`` in rowid order, as column lists."""
+    conn = trade_store.connection()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+    feature_column = next((c for c in FEATURE_COLUMNS if c in columns), None)
+    side_column = next((c for c in SIDE_COLUMNS if c in columns), None)
+    rows = conn.execute(f"""
+        SELECT rowid, CAST(strftime('%s', entry_time) AS INTEGER), COALESCE(symbol, ''),
+               {side_column or "NULL"}, profit_value, {feature_column or "NULL"}
+        FROM trades
+        WHERE profit_value IS NOT NULL AND entry_time IS NOT NULL AND rowid > ?
+        ORDER BY rowid
+    """, (since_rowid,)).fetchall()
+    names = ("rowid", "entry_ts", "symbol", "side", "profit", "features")
+    return {name: [r[i] for r in rows] for i, name in enumerate(names)}
+
+
+class FeatureBuilder:
+    """Feature rows for trades; per-series candle matrices are computed once and reused."""
+
+    def __init__(self, candle_store=None, timeframe="TIMEFRAME_M15"):
+        self.candle_store = candle_store
+        self.timeframe = normalize_timeframe(timeframe)
+        self._matrices = {}  # symbol -> (rows in store, bar close times, matrix)
+
+    def build(self, outcomes):
+        """(X, y, rowids, source): logged vectors if most trades carry one, else candle features."""
+        logged = [self._parse(f) for f in outcomes["features"]]
+        widths = [len(v) for v in logged if v is not None]
+        if widths and len(widths) * 2 >= len(logged):
+            width = max(set(widths), key=widths.count)
+            keep = [i for i, v in enumerate(logged) if v is not None and len(v) == width]
+            X = np.array([logged[i] for i in keep], dtype=np.float64).reshape(len(keep), width)
+            source = "logged"
+        else:
+            X, keep = self._from_candles(outcomes)
+            source = f"candles:{self.timeframe}"
+        y = np.array([1 if outcomes["profit"][i] > 0 else 0 for i in keep], dtype=np.int64)
+        rowids = np.array([outcomes["rowid"][i] for i in keep], dtype=np.int64)
+        return X, y, rowids, source
+
+    @staticmethod
+    def _parse(value):
+        if value is None:
+            return None
+        try:
+            vector = json.loads(value) if isinstance(value, str) else value
+            return [float(v) for v in vector]
+        except (TypeError, ValueError):
+            return None
+
+    def _from_candles(self, outcomes):
+        if self.candle_store is None:
+            return np.empty((0, 0)), []
+        by_symbol = {}
+        for i, symbol in enumerate(outcomes["symbol"]):
+            by_symbol.setdefault(symbol, []).append(i)
+        blocks, keep = [], []
+        for symbol, indexes in by_symbol.items():
+            closes_at, matrix = self._matrix(symbol)
+            if matrix is None:
+                continue
+            entry = np.array([outcomes["entry_ts"][i] or 0 for i in indexes], dtype=np.int64)
+            bar = np.searchsorted(closes_at, entry, side="right") - 1  # last bar closed at or before entry
+            valid = bar >= MIN_BARS
+            side = np.array([_side_value(outcomes["side"][i]) for i in indexes])
+            blocks.append(np.column_stack([matrix[bar[valid]], side[valid]]))
+            keep.extend(i for i, ok in zip(indexes, valid) if ok)
+        if not blocks:
+            return np.empty((0, 0)), []
+        # Back to trade order so the holdout is still the most recent trades
+        order = np.argsort(keep, kind="stable")
+        return np.vstack(blocks)[order], [keep[i] for i in order]
+
+    def _matrix(self, symbol):
+        series = self.candle_store.series(symbol, self.timeframe)
+        cols = series.columns(names=["time", "open", "high", "low", "close"])
+        rows = len(cols["time"])
+        cached = self._matrices.get(symbol)
+        if cached is not None and cached[0] == rows:
+            return cached[1], cached[2]
+        if rows < MIN_BARS:
+            return None, None
+        matrix = batch_feature_vectors(cols["open"], cols["high"], cols["low"], cols["close"])
+        closes_at = np.asarray(cols["time"], dtype=np.int64) + TIMEFRAME_SECONDS[self.timeframe]
+        self._matrices[symbol] = (rows, closes_at, matrix)
+        return closes_at, matrix
+
+
+def evaluate(model, X, y, threshold):
+    """Holdout metrics; ``None`` when the model cannot score rows of this width."""
+    if model is None or not len(y) or getattr(model, "n_features_in_", X.shape[1]) != X.shape[1]:
+        return None
+    from sklearn.metrics import log_loss, roc_auc_score
+    classes = list(getattr(model, "classes_", [0, 1]))
+    prob = model.predict_proba(X)[:, classes.index(1)] if 1 in classes else np.zeros(len(y))
+    allowed = prob >= threshold
+    return {
+        "rows": int(len(y)),
+        "win_rate": round(float(y.mean()), 4),
+        "accuracy": round(float(((prob >= 0.5) == (y == 1)).mean()), 4),
+        "allowed_fraction": round(float(allowed.mean()), 4),
+        "allowed_win_rate": round(float(y[allowed].mean()), 4) if allowed.any() else None,
+        "log_loss": round(float(log_loss(y, np.clip(prob, 1e-6, 1 - 1e-6), labels=[0, 1])), 5),
+        "roc_auc": round(float(roc_auc_score(y, prob)), 5) if len(set(y.tolist())) == 2 else None,
+    }
+
+
+def train(current, X, y, new_mask, trees_per_round, max_trees, window, jobs, seed):
+    """(candidate, how) continuing ``current`` where its type allows it."""
+    from sklearn.ensemble import RandomForestClassifier
+    width_ok = current is not None and getattr(current, "n_features_in_", X.shape[1]) == X.shape[1]
+    if width_ok and hasattr(current, "estimators_") and "warm_start" in current.get_params():
+        model = copy.deepcopy(current)
+        recent = slice(max(0, len(y) - window), len(y))
+        if len(set(y[recent].tolist())) < 2:
+            return None, "window has one class"
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees_per_round, n_jobs=jobs)
+        model.fit(X[recent], y[recent])
+        if len(model.estimators_) > max_trees:
+            model.estimators_ = model.estimators_[-max_trees:]
+            model.n_estimators = len(model.estimators_)
+        return model, f"warm_start +{trees_per_round} trees on {recent.stop - recent.start} rows"
+    if width_ok and hasattr(current, "partial_fit"):
+        model = copy.deepcopy(current)
+        if new_mask.any():
+            model.partial_fit(X[new_mask], y[new_mask], classes=np.array([0, 1]))
+        return model, f"partial_fit on {int(new_mask.sum())} rows"
+    if len(set(y.tolist())) < 2:
+        return None, "training set has one class"
+    model = RandomForestClassifier(n_estimators=max(trees_per_round, 10), min_samples_leaf=5, n_jobs=jobs,
+                                   random_state=seed)
+    model.fit(X, y)
+    return model, f"fresh forest on {len(y)} rows" + ("" if current is None else " (feature width changed)")
+
+
+def publish(model, path):
+    """Write ``model`` next to ``path`` and ``os.replace`` it in, so readers see old or new, never partial."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".ml_trade_filter-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump(model, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _write_json(path, payload):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+
+class Retrainer:
+    def __init__(self, trade_store, model_path=MODEL_FILE, feature_builder=None, threshold=0.65, holdout=0.2,
+                 min_new=20, min_holdout=20, trees_per_round=10, max_trees=200, window=5000, tolerance=0.01,
+                 jobs=None, seed=0, allow_feature_change=False):
+        if np is None or joblib is None:
+            raise RuntimeError("numpy and joblib are required for retraining")
+        self.trade_store = trade_store
+        self.model_path = model_path
+        self.feature_builder = feature_builder or FeatureBuilder()
+        self.threshold = threshold
+        self.holdout = holdout
+        self.min_new = min_new
+        self.min_holdout = min_holdout
+        self.trees_per_round = trees_per_round
+        self.max_trees = max_trees
+        self.window = window
+        self.tolerance = tolerance
+        self.jobs = jobs or os.cpu_count()
+        self.seed = seed
+        self.allow_feature_change = allow_feature_change
+        models_dir = os.path.dirname(model_path) or "."
+        self.versions_dir = os.path.join(models_dir, "versions")
+        self.state_file = os.path.join(models_dir, "retrain_state.json")
+        self.state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"version": 0, "trained_rowid": 0, "published": None}
+
+    def run_once(self):
+        """One retraining round; returns its report (``status`` is published, rejected or skipped)."""
+        started = time.perf_counter()
+        outcomes = load_outcomes(self.trade_store)
+        X, y, rowids, source = self.feature_builder.build(outcomes)
+        new_rows = int((rowids > self.state["trained_rowid"]).sum())
+        report = {"time": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z", "rows": int(len(y)),
+                  "new_rows": new_rows, "feature_source": source}
+        if new_rows < self.min_new:
+            return dict(report, status="skipped", reason=f"{new_rows} new labeled trades (< {self.min_new})")
+        split = len(y) - max(self.min_holdout, int(len(y) * self.holdout))
+        if split <= 0:
+            return dict(report, status="skipped", reason=f"not enough rows for a {self.min_holdout}-row holdout")
+        X_train, y_train, X_test, y_test = X[:split], y[:split], X[split:], y[split:]
+        new_mask = rowids[:split] > self.state["trained_rowid"]
+
+        current = None
+        if os.path.exists(self.model_path):
+            try:
+                current = _load_model(self.model_path)
+            except Exception as e:
+                print(f"Published model unreadable, training from scratch: {e}")
+        candidate, how = train(current, X_train, y_train, new_mask, self.trees_per_round, self.max_trees,
+                               self.window, self.jobs, self.seed + self.state["version"])
+        if candidate is None:
+            return dict(report, status="skipped", reason=how)
+        metrics = evaluate(candidate, X_test, y_test, self.threshold)
+        baseline = evaluate(current, X_test, y_test, self.threshold)
+        version = self.state["version"] + 1
+        report.update(version=version, training=how, train_rows=int(split), metrics=metrics, baseline=baseline,
+                      train_seconds=round(time.perf_counter() - started, 3))
+
+        reason = self._reject_reason(current, candidate, metrics, baseline)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        stem = os.path.join(self.versions_dir, f"ml_trade_filter-v{version:04d}")
+        joblib.dump(candidate, stem + ".pkl")
+        report["status"] = "rejected" if reason else "published"
+        if reason:
+            report["reason"] = reason
+        _write_json(stem + ".json", dict(report, n_features=int(X.shape[1]), threshold=self.threshold,
+                                         parent=self.state.get("published"), trained_rowid=int(rowids[split - 1])))
+        self.state["version"] = version
+        if not reason:
+            publish(candidate, self.model_path)
+            try:
+                save_bundle(candidate, os.path.splitext(self.model_path)[0] + ".npz", metadata={"version": version})
+            except BundleError as e:
+                print(f"No model bundle for version {version}: {e}")
+            self.state.update(published=version, trained_rowid=int(rowids[split - 1]))
+        _write_json(self.state_file, self.state)
+        return report
+
+    def _reject_reason(self, current, candidate, metrics, baseline):
+        if current is not None and getattr(current, "n_features_in_", None) != getattr(candidate, "n_features_in_", None):
+            if not self.allow_feature_change:
+                return (f"feature width {getattr(candidate, 'n_features_in_', '?')} differs from the published "
+                        f"model's {getattr(current, 'n_features_in_', '?')} (use --allow-feature-change)")
+            return None
+        if baseline is None or metrics is None:
+            return None
+        if metrics["roc_auc"] is not None and baseline["roc_auc"] is not None:
+            if metrics["roc_auc"] < baseline["roc_auc"] - self.tolerance:
+                return f"holdout AUC {metrics['roc_auc']} < published {baseline['roc_auc']} - {self.tolerance}"
+        elif metrics["log_loss"] > baseline["log_loss"] + self.tolerance:
+            return f"holdout log loss {metrics['log_loss']} > published {baseline['log_loss']} + {self.tolerance}"
+        return None
+
+    def run_forever(self, every):
+        while True:
+            try:
+                print(json.dumps(self.run_once()))
+            except Exception as e:
+                print(f"Retraining round failed: {e}")
+            time.sleep(every)
+
+
+def _demo_trades(db_file, start, count, seed):
+    """Append ``count`` synthetic closed trades whose outcome depends on the logged features."""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_file)
+    conn.execute("""CREATE TABLE IF NOT EXISTS trades (id INTEGER PRIMARY KEY, symbol TEXT, strategy TEXT,
+                    direction TEXT, entry_time TEXT, profit TEXT, features TEXT)""")
+    weights = np.linspace(-1.0, 1.0, 13)
+    for n in range(start, start + count):
+        x = rng.normal(size=13)
+        win = x @ weights + rng.normal(scale=1.5) > 0
+        entry = datetime.datetime(2025, 1, 1) + datetime.timedelta(minutes=15 * n)
+        conn.execute("INSERT INTO trades (symbol, strategy, direction, entry_time, profit, features) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("XAUUSD", "demo", "buy" if n % 2 else "sell", entry.strftime("%Y-%m-%d %H:%M:%S"),
+                      str(round(float(rng.uniform(5, 50) * (1 if win else -1)), 2)), json.dumps(x.round(6).tolist())))
+    conn.commit()
+    conn.close()
+
+
+def demo():
+    from ml_scorer import MLScorer
+    workdir = tempfile.mkdtemp(prefix="retrain-demo-")
+    try:
+        db_file = os.path.join(workdir, "trades.db")
+        model_path = os.path.join(workdir, "models", "ml_trade_filter.pkl")
+        _demo_trades(db_file, 0, 400, seed=1)
+        store = TradeStore(db_file)
+        retrainer = Retrainer(store, model_path, threshold=0.6, min_new=50)
+        scorer = None
+        probe = np.linspace(-1.0, 1.0, 13).reshape(1, -1)
+        for round_no, arriving in enumerate((0, 300, 300), 1):
+            if arriving:
+                _demo_trades(db_file, 400 + (round_no - 2) * 300, arriving, seed=round_no)
+            report = retrainer.run_once()
+            metrics = report.get("metrics") or {}
+            print(f"round {round_no}: {report['status']} v{report.get('version')} ({report.get('training')}), "
+                  f"holdout AUC {metrics.get('roc_auc')} vs published {(report.get('baseline') or {}).get('roc_auc')}")
+            if scorer is None and os.path.exists(model_path):
+                scorer = MLScorer(model_path, poll_interval=0.0)
+            elif scorer is not None:
+                scorer.maybe_reload()
+            if scorer is not None:
+                print(f"  running scorer: model version {scorer.version}, probe p(win) {scorer.score(probe)[0]:.3f}, "
+                      f"trees {len(getattr(scorer.model, 'estimators_', []))}")
+        store.close()
+        print("versions:", sorted(os.listdir(os.path.join(workdir, "models", "versions"))))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the ML trade filter from closed trades.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--model", help="default: advanced_settings.ml_model_path")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--candles", default=os.environ.get("CANDLE_DIR", CANDLE_DIR))
+    parser.add_argument("--every", type=float, help="seconds between rounds; default: run once")
+    parser.add_argument("--min-new", type=int, default=20)
+    parser.add_argument("--trees-per-round", type=int, default=10)
+    parser.add_argument("--max-trees", type=int, default=200)
+    parser.add_argument("--jobs", type=int, help="CPU workers for tree fitting")
+    parser.add_argument("--allow-feature-change", action="store_true")
+    parser.add_argument("--demo", action="store_true", help="synthetic trades in a temp dir")
+    args = parser.parse_args()
+    if args.demo:
+        demo()
+        return
+
+    with open(args.config) as f:
+        config = json.load(f)
+    model_path = args.model or config.get("advanced_settings", {}).get("ml_model_path") or MODEL_FILE
+    threshold = float(config.get("strategy_filters", {}).get("ml_filter_threshold", 0.65))
+    builder = FeatureBuilder(CandleStore(args.candles), config.get("timeframe", "TIMEFRAME_M15"))
+    retrainer = Retrainer(TradeStore(args.db), model_path, builder, threshold=threshold, min_new=args.min_new,
+                          trees_per_round=args.trees_per_round, max_trees=args.max_trees, jobs=args.jobs,
+                          allow_feature_change=args.allow_feature_change)
+    if args.every:
+        retrainer.run_forever(args.every)
+    else:
+        print(json.dumps(retrainer.run_once(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Batched, memoized scoring for the ML trade filter.
+
+The model at ``advanced_settings.ml_model_path`` is unpickled once and
+warmed up with a dummy row. Each cycle the caller hands over every
+symbol's feature vector at once; rows already scored by the current model
+come from an LRU memo and the rest go through a single ``predict_proba``
+call. Per-batch latency is kept for :meth:`MLScorer.stats`.
+
+Retraining publishes a new model with ``os.replace``; the scorer notices
+the file identity change (checked at most every ``poll_interval`` seconds),
+loads the new model off to the side and swaps it in only once it has
+loaded and warmed up, so a bad file never replaces a working model.
+
+A ``.npz`` model path is read as a pickle-free bundle
+(:mod:`model_bundle`) and scored without scikit-learn.
+
+    python ml_scorer.py --model models/ml_trade_filter.pkl --symbols 9
+"""
+import argparse
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import joblib
+except ImportError:
+    joblib = None
+
+from model_bundle import load_bundle
+
+
+def _load_model(path):
+    if path.endswith(".npz"):
+        return load_bundle(path)
+    # ml_trade_filter.pkl is a joblib dump (arrays stored after the pickle stream)
+    if joblib is not None:
+        return joblib.load(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _file_identity(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, getattr(st, "st_ino", 0))
+
+
+class MLScorer:
+    def __init__(self, model_path, threshold=0.5, memo_size=4096, poll_interval=5.0, loader=_load_model):
+        if np is None:
+            raise RuntimeError("numpy is required for the ML scorer")
+        self.model_path = model_path
+        self.threshold = threshold
+        self.memo_size = memo_size
+        self.poll_interval = poll_interval
+        self.loader = loader
+        self.model = None
+        self.version = 0
+        self._identity = None
+        self._failed_identity = None
+        self._checked_at = 0.0
+        self._memo = OrderedDict()  # (version, row bytes) -> probability
+        self._latencies = deque(maxlen=512)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.memo_hits = 0
+        self.swaps = 0
+        self.swap_errors = 0
+        self.load()
+
+    def load(self):
+        """Load (or reload) the model file; the current model stays on any failure."""
+        identity = _file_identity(self.model_path)
+        model = self.loader(self.model_path)
+        self._warm_up(model)
+        with self._lock:
+            self.model = model
+            self._identity = identity
+            self.version += 1
+            self._memo.clear()
+        return self.version
+
+    def _warm_up(self, model):
+        width = getattr(model, "n_features_in_", None)
+        if width:
+            model.predict_proba(np.zeros((1, int(width))))
+
+    def maybe_reload(self, now=None):
+        """Swap in a republished model file; returns True if a new model was loaded."""
+        now = now or time.monotonic()
+        if now - self._checked_at < self.poll_interval:
+            return False
+        self._checked_at = now
+        identity = None
+        try:
+            identity = _file_identity(self.model_path)
+            if identity in (self._identity, self._failed_identity):
+                return False
+            self.load()
+        except Exception as e:
+            # Don't retry the same broken file every poll
+            self._failed_identity = identity
+            self.swap_errors += 1
+            print(f"ML model reload failed, keeping version {self.version}: {e}")
+            return False
+        self.swaps += 1
+        print(f"ML model reloaded from {self.model_path} (version {self.version})")
+        return True
+
+    def score(self, rows):
+        """Win probabilities for a batch of feature rows (one ``predict_proba`` for the misses)."""
+        self.maybe_reload()
+        started = time.perf_counter()
+        matrix = np.asarray(rows, dtype=np.float64)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        probabilities = np.empty(len(matrix))
+        with self._lock:
+            model, version = self.model, self.version
+            keys = [(version, row.tobytes()) for row in matrix]
+            missing = []
+            for index, key in enumerate(keys):
+                cached = self._memo.get(key)
+                if cached is None:
+                    missing.append(index)
+                else:
+                    self._memo.move_to_end(key)
+                    probabilities[index] = cached
+        if missing:
+            scored = model.predict_proba(matrix[missing])[:, 1]
+            probabilities[missing] = scored
+            with self._lock:
+                for index, probability in zip(missing, scored):
+                    self._memo[keys[index]] = float(probability)
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.batches += 1
+            self.rows += len(matrix)
+            self.memo_hits += len(matrix) - len(missing)
+            self._latencies.append((elapsed_ms, len(matrix), len(missing)))
+        return probabilities
+
+    def score_symbols(self, features_by_symbol):
+        """``{symbol: features}`` -> ``{symbol: probability}`` in one batch."""
+        symbols = list(features_by_symbol)
+        if not symbols:
+            return {}
+        probabilities = self.score([features_by_symbol[s] for s in symbols])
+        return dict(zip(symbols, probabilities.tolist()))
+
+    def allow(self, features_by_symbol):
+        """``{symbol: (passed, probability)}`` against the filter threshold."""
+        return {s: (p >= self.threshold, p) for s, p in self.score_symbols(features_by_symbol).items()}
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(ms for ms, _, _ in self._latencies)
+            last = self._latencies[-1] if self._latencies else None
+            return {
+                "model_path": self.model_path,
+                "version": self.version,
+                "batches": self.batches,
+                "rows": self.rows,
+                "memo_hits": self.memo_hits,
+                "memo_entries": len(self._memo),
+                "swaps": self.swaps,
+                "swap_errors": self.swap_errors,
+                "last_batch": None if last is None else {"ms": round(last[0], 3), "rows": last[1], "scored": last[2]},
+                "batch_p50_ms": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "batch_p99_ms": round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))], 3) if latencies else None,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row and batched scoring for the ML filter.")
+    parser.add_argument("--model", default="models/ml_trade_filter.pkl")
+    parser.add_argument("--symbols", type=int, default=9, help="rows per cycle")
+    parser.add_argument("--cycles", type=int, default=200)
+    args = parser.parse_args()
+
+    scorer = MLScorer(args.model, memo_size=0)
+    width = getattr(scorer.model, "n_features_in_", 10)
+    rng = np.random.default_rng(0)
+    cycles = [rng.normal(size=(args.symbols, width)) for _ in range(args.cycles)]
+
+    started = time.perf_counter()
+    for batch in cycles:
+        for row in batch:
+            scorer.model.predict_proba(row.reshape(1, -1))
+    per_row = (time.perf_counter() - started) * 1000.0 / args.cycles
+
+    started = time.perf_counter()
+    for batch in cycles:
+        scorer.score(batch)
+    batched = (time.perf_counter() - started) * 1000.0 / args.cycles
+
+    print(f"{args.symbols} rows/cycle: per-row {per_row:.2f} ms/cycle, batched {batched:.2f} ms/cycle")
+    print(scorer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Pickle-free model files for the ML trade filter.
+
+A bundle is a plain ``.npz`` archive: one ``header`` entry holding UTF-8
+JSON (format name and version, model kind, feature count, classes, source
+estimator and free-form metadata) plus the numeric arrays the model needs.
+It is read with ``allow_pickle=False``, so loading it cannot run code, and
+:class:`BundleModel` scores it with NumPy alone (no scikit-learn at
+inference time).
+
+Supported models, with probabilities bit-identical to scikit-learn's:
+
+- ``forest``: ``RandomForestClassifier`` / ``ExtraTreesClassifier`` /
+  ``DecisionTreeClassifier``. All trees' nodes are concatenated into flat
+  arrays and every row walks every tree at once, one depth level per step.
+  Rows are cast to float32 as scikit-learn does before comparing with the
+  thresholds, and tree probabilities are summed in estimator order.
+- ``linear``: binary ``LogisticRegression`` / ``SGDClassifier``
+  (``log_loss``), optionally behind a ``StandardScaler`` in a ``Pipeline``.
+
+Export the published model and compare the two paths::
+
+    python model_bundle.py --model models/ml_trade_filter.pkl     # writes models/ml_trade_filter.npz
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy.special import expit as _expit
+except ImportError:
+    _expit = None
+
+FORMAT = "xauusd-ml-bundle"
+FORMAT_VERSION = 1
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _sigmoid(x):
+    if _expit is not None:
+        return _expit(x)
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class BundleModel:
+    """``predict_proba`` over a loaded bundle; exposes ``n_features_in_`` and ``classes_`` like the estimator."""
+
+    def __init__(self, header, arrays):
+        self.header = header
+        self.kind = header["kind"]
+        self.n_features_in_ = int(header["n_features"])
+        self.classes_ = np.array(header["classes"])
+        self.metadata = header.get("metadata", {})
+        self._arrays = arrays
+        if self.kind == "forest":
+            self._left = arrays["left"]
+            self._right = arrays["right"]
+            self._feature = arrays["feature"]
+            self._threshold = arrays["threshold"]
+            self._value = arrays["value"]
+            self._roots = arrays["roots"]
+            self._depth = int(header["max_depth"])
+        elif self.kind == "linear":
+            self._coef = arrays["coef"]
+            self._intercept = arrays["intercept"]
+            self._mean = arrays.get("scaler_mean")
+            self._scale = arrays.get("scaler_scale")
+        else:
+            raise BundleError(f"unknown model kind {self.kind!r}")
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"expected {self.n_features_in_} features, got {X.shape[1]}")
+        return self._forest_proba(X) if self.kind == "forest" else self._linear_proba(X)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def _forest_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, width = X.shape
+        trees = len(self._roots)
+        flat = X.reshape(-1)
+        base = np.repeat(np.arange(n) * width, trees)  # row offset for each (row, tree) pair
+        nodes = np.tile(self._roots, n)
+        left, right, feature, threshold = self._left, self._right, self._feature, self._threshold
+        active = np.flatnonzero(left[nodes] != -1)
+        for _ in range(self._depth):
+            if not len(active):
+                break
+            current = nodes[active]
+            go_left = flat[base[active] + feature[current]] <= threshold[current]
+            current = np.where(go_left, left[current], right[current])
+            nodes[active] = current
+            active = active[left[current] != -1]
+        nodes = nodes.reshape(n, trees)
+        proba = np.zeros((n, self._value.shape[1]))
+        for t in range(nodes.shape[1]):  # estimator order, like the forest's accumulation
+            proba += self._value[nodes[:, t]]
+        if self.header.get("ensemble"):
+            proba /= nodes.shape[1]
+        return proba
+
+    def _linear_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self._mean is not None:
+            X = (X - self._mean) / self._scale
+        scores = X @ self._coef.T + self._intercept
+        prob = _sigmoid(scores.reshape(-1))
+        return np.stack([1 - prob, prob], axis=1)
+
+
+# --- export ---
+
+def _tree_arrays(trees, n_classes):
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for tree in trees:
+        t = tree.tree_
+        count = t.node_count
+        is_leaf = t.children_left == -1
+        left.append(np.where(is_leaf, -1, t.children_left + offset))
+        right.append(np.where(is_leaf, -1, t.children_right + offset))
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(t.threshold)
+        leaf_value = np.array(t.value[:, 0, :n_classes], dtype=np.float64)
+        if (leaf_value.sum(axis=1) > 1.0 + 1e-9).any():
+            # Pre-1.4 trees store class counts; predict_proba normalized them
+            normalizer = leaf_value.sum(axis=1)[:, None]
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_value /= normalizer
+        value.append(leaf_value)
+        roots.append(offset)
+        depth = max(depth, int(t.max_depth))
+        offset += count
+    return {
+        "left": np.concatenate(left).astype(np.int64),
+        "right": np.concatenate(right).astype(np.int64),
+        "feature": np.concatenate(feature).astype(np.int64),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "value": np.concatenate(value),
+        "roots": np.array(roots, dtype=np.int64),
+    }, depth
+
+
+def to_bundle(model):
+    """(header, arrays) for a supported scikit-learn model."""
+    name = type(model).__name__
+    scaler = None
+    if name == "Pipeline":
+        steps = [step for _, step in model.steps]
+        if len(steps) == 2 and type(steps[0]).__name__ == "StandardScaler":
+            scaler, model = steps
+            name = type(model).__name__
+        else:
+            raise BundleError("only StandardScaler -> classifier pipelines are supported")
+    classes = [c.item() if hasattr(c, "item") else c for c in model.classes_]
+    header = {"format": FORMAT, "format_version": FORMAT_VERSION, "source": name,
+              "n_features": int(model.n_features_in_), "classes": classes}
+
+    if hasattr(model, "tree_") or (hasattr(model, "estimators_") and hasattr(model.estimators_[0], "tree_")):
+        if scaler is not None:
+            raise BundleError("trees behind a scaler are not supported")
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise BundleError("multi-output trees are not supported")
+        ensemble = hasattr(model, "estimators_")
+        arrays, depth = _tree_arrays(model.estimators_ if ensemble else [model], len(classes))
+        header.update(kind="forest", max_depth=depth, trees=len(arrays["roots"]), ensemble=ensemble)
+        return header, arrays
+
+    if hasattr(model, "coef_"):
+        if len(classes) != 2:
+            raise BundleError("only binary linear models are supported")
+        if name == "SGDClassifier" and model.loss != "log_loss":
+            raise BundleError("SGDClassifier needs loss='log_loss' for probabilities")
+        arrays = {"coef": np.asarray(model.coef_, dtype=np.float64),
+                  "intercept": np.asarray(model.intercept_, dtype=np.float64)}
+        if scaler is not None:
+            arrays["scaler_mean"] = np.asarray(scaler.mean_, dtype=np.float64)
+            arrays["scaler_scale"] = np.asarray(scaler.scale_, dtype=np.float64)
+        header.update(kind="linear")
+        return header, arrays
+
+    raise BundleError(f"{name} cannot be exported to a bundle")
+
+
+def save_bundle(model, path, metadata=None):
+    """Export ``model`` to ``path`` atomically (temp file + ``os.replace``)."""
+    header, arrays = to_bundle(model)
+    header["created_at"] = datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    header["metadata"] = metadata or {}
+    payload = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".bundle-", suffix=".npz.tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, header=payload, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return header
+
+
+def load_bundle(path):
+    if np is None:
+        raise RuntimeError("numpy is required to load model bundles")
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    try:
+        header = json.loads(arrays.pop("header").tobytes().decode("utf-8"))
+    except (KeyError, ValueError) as e:
+        raise BundleError(f"{path}: missing or unreadable header: {e}")
+    if header.get("format") != FORMAT:
+        raise BundleError(f"{path}: not a {FORMAT} file")
+    if header.get("format_version", 0) > FORMAT_VERSION:
+        raise BundleError(f"{path}: format version {header['format_version']} is newer than {FORMAT_VERSION}")
+    return BundleModel(header, arrays)
+
+
+# --- benchmark / equivalence ---
+
+def fixture_rows(model, rows=2000, seed=7):
+    """Deterministic rows, with values placed exactly on split thresholds for tree models."""
+    rng = np.random.default_rng(seed)
+    width = int(model.n_features_in_)
+    X = rng.normal(size=(rows, width))
+    trees = getattr(model, "estimators_", None) or ([model] if hasattr(model, "tree_") else [])
+    if trees:
+        splits = [(f, th) for tree in trees for f, th in zip(tree.tree_.feature, tree.tree_.threshold) if f >= 0]
+        picks = rng.choice(len(splits), size=min(rows // 2, len(splits) * 4))
+        for row, pick in enumerate(picks):
+            feature, value = splits[pick]
+            X[row, feature] = value  # on the boundary: goes left in both implementations
+    return X
+
+
+def _median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the ML filter to a bundle and compare it with the pickle.")
+    parser.add_argument("--model", default=os.path.join("models", "ml_trade_filter.pkl"))
+    parser.add_argument("--out", help="default: the model path with .npz")
+    parser.add_argument("--rows", type=int, default=2000, help="fixture rows for the equivalence check")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    from ml_scorer import _load_model
+
+    out = args.out or os.path.splitext(args.model)[0] + ".npz"
+    reference = _load_model(args.model)
+    if hasattr(reference, "n_jobs"):
+        reference.set_params(n_jobs=1)  # threaded accumulation has no fixed order
+    save_bundle(reference, out, metadata={"exported_from": os.path.basename(args.model)})
+    bundle = load_bundle(out)
+
+    X = fixture_rows(reference, args.rows)
+    expected = reference.predict_proba(X)
+    actual = bundle.predict_proba(X)
+    identical = expected.shape == actual.shape and np.array_equal(expected, actual)
+    print(f"{bundle.header['source']} -> {out} ({os.path.getsize(out) / 1024:.1f} KB, pickle "
+          f"{os.path.getsize(args.model) / 1024:.1f} KB)")
+    print(f"equivalence on {len(X)} fixture rows: {'identical' if identical else 'DIFFERENT'}"
+          + ("" if identical else f" (max abs diff {np.abs(expected - actual).max():.3g})"))
+
+    load_pickle = _median_ms(lambda: _load_model(args.model), args.repeat)
+    load_npz = _median_ms(lambda: load_bundle(out), args.repeat)
+    row = X[:1]
+    per_row_pickle = _median_ms(lambda: reference.predict_proba(row), args.repeat * 10)
+    per_row_npz = _median_ms(lambda: bundle.predict_proba(row), args.repeat * 10)
+    batch_pickle = _median_ms(lambda: reference.predict_proba(X), args.repeat)
+    batch_npz = _median_ms(lambda: bundle.predict_proba(X), args.repeat)
+    print(f"{'':<22}{'pickle':>12}{'bundle':>12}")
+    print(f"{'load (ms)':<22}{load_pickle:>12.3f}{load_npz:>12.3f}")
+    print(f"{'1 row (ms)':<22}{per_row_pickle:>12.3f}{per_row_npz:>12.3f}")
+    print(f"{f'{len(X)} rows (ms)':<22}{batch_pickle:>12.3f}{batch_npz:>12.3f}")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
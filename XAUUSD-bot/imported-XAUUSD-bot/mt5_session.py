@@ -0,0 +1,254 @@
+"""Long-lived MetaTrader5 session manager.
+
+The MetaTrader5 package talks to a single terminal per process and is not
+thread safe, so every terminal call is funnelled through one worker thread.
+Sessions are kept per (login, server); switching between them uses
+``mt5.login`` on the already-initialized terminal instead of a full
+``shutdown``/``initialize`` handshake.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MT5SessionError(Exception):
+    """Raised when a terminal session cannot be established."""
+
+
+class _LatencyStats:
+    """Rolling latency samples for one operation name."""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms, ok=True):
+        self.samples.append(elapsed_ms)
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if not ok:
+            self.errors += 1
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class MT5SessionManager:
+    """Serializes terminal access and keeps one session per (login, server)."""
+
+    def __init__(self, mt5_module, auto_reconnect=True, health_interval=30.0):
+        self.mt5 = mt5_module
+        self.auto_reconnect = auto_reconnect
+        self.health_interval = health_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt5-session")
+        self._sessions = {}  # (login, server) -> {"password": ..., "connected": bool, ...}
+        self._active = None
+        self._initialized = False
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._reconnects = 0
+        self._last_health = None
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    # --- public API (callable from any thread) ---
+
+    @property
+    def available(self):
+        return self.mt5 is not None
+
+    def start(self):
+        """Start the background health-check loop."""
+        if self._health_thread is None and self.health_interval:
+            self._health_thread = threading.Thread(target=self._health_loop, name="mt5-health", daemon=True)
+            self._health_thread.start()
+
+    def close(self):
+        """Stop health checks and shut the terminal down once."""
+        self._stop.set()
+        try:
+            self._executor.submit(self._shutdown_terminal).result(timeout=10)
+        except Exception as e:
+            print(f"Error shutting down MT5 session: {e}")
+        self._executor.shutdown(wait=False)
+
+    def register(self, login, password, server):
+        """Remember credentials for a session without connecting."""
+        key = (int(login), server)
+        session = self._sessions.setdefault(key, {"connected": False, "last_error": None})
+        session["password"] = password
+        return key
+
+    def password_for(self, login, server):
+        """The password registered for (login, server), or None; kept in memory only."""
+        try:
+            key = (int(login), server)
+        except (TypeError, ValueError):
+            return None
+        return self._sessions.get(key, {}).get("password")
+
+    def submit(self, func, session=None, op="call"):
+        """Queue ``func(mt5)`` on the terminal thread and return a Future."""
+        if self.mt5 is None:
+            raise MT5SessionError("MetaTrader5 is not available in this deployment.")
+        return self._executor.submit(self._run, func, session, op)
+
+    def run(self, func, session=None, op="call", timeout=30.0):
+        """Run ``func(mt5)`` on the terminal thread and wait for its result."""
+        return self.submit(func, session, op).result(timeout=timeout)
+
+    def submit_connect(self, login, password, server):
+        """Queue a login to (login, server); the Future resolves to ``account_info``."""
+        key = self.register(login, password, server)
+        return self.submit(lambda mt5: self._require_account_info(), session=key, op="connect")
+
+    def connect(self, login, password, server, timeout=30.0):
+        """Log into (login, server), returning its ``account_info``."""
+        return self.submit_connect(login, password, server).result(timeout=timeout)
+
+    def submit_disconnect(self, login, server):
+        """Queue forgetting a session on the terminal thread; the terminal stays up for the others."""
+        key = (int(login), server)
+        return self._executor.submit(self._forget, key)
+
+    def disconnect(self, login, server, timeout=30.0):
+        """Forget a session; the terminal stays up for the others."""
+        return self.submit_disconnect(login, server).result(timeout=timeout)
+
+    def metrics(self):
+        with self._stats_lock:
+            ops = {name: stats.snapshot() for name, stats in self._stats.items()}
+        return {
+            "available": self.available,
+            "initialized": self._initialized,
+            "active_session": self._format_key(self._active),
+            "sessions": [
+                {"session": self._format_key(key), "connected": s["connected"], "last_error": s["last_error"]}
+                for key, s in list(self._sessions.items())
+            ],
+            "auto_reconnect": self.auto_reconnect,
+            "reconnects": self._reconnects,
+            "last_health_check": self._last_health,
+            "operations": ops,
+        }
+
+    # --- terminal thread only ---
+
+    def _run(self, func, session, op):
+        start = time.perf_counter()
+        ok = False
+        try:
+            if session is not None:
+                self._activate(session)
+            result = func(self.mt5)
+            ok = True
+            return result
+        finally:
+            self._record(op, (time.perf_counter() - start) * 1000.0, ok)
+
+    def _activate(self, key, force=False):
+        session = self._sessions.get(key)
+        if session is None:
+            raise MT5SessionError(f"Unknown MT5 session {self._format_key(key)}")
+        if not force and self._active == key and session["connected"]:
+            return
+        login, server = key
+        if not self._initialized:
+            if not self.mt5.initialize(login=login, password=session["password"], server=server):
+                error = f"Failed to initialize MT5 terminal. Error: {self.mt5.last_error()}"
+                session["last_error"] = error
+                raise MT5SessionError(error)
+            self._initialized = True
+        if not self.mt5.login(login=login, password=session["password"], server=server):
+            error = f"MT5 login failed. Error: {self.mt5.last_error()}"
+            session["connected"] = False
+            session["last_error"] = error
+            # A failed login can leave the terminal on no account at all
+            self._active = None
+            raise MT5SessionError(error)
+        session["connected"] = True
+        session["last_error"] = None
+        self._active = key
+
+    def _forget(self, key):
+        self._sessions.pop(key, None)
+        if self._active == key:
+            self._active = None
+
+    def _require_account_info(self):
+        acc_info = self.mt5.account_info()
+        if acc_info is None:
+            raise MT5SessionError(f"Failed to fetch account info. Error: {self.mt5.last_error()}")
+        return acc_info
+
+    def _shutdown_terminal(self):
+        if self._initialized and self.mt5 is not None:
+            self.mt5.shutdown()
+        self._initialized = False
+        self._active = None
+        for session in self._sessions.values():
+            session["connected"] = False
+
+    def _health_check(self):
+        self._last_health = time.time()
+        if not self._initialized or self._active is None:
+            return
+        if self.mt5.terminal_info() is not None and self.mt5.account_info() is not None:
+            return
+        session = self._sessions.get(self._active)
+        if session is not None:
+            session["connected"] = False
+            session["last_error"] = f"Health check failed. Error: {self.mt5.last_error()}"
+        if not self.auto_reconnect:
+            # Nothing is logged in any more; the next call for this session logs in again
+            self._active = None
+            return
+        key = self._active
+        print(f"MT5 session {self._format_key(key)} unhealthy, reconnecting...")
+        self._shutdown_terminal()
+        self._reconnects += 1
+        try:
+            self._activate(key, force=True)
+        except MT5SessionError as e:
+            print(f"MT5 reconnect failed: {e}")
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            if self.mt5 is None:
+                continue
+            try:
+                self.submit(lambda mt5: self._health_check(), op="health_check").result(timeout=60)
+            except Exception as e:
+                print(f"MT5 health check error: {e}")
+
+    # --- helpers ---
+
+    def _record(self, op, elapsed_ms, ok):
+        with self._stats_lock:
+            stats = self._stats.get(op)
+            if stats is None:
+                stats = self._stats[op] = _LatencyStats()
+            stats.add(elapsed_ms, ok)
+
+    @staticmethod
+    def _format_key(key):
+        return f"{key[0]}@{key[1]}" if key else None
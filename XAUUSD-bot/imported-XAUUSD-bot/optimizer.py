@@ -0,0 +1,625 @@
+"""Walk-forward search over the strategy filters, session windows and ML threshold.
+
+The knobs are the hand-tuned values in config.json:
+
+- ``strategy_filters``: ``killzone_filter``, ``news_filter``,
+  ``volatility_filter``, ``trend_filter`` and ``ml_filter_threshold``
+- ``trading_sessions``: each of london / new_york / asian is ``off``,
+  ``on`` (its configured window) or ``wide`` (one hour earlier and later)
+
+Work is split in two stages:
+
+1. **Prepare** (once per symbol x strategy, cached on disk): the strategy
+   runs over every bar exactly as in :mod:`backtest`, and its signals,
+   ML probabilities (one batched ``predict_proba``), ATR, EMA and
+   volatility ratio are written as ``.npy`` arrays under
+   ``.cache/optimizer/<key>/``. The key covers the bar data, strategy,
+   window and model identity, so later runs and every parameter set reuse them.
+2. **Evaluate** (process pool): workers memory-map those arrays read-only
+   (the page cache is shared, nothing is copied per task), apply a
+   parameter set's filters to the cached signals only, and replay the
+   survivors through :class:`backtest.SimBroker` and
+   :class:`backtest.RiskStage` (the live pre-trade risk checks), skipping
+   bars while flat.
+
+Walk-forward: the common time range is cut into ``folds + train_blocks``
+blocks; fold ``k`` trains on blocks ``k .. k+train_blocks-1`` and tests
+on the next one. Every parameter set is scored in and out of sample on
+every fold. The results table is ranked by mean in-sample score; the
+stitched out-of-sample result of each fold's in-sample winner is the
+honest estimate, and the winner of the most recent fold is written as the
+best config.
+
+Filter definitions used here (the live ones live in the STOCKDATA bot):
+killzones are 07:00-10:00 and 12:00-15:00 UTC; the volatility filter
+wants ATR(14) between 0.5x and 2.5x its 100-bar mean; the trend filter
+wants buys above and sells below EMA(50); the news filter blocks +-30
+minutes around events from ``--news`` (without a calendar it is left out
+of the search).
+
+    python optimizer.py --data candles/ --symbols XAUUSD --strategies backtest:ema_cross --method grid
+    python optimizer.py --method random --trials 200 --out optimizer_results/
+    python optimizer.py --method bayes --trials 150      # needs optuna; falls back to random
+"""
+import argparse
+import copy
+import csv
+import datetime
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import optuna
+except ImportError:
+    optuna = None
+
+from backtest import (CONFIG_FILE, MLGate, RiskStage, SimBroker, find_bars, load_bars, normalize_signal,
+                      resolve_strategy, risk_stage_config)
+from feature_engine import batch_atr
+from scan_scheduler import SESSION_FLAGS, SESSION_NAMES, clock_minutes, session_windows
+
+CACHE_DIR = os.path.join(".cache", "optimizer")
+CACHE_VERSION = 2
+SESSIONS = SESSION_NAMES
+SESSION_MODES = ("off", "on", "wide")
+ML_THRESHOLDS = (0.5, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85)
+KILLZONES = ((7 * 60, 10 * 60), (12 * 60, 15 * 60))  # minutes of the UTC day
+VOLATILITY_BAND = (0.5, 2.5)
+TREND_EMA = 50
+NEWS_BLACKOUT_SECONDS = 30 * 60
+OBJECTIVES = ("return_dd", "net_pnl", "profit_factor")
+
+
+# --- search space ---
+
+def search_space(has_ml=True, has_news=True):
+    """Knob -> candidate values; knobs without data to evaluate them are fixed."""
+    space = {
+        "killzone_filter": (False, True),
+        "news_filter": (False, True) if has_news else (False,),
+        "volatility_filter": (False, True),
+        "trend_filter": (False, True),
+    }
+    for name in SESSIONS:
+        space[f"{name}_session"] = SESSION_MODES
+    space["ml_filter_threshold"] = ML_THRESHOLDS if has_ml else (0.0,)
+    return space
+
+
+def grid(space):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_sets(space, trials, seed=0):
+    """``trials`` distinct parameter sets drawn uniformly (the whole grid if it is smaller)."""
+    keys = list(space)
+    sizes = [len(space[k]) for k in keys]
+    total = math.prod(sizes)
+    rng = random.Random(seed)
+    picks = rng.sample(range(total), min(trials, total))
+    sets = []
+    for index in picks:
+        params = {}
+        for key, size in zip(reversed(keys), reversed(sizes)):
+            index, digit = divmod(index, size)
+            params[key] = space[key][digit]
+        sets.append({k: params[k] for k in keys})
+    return sets
+
+
+def param_windows(params, trading_sessions):
+    """[(start, end)] UTC minutes for the sessions ``params`` turns on; windows may wrap midnight.
+
+    ``on`` is the configured window (``scan_scheduler.session_windows``), whether or not it is active now.
+    """
+    windows = []
+    for name, start, end in session_windows(trading_sessions, enabled_only=False):
+        mode = params.get(f"{name}_session", "on")
+        if mode == "off":
+            continue
+        start, end = clock_minutes(start), clock_minutes(end)
+        if mode == "wide":
+            start, end = (start - 60) % 1440, (end + 60) % 1440
+        windows.append((start, end))
+    return windows
+
+
+def apply_params(config, params, space=None):
+    """Copy of ``config`` with ``params`` written into strategy_filters and trading_sessions.
+
+    Knobs ``space`` fixes to a single value were never evaluated, so the
+    config keeps its own setting for them.
+    """
+    config = copy.deepcopy(config)
+    searched = {k for k in params if space is None or len(space.get(k, ())) > 1}
+    filters = config.setdefault("strategy_filters", {})
+    for key in ("killzone_filter", "news_filter", "volatility_filter", "trend_filter"):
+        if key in searched:
+            filters[key] = bool(params[key])
+    if "ml_filter_threshold" in searched and params.get("ml_filter_threshold"):
+        filters["ml_filter_threshold"] = params["ml_filter_threshold"]
+    sessions = config.setdefault("trading_sessions", {})
+    for name in SESSIONS:
+        if f"{name}_session" not in searched:
+            continue
+        mode = params[f"{name}_session"]
+        window = sessions.setdefault(name, {})
+        window["active"] = mode != "off"
+        sessions[SESSION_FLAGS[name]] = mode != "off"
+        if mode == "wide" and window.get("start") and window.get("end"):
+            window["start"] = "%02d:%02d" % divmod((clock_minutes(window["start"]) - 60) % 1440, 60)
+            window["end"] = "%02d:%02d" % divmod((clock_minutes(window["end"]) + 60) % 1440, 60)
+    return config
+
+
+# --- stage 1: prepared datasets ---
+
+def _source_identity(path):
+    if os.path.isdir(path):
+        meta = os.path.join(path, "meta.json")
+        with open(meta) as f:
+            rows = json.load(f).get("rows")
+        return ["store", rows, os.stat(os.path.join(path, "close.bin")).st_mtime_ns]
+    st = os.stat(path)
+    return ["file", st.st_size, st.st_mtime_ns]
+
+
+def dataset_key(spec):
+    model = spec.get("ml_model_path")
+    model_id = list(os.stat(model)[6:9]) if model and os.path.exists(model) else None
+    payload = [CACHE_VERSION, os.path.abspath(spec["bars"]), _source_identity(spec["bars"]), spec["strategy"],
+               spec["candle_count"], model, model_id]
+    return hashlib.sha1(json.dumps(payload, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def prepare_dataset(spec):
+    """Run the strategy over every bar once and store signals and indicators; returns (dir, cached)."""
+    target = os.path.join(spec["cache_dir"], dataset_key(spec))
+    if os.path.exists(os.path.join(target, "meta.json")):
+        return target, True
+    started = time.perf_counter()
+    df = load_bars(spec["bars"])
+    n = len(df)
+    ts, high, low, close = (df[c].to_numpy(dtype=np.float64) for c in ("time", "high", "low", "close"))
+    strategy = resolve_strategy(spec["strategy"])
+    takes_symbol = len(inspect.signature(strategy).parameters) > 1
+    window = spec["candle_count"]
+
+    side = np.zeros(n, dtype=np.int8)
+    sl = np.full(n, np.nan)
+    tp = np.full(n, np.nan)
+    atr = batch_atr(high, low, close)
+    features, feature_rows = [], []
+    for i in range(n):
+        if i + 1 < window:
+            continue
+        bars = df.iloc[i + 1 - window:i + 1]
+        signal = normalize_signal(strategy(bars, spec["symbol"]) if takes_symbol else strategy(bars))
+        if signal is None:
+            continue
+        side[i] = 1 if signal["side"] == "buy" else -1
+        if signal["sl"]:
+            sl[i] = float(signal["sl"])
+        if signal["tp"]:
+            tp[i] = float(signal["tp"])
+        if signal["features"] is not None:
+            features.append(signal["features"])
+            feature_rows.append(i)
+
+    # One batched predict_proba for every signal that carries features
+    ml_prob = np.full(n, np.nan)
+    gate = MLGate(spec.get("ml_model_path"), 0.0)
+    if gate.scorer is not None and features:
+        ml_prob[feature_rows] = gate.scorer.score(features)
+
+    ema = df["close"].ewm(span=TREND_EMA, adjust=False).mean().to_numpy()
+    atr_series = pd.Series(atr)
+    vol_ratio = (atr_series / atr_series.rolling(100, min_periods=20).mean()).to_numpy()
+    arrays = {
+        "time": ts.astype(np.int64), "high": high, "low": low, "close": close,
+        "side": side, "sl": sl, "tp": tp, "ml_prob": ml_prob, "atr": atr, "ema": ema, "vol_ratio": vol_ratio,
+        "minute": ((ts.astype(np.int64) % 86400) // 60).astype(np.int16),
+        "signal_index": np.flatnonzero(side).astype(np.int64),
+    }
+    tmp = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), values)
+    meta = {"symbol": spec["symbol"], "strategy": spec["strategy"], "bars": n, "signals": int(len(arrays["signal_index"])),
+            "ml_scored": len(feature_rows) if gate.scorer is not None else 0,
+            "prepare_seconds": round(time.perf_counter() - started, 3)}
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp, target)
+    except OSError:  # another process prepared it first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target, False
+
+
+_datasets = {}  # dataset dir -> {name: read-only memmap}, per process
+
+
+def open_dataset(path):
+    data = _datasets.get(path)
+    if data is None:
+        data = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+                for name in os.listdir(path) if name.endswith(".npy")}
+        _datasets[path] = data
+    return data
+
+
+# --- stage 2: evaluation ---
+
+def _accepted(data, candidates, params, windows, news_times):
+    """The ``candidates`` signal bars that pass ``params``' filters."""
+    if not len(candidates):
+        return candidates
+    keep = np.zeros(len(candidates), dtype=bool)
+    minute = data["minute"][candidates]
+    for start, end in windows:
+        keep |= ((minute >= start) & (minute < end)) if start <= end else ((minute >= start) | (minute < end))
+    if params["killzone_filter"]:
+        in_zone = np.zeros(len(candidates), dtype=bool)
+        for start, end in KILLZONES:
+            in_zone |= (minute >= start) & (minute < end)
+        keep &= in_zone
+    if params["volatility_filter"]:
+        ratio = data["vol_ratio"][candidates]
+        keep &= (ratio >= VOLATILITY_BAND[0]) & (ratio <= VOLATILITY_BAND[1])
+    side = data["side"][candidates]
+    if params["trend_filter"]:
+        above = data["close"][candidates] > data["ema"][candidates]
+        keep &= np.where(side > 0, above, ~above)
+    threshold = params.get("ml_filter_threshold") or 0.0
+    if threshold:
+        prob = data["ml_prob"][candidates]
+        keep &= np.isnan(prob) | (prob >= threshold)
+    if params["news_filter"] and news_times is not None and len(news_times):
+        t = data["time"][candidates]
+        nearest = np.searchsorted(news_times, t)
+        after = news_times[np.minimum(nearest, len(news_times) - 1)]
+        before = news_times[np.maximum(nearest - 1, 0)]
+        keep &= (np.abs(after - t) > NEWS_BLACKOUT_SECONDS) & (np.abs(t - before) > NEWS_BLACKOUT_SECONDS)
+    return candidates[keep]
+
+
+def simulate(data, entries, bar_lo, bar_hi, settings, symbol):
+    """Replay ``entries`` (signal bar indices) through the broker and risk stage over ``[bar_lo, bar_hi)``."""
+    ts, high, low, close = data["time"], data["high"], data["low"], data["close"]
+    side, sl_arr, tp_arr, atr = data["side"], data["sl"], data["tp"], data["atr"]
+    risk = RiskStage(settings["risk_config"], symbol, settings["contract_size"], settings["point"], settings["spread"])
+    broker = SimBroker(settings["balance"], settings["contract_size"], settings["spread"], settings["slippage"],
+                       on_close=risk.closed)
+    position = bar_lo
+    for i in entries.tolist():
+        # Only bars with something open can change state; flat stretches are skipped
+        j = position
+        while broker.positions and j < i:
+            broker.on_bar(int(ts[j]), high[j], low[j], close[j])
+            j += 1
+        broker.on_bar(int(ts[i]), high[i], low[i], close[i])
+        position = i + 1
+        direction = "buy" if side[i] > 0 else "sell"
+        price = float(close[i])
+        sign = 1.0 if side[i] > 0 else -1.0
+        if math.isnan(sl_arr[i]) and math.isnan(atr[i]):
+            risk.skip("atr_warmup")
+            continue
+        sl = float(sl_arr[i]) if not math.isnan(sl_arr[i]) else price - sign * 1.5 * float(atr[i])
+        tp = float(tp_arr[i]) if not math.isnan(tp_arr[i]) else price + sign * 2.0 * abs(price - sl)
+        volume = risk.lot_size(broker.balance, price, sl)
+        if not risk.check(broker, direction, price, sl, volume, int(ts[i])):
+            continue
+        ticket, entry = broker.open(int(ts[i]), direction, price, sl, tp, volume)
+        risk.opened(broker, ticket, direction, volume, entry, sl)
+    j = position
+    while broker.positions and j < bar_hi:
+        broker.on_bar(int(ts[j]), high[j], low[j], close[j])
+        j += 1
+    if broker.positions and bar_hi > bar_lo:
+        broker.close_all(int(ts[bar_hi - 1]), float(close[bar_hi - 1]))
+    profits = [t["profit"] for t in broker.trades]
+    return {
+        "trades": len(profits),
+        "wins": sum(1 for p in profits if p > 0),
+        "net_pnl": broker.balance - settings["balance"],
+        "gross_profit": sum(p for p in profits if p > 0),
+        "gross_loss": -sum(p for p in profits if p < 0),
+        "max_drawdown": broker.max_drawdown,
+    }
+
+
+def _combine(parts):
+    total = {"trades": 0, "wins": 0, "net_pnl": 0.0, "gross_profit": 0.0, "gross_loss": 0.0, "max_drawdown": 0.0}
+    for part in parts:
+        for key in total:
+            total[key] += part[key]  # drawdowns add up: a conservative bound for the combined book
+    return total
+
+
+def score(metrics, objective, min_trades):
+    if metrics["trades"] < min_trades:
+        return float("-inf")
+    if objective == "net_pnl":
+        return metrics["net_pnl"]
+    if objective == "profit_factor":
+        return metrics["gross_profit"] / metrics["gross_loss"] if metrics["gross_loss"] else float("inf")
+    return metrics["net_pnl"] / max(1.0, abs(metrics["max_drawdown"]))
+
+
+_worker = {}
+
+
+def _init_worker(datasets, folds, settings):
+    _worker.update(datasets=datasets, folds=folds, settings=settings)
+    for path in datasets:
+        open_dataset(path)
+
+
+def evaluate(params):
+    """In- and out-of-sample metrics for one parameter set on every fold (runs in a worker)."""
+    settings = _worker["settings"]
+    windows = param_windows(params, settings["trading_sessions"])
+    news = settings.get("news_times")
+    results = []
+    for fold in _worker["folds"]:
+        segments = {}
+        for segment, (start, stop) in (("train", fold["train"]), ("test", fold["test"])):
+            parts = []
+            for path in _worker["datasets"]:
+                data = open_dataset(path)
+                bar_lo, bar_hi = np.searchsorted(data["time"], [start, stop])
+                sig = data["signal_index"]
+                lo, hi = np.searchsorted(sig, [bar_lo, bar_hi])
+                entries = _accepted(data, sig[lo:hi], params, windows, news)
+                parts.append(simulate(data, entries, int(bar_lo), int(bar_hi), settings,
+                                      settings["dataset_symbols"][path]))
+            metrics = _combine(parts)
+            segments[segment] = dict(metrics, score=score(metrics, settings["objective"], settings["min_trades"]))
+        results.append(segments)
+    return params, results
+
+
+def walk_forward_folds(datasets, folds, train_blocks):
+    """Rolling (train, test) epoch ranges over the time span the datasets share."""
+    starts, ends = [], []
+    for path in datasets:
+        t = open_dataset(path)["time"]
+        if len(t):
+            starts.append(int(t[0]))
+            ends.append(int(t[-1]) + 1)
+    if not starts:
+        raise ValueError("No bars to optimize on")
+    lo, hi = max(starts), min(ends)
+    if hi <= lo:
+        lo, hi = min(starts), max(ends)
+    blocks = folds + train_blocks
+    edges = [lo + (hi - lo) * k // blocks for k in range(blocks + 1)]
+    return [{"train": (edges[k], edges[k + train_blocks]), "test": (edges[k + train_blocks], edges[k + train_blocks + 1])}
+            for k in range(folds)]
+
+
+# --- driver ---
+
+def _mean(values):
+    """Mean score; a fold that fails ``min_trades`` (-inf) sinks the whole set."""
+    if not values or any(v == float("-inf") for v in values):
+        return float("-inf")
+    return sum(values) / len(values)
+
+
+def summarize(evaluated, folds):
+    """Rank rows by mean in-sample score and stitch each fold's in-sample winner out of sample."""
+    rows = []
+    for params, results in evaluated:
+        oos = _combine([r["test"] for r in results])
+        rows.append({
+            "params": params,
+            "is_score": _mean([r["train"]["score"] for r in results]),
+            "oos_score": _mean([r["test"]["score"] for r in results]),
+            "oos_trades": oos["trades"],
+            "oos_win_rate": round(100.0 * oos["wins"] / oos["trades"], 2) if oos["trades"] else 0.0,
+            "oos_net_pnl": round(oos["net_pnl"], 2),
+            "oos_max_drawdown": round(oos["max_drawdown"], 2),
+            "folds_won": 0,
+        })
+    walk = []
+    for k, fold in enumerate(folds):
+        best = max(range(len(evaluated)), key=lambda n: evaluated[n][1][k]["train"]["score"])
+        rows[best]["folds_won"] += 1
+        test = evaluated[best][1][k]["test"]
+        walk.append({"fold": k + 1, "train": _dates(fold["train"]), "test": _dates(fold["test"]),
+                     "params": evaluated[best][0], "is_score": _finite(evaluated[best][1][k]["train"]["score"]),
+                     "oos_score": _finite(test["score"]), "oos_trades": test["trades"],
+                     "oos_net_pnl": round(test["net_pnl"], 2)})
+    rows.sort(key=lambda r: (r["is_score"], r["oos_score"]), reverse=True)
+    for rank, row in enumerate(rows, 1):
+        row["rank"] = rank
+    return rows, walk
+
+
+def _dates(span):
+    return [datetime.datetime.utcfromtimestamp(t).strftime("%Y-%m-%d %H:%M") for t in span]
+
+
+def _finite(value):
+    return round(value, 4) if math.isfinite(value) else None
+
+
+def run_search(method, space, pool, trials, seed, workers):
+    """Evaluate parameter sets with grid, random or (optuna) Bayesian search."""
+    if method == "bayes" and optuna is None:
+        print("optuna is not installed; using random search instead")
+        method = "random"
+    if method != "bayes":
+        sets = grid(space) if method == "grid" else random_sets(space, trials, seed)
+        return list(pool.map(evaluate, sets, chunksize=max(1, len(sets) // (workers * 4))))
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study = optuna.create_study(direction="maximize", sampler=optuna.samplers.TPESampler(seed=seed))
+    evaluated = []
+    while len(evaluated) < trials:
+        batch = [study.ask() for _ in range(min(workers, trials - len(evaluated)))]
+        sets = [{key: trial.suggest_categorical(key, list(values)) for key, values in space.items()} for trial in batch]
+        for trial, (params, results) in zip(batch, pool.map(evaluate, sets)):
+            value = _mean([r["train"]["score"] for r in results])
+            study.tell(trial, value if math.isfinite(value) else -1e12)
+            evaluated.append((params, results))
+    return evaluated
+
+
+def write_results(out_dir, rows, walk, best_config, space):
+    os.makedirs(out_dir, exist_ok=True)
+    keys = list(space)
+    with open(os.path.join(out_dir, "results.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", *keys, "is_score", "oos_score", "oos_trades", "oos_win_rate", "oos_net_pnl",
+                         "oos_max_drawdown", "folds_won"])
+        for r in rows:
+            writer.writerow([r["rank"], *(r["params"][k] for k in keys), _finite(r["is_score"]),
+                             _finite(r["oos_score"]), r["oos_trades"], r["oos_win_rate"], r["oos_net_pnl"],
+                             r["oos_max_drawdown"], r["folds_won"]])
+    with open(os.path.join(out_dir, "walk_forward.json"), "w") as f:
+        json.dump(walk, f, indent=2)
+    with open(os.path.join(out_dir, "best_config.json"), "w") as f:
+        json.dump(best_config, f, indent=2)
+
+
+def _load_news(path):
+    """Sorted epoch seconds from a JSON list or a CSV whose first column is a time."""
+    if not path:
+        return None
+    with open(path) as f:
+        values = json.load(f) if path.endswith(".json") else [line.split(",")[0] for line in f if line.strip()]
+    times = []
+    for value in values:
+        if isinstance(value, dict):
+            value = value.get("time") or value.get("timestamp") or value.get("date")
+        try:
+            times.append(float(value))
+        except (TypeError, ValueError):
+            try:
+                stamp = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            except ValueError:
+                continue  # header or unparseable row
+            if stamp.tzinfo is None:
+                stamp = stamp.replace(tzinfo=datetime.timezone.utc)
+            times.append(stamp.timestamp())
+    return np.array(sorted(times), dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data", help="candle store root or directory of bar files")
+    parser.add_argument("--symbols", nargs="+", help="default: config symbols")
+    parser.add_argument("--strategies", nargs="+", help="default: config selected_strategies")
+    parser.add_argument("--timeframe", help="default: config timeframe")
+    parser.add_argument("--candle-count", type=int, help="strategy window; default: config candle_count")
+    parser.add_argument("--ml-model", help="default: advanced_settings.ml_model_path")
+    parser.add_argument("--news", help="economic calendar: JSON list or CSV of event times")
+    parser.add_argument("--method", choices=("grid", "random", "bayes"), default="random")
+    parser.add_argument("--trials", type=int, default=200, help="parameter sets for random / bayes")
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--train-blocks", type=int, default=3, help="train window length in test-window units")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="return_dd")
+    parser.add_argument("--min-trades", type=int, default=5, help="per fold segment, else the score is -inf")
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--contract-size", type=float, default=100.0)
+    parser.add_argument("--point", type=float, default=0.01, help="price units per point (max_spread / max_slippage)")
+    parser.add_argument("--spread", type=float, default=0.0)
+    parser.add_argument("--slippage", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--out", default="optimizer_results")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("numpy is required for the optimizer")
+
+    with open(args.config) as f:
+        config = json.load(f)
+    timeframe = args.timeframe or config.get("timeframe", "TIMEFRAME_M15")
+    specs = [{"symbol": symbol, "strategy": strategy, "bars": find_bars(args.data, symbol, timeframe),
+              "candle_count": args.candle_count or int(config.get("candle_count", 50)),
+              "ml_model_path": args.ml_model or config.get("advanced_settings", {}).get("ml_model_path"),
+              "cache_dir": args.cache_dir}
+             for symbol in args.symbols or config.get("symbols", [])
+             for strategy in args.strategies or config.get("selected_strategies", [])]
+    os.makedirs(args.cache_dir, exist_ok=True)
+    workers = max(1, args.workers)
+
+    started = time.perf_counter()
+    datasets, metas = [], []
+    with ProcessPoolExecutor(max_workers=min(workers, len(specs) or 1)) as pool:
+        for spec, (path, cached) in zip(specs, pool.map(prepare_dataset, specs)):
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            state = "cached" if cached else f"prepared in {meta['prepare_seconds']}s"
+            print(f"{spec['symbol']} {spec['strategy']}: {meta['bars']} bars, {meta['signals']} signals ({state})")
+            datasets.append(path)
+            metas.append(meta)
+    prepare_seconds = time.perf_counter() - started
+
+    has_ml = any(meta["ml_scored"] for meta in metas)
+    news_times = _load_news(args.news)
+    space = search_space(has_ml=has_ml, has_news=news_times is not None and len(news_times) > 0)
+    fixed = [k for k, v in space.items() if len(v) == 1]
+    if fixed:
+        print(f"Not searched (no data to evaluate them): {', '.join(fixed)}")
+    folds = walk_forward_folds(datasets, args.folds, args.train_blocks)
+    settings = {
+        "risk_config": risk_stage_config(config),
+        "trading_sessions": config.get("trading_sessions", {}),
+        "dataset_symbols": {path: meta["symbol"] for path, meta in zip(datasets, metas)},
+        "balance": args.balance, "contract_size": args.contract_size, "point": args.point,
+        "spread": args.spread, "slippage": args.slippage,
+        "objective": args.objective, "min_trades": args.min_trades, "news_times": news_times,
+    }
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(datasets, folds, settings)) as pool:
+        evaluated = run_search(args.method, space, pool, args.trials, args.seed, workers)
+    search_seconds = time.perf_counter() - started
+
+    rows, walk = summarize(evaluated, folds)
+    best = walk[-1]["params"]
+    write_results(args.out, rows, walk, apply_params(config, best, space), space)
+
+    evaluations = len(evaluated) * len(folds) * 2 * len(datasets)
+    print(f"{len(evaluated)} parameter sets x {len(folds)} folds in {search_seconds:.2f}s "
+          f"({evaluations / search_seconds if search_seconds > 0 else 0:.0f} segment replays/s; "
+          f"prepare {prepare_seconds:.2f}s)")
+    print(f"{'rank':>4} {'is score':>10} {'oos score':>10} {'oos trades':>10} {'oos net':>10} {'won':>4}  params")
+    for r in rows[:10]:
+        print(f"{r['rank']:>4} {_finite(r['is_score']) or '-':>10} {_finite(r['oos_score']) or '-':>10} "
+              f"{r['oos_trades']:>10} {r['oos_net_pnl']:>10} {r['folds_won']:>4}  {r['params']}")
+    stitched = sum(w["oos_net_pnl"] for w in walk)
+    print(f"Walk-forward out-of-sample net P&L (each fold's in-sample winner): {stitched:.2f}")
+    print(f"Best config (latest fold's winner) written to {os.path.join(args.out, 'best_config.json')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Pre-trade risk checks evaluated in one pass against an in-memory exposure book.
+
+The safety rules from the README and ``risk_settings`` / ``advanced_settings``:
+
+- ``max_risk_per_trade``: money at the stop as a percent of equity (3%)
+- ``max_total_exposure``: open risk plus this order, percent of equity (10%)
+- ``max_currency_exposure``: the same per currency (XAUUSD counts for XAU and USD)
+- ``loss_cooldown``: no entries for ``loss_cooldown_minutes`` after
+  ``loss_cooldown_count`` consecutive losses (3)
+- ``opposing_trade``: no buy while a sell is open on the symbol, and vice versa
+- ``multiple_trades``: one position per symbol unless ``allow_multiple_trades``
+- ``max_open_trades``, ``max_spread`` and ``max_slippage`` (points)
+
+:func:`compile_rules` turns the config into a flat :class:`RiskRules` once
+per config change, so a check does no dict lookups or parsing. The
+:class:`ExposureBook` keeps money at risk per symbol and per currency and
+open sides per symbol, updated when positions open and close, so a check
+is O(1) in the number of open positions. Every rule is evaluated and all
+failures come back together as ``{"rule", "message", "value", "limit"}``.
+
+Daily trade counts and P&L limits live in :mod:`risk_state`, which is
+shared across processes; this engine covers the per-order rules.
+
+    python pretrade_risk.py --positions 50 --checks 100000
+"""
+import argparse
+import math
+import numbers
+import sys
+import time
+from collections import namedtuple
+
+Position = namedtuple("Position", "ticket symbol side volume risk")
+SymbolSpec = namedtuple("SymbolSpec", "point value_per_unit")
+
+# Internal side codes; callers pass "buy"/"sell" or MT5 type codes, never these
+BUY, SELL = 1, -1
+
+
+def symbol_currencies(symbol):
+    """(base, quote) for FX and metals like ``XAUUSD``; the symbol itself for indices and stocks."""
+    head = symbol[:6]
+    if len(head) == 6 and head.isalpha():
+        return head[:3].upper(), head[3:].upper()
+    return (symbol.upper(),)
+
+
+def _side(value):
+    """BUY or SELL for ``"buy"``/``"sell"`` (or long/short) and MT5 order/position types.
+
+    Integers are MT5 codes, as in ``ml_retrain``: 0 = buy, 1 = sell
+    (ORDER_TYPE_* and POSITION_TYPE_*), so 1 is a sell here. Whole floats
+    and NumPy scalars (``0.0``, ``np.int64(1)``) count as the same codes.
+    """
+    if isinstance(value, numbers.Real) and not isinstance(value, bool) and float(value).is_integer():
+        value = int(value)
+    text = str(value).strip().lower()
+    if text in ("buy", "long", "0"):
+        return BUY
+    if text in ("sell", "short", "1"):
+        return SELL
+    raise ValueError(f"unknown trade side: {value!r}")
+
+
+def _setting(sections, key, default):
+    for section in sections:
+        value = section.get(key)
+        if value is not None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                pass
+    return default
+
+
+class RiskRules:
+    """Flat, pre-parsed limits; ``0`` or ``inf`` disables a limit."""
+
+    __slots__ = ("max_risk_pct", "max_total_pct", "max_currency_pct", "max_open", "allow_multiple",
+                 "cooldown_losses", "cooldown_seconds", "max_spread", "max_slippage", "missing_stop_pct")
+
+    def __init__(self, max_risk_pct=3.0, max_total_pct=10.0, max_currency_pct=None, max_open=math.inf,
+                 allow_multiple=True, cooldown_losses=3, cooldown_seconds=3600.0, max_spread=math.inf,
+                 max_slippage=math.inf, missing_stop_pct=None):
+        self.max_risk_pct = max_risk_pct
+        self.max_total_pct = max_total_pct
+        self.max_currency_pct = max_total_pct if max_currency_pct is None else max_currency_pct
+        self.max_open = max_open
+        self.allow_multiple = allow_multiple
+        self.cooldown_losses = cooldown_losses
+        self.cooldown_seconds = cooldown_seconds
+        self.max_spread = max_spread
+        self.max_slippage = max_slippage
+        # A position without a stop is booked as if it risked the per-trade maximum
+        self.missing_stop_pct = max_risk_pct if missing_stop_pct is None else missing_stop_pct
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def compile_rules(config):
+    """:class:`RiskRules` from ``risk_settings`` / ``advanced_settings`` (README ``risk`` keys also accepted)."""
+    risk = config.get("risk_settings") or {}
+    advanced = config.get("advanced_settings") or {}
+    readme = config.get("risk") or {}
+    # Spread and slippage are trading-desk settings: advanced_settings wins over risk_settings
+    execution = (advanced, risk)
+    sizing = (risk, readme)
+    max_open = _setting(sizing, "max_open_trades", 0)
+    max_spread = _setting(execution, "max_spread", 0)
+    max_slippage = _setting(execution, "max_slippage", 0)
+    return RiskRules(
+        max_risk_pct=_setting(sizing, "max_risk_per_trade", 3.0),
+        max_total_pct=_setting(sizing, "max_total_exposure", 10.0),
+        max_currency_pct=_setting(sizing, "max_currency_exposure", None),
+        max_open=max_open or math.inf,
+        allow_multiple=bool(risk.get("allow_multiple_trades", True)),
+        cooldown_losses=int(_setting(sizing, "loss_cooldown_count", 3)),
+        cooldown_seconds=_setting(sizing, "loss_cooldown_minutes", 60.0) * 60.0,
+        max_spread=max_spread or math.inf,
+        max_slippage=max_slippage or math.inf,
+    )
+
+
+class ExposureBook:
+    """Open positions with running money-at-risk totals per symbol and currency."""
+
+    def __init__(self):
+        self.positions = {}  # ticket -> Position
+        self.total_risk = 0.0
+        self.symbol_risk = {}
+        self.currency_risk = {}
+        self.sides = {}  # symbol -> [buy count, sell count]
+
+    def add(self, position):
+        if position.ticket in self.positions:
+            self.remove(position.ticket)
+        self.positions[position.ticket] = position
+        self._apply(position, 1)
+
+    def remove(self, ticket):
+        position = self.positions.pop(ticket, None)
+        if position is not None:
+            self._apply(position, -1)
+        return position
+
+    def _apply(self, position, sign):
+        risk = sign * position.risk
+        self.total_risk += risk
+        self.symbol_risk[position.symbol] = self.symbol_risk.get(position.symbol, 0.0) + risk
+        for currency in symbol_currencies(position.symbol):
+            self.currency_risk[currency] = self.currency_risk.get(currency, 0.0) + risk
+        counts = self.sides.setdefault(position.symbol, [0, 0])
+        counts[0 if position.side == BUY else 1] += sign
+        if not self.positions:
+            # Reset float drift once the book is flat
+            self.total_risk = 0.0
+            self.symbol_risk.clear()
+            self.currency_risk.clear()
+
+    def open_count(self, symbol=None):
+        if symbol is None:
+            return len(self.positions)
+        counts = self.sides.get(symbol)
+        return counts[0] + counts[1] if counts else 0
+
+
+class PreTradeRiskEngine:
+    def __init__(self, config=None, rules=None):
+        self.rules = rules or compile_rules(config or {})
+        self.book = ExposureBook()
+        self.specs = {}  # symbol -> SymbolSpec
+        self.loss_streak = 0
+        self.cooldown_until = 0.0
+        self.checks = 0
+        self.rejections = {}
+
+    def update_config(self, config):
+        """Recompile the limits (e.g. from ``config_store.subscribe``)."""
+        self.rules = compile_rules(config)
+
+    # --- symbol and position state ---
+
+    def set_symbol(self, symbol, point, tick_value, tick_size):
+        self.specs[symbol] = SymbolSpec(float(point), float(tick_value) / float(tick_size))
+
+    def set_symbol_info(self, info):
+        """Take point and tick value from an ``mt5.symbol_info`` result."""
+        self.set_symbol(info.name, info.point, info.trade_tick_value, info.trade_tick_size)
+
+    def position_risk(self, symbol, volume, entry, sl, equity):
+        """Money lost if ``sl`` is hit; positions without a stop count at ``missing_stop_pct``."""
+        spec = self.specs.get(symbol)
+        if not sl or spec is None:
+            return equity * self.rules.missing_stop_pct / 100.0
+        return abs(entry - sl) * volume * spec.value_per_unit
+
+    def open_position(self, ticket, symbol, side, volume, entry, sl, equity):
+        position = Position(ticket, symbol, _side(side), float(volume),
+                            self.position_risk(symbol, float(volume), entry, sl, equity))
+        self.book.add(position)
+        return position
+
+    def close_position(self, ticket, pnl=None, now=None):
+        """Free the position's exposure and, with ``pnl``, update the loss streak."""
+        self.book.remove(ticket)
+        if pnl is not None:
+            self.record_result(pnl, now)
+
+    def record_result(self, pnl, now=None):
+        if pnl < 0:
+            self.loss_streak += 1
+            if self.rules.cooldown_losses and self.loss_streak >= self.rules.cooldown_losses:
+                self.cooldown_until = (time.time() if now is None else now) + self.rules.cooldown_seconds
+        elif pnl > 0:
+            self.loss_streak = 0
+
+    def sync_positions(self, positions, equity):
+        """Rebuild the book from ``mt5.positions_get()`` (after a restart or reconnect)."""
+        self.book = ExposureBook()
+        for p in positions or ():
+            self.open_position(p.ticket, p.symbol, p.type, p.volume, p.price_open, getattr(p, "sl", 0.0), equity)
+
+    # --- the check ---
+
+    def check(self, symbol, side, volume, price, sl, equity, spread_points=0.0, signal_price=None, now=None):
+        """Evaluate every rule for an order; returns ``{"allowed", "reasons", "risk_pct", ...}``."""
+        rules = self.rules
+        book = self.book
+        side = _side(side)
+        reasons = []
+        self.checks += 1
+        if equity <= 0:
+            reasons.append(_reason("equity", "no equity to risk", equity, 0.0))
+            equity = 1e-9
+        pct = 100.0 / equity
+        order_risk = self.position_risk(symbol, volume, price, sl, equity)
+        risk_pct = order_risk * pct
+
+        if risk_pct > rules.max_risk_pct:
+            reasons.append(_reason("max_risk_per_trade", f"order risks {risk_pct:.2f}% of equity",
+                                   risk_pct, rules.max_risk_pct))
+        total_pct = (book.total_risk + order_risk) * pct
+        if total_pct > rules.max_total_pct:
+            reasons.append(_reason("max_total_exposure", f"total exposure would be {total_pct:.2f}%",
+                                   total_pct, rules.max_total_pct))
+        currency_risk = book.currency_risk
+        for currency in symbol_currencies(symbol):
+            currency_pct = (currency_risk.get(currency, 0.0) + order_risk) * pct
+            if currency_pct > rules.max_currency_pct:
+                reasons.append(_reason("max_currency_exposure", f"{currency} exposure would be {currency_pct:.2f}%",
+                                       currency_pct, rules.max_currency_pct))
+        counts = book.sides.get(symbol)
+        if counts:
+            if counts[1 if side == BUY else 0] > 0:
+                reasons.append(_reason("opposing_trade", f"{symbol} has an open {'sell' if side == BUY else 'buy'}",
+                                       counts[1 if side == BUY else 0], 0))
+            if not rules.allow_multiple and counts[0] + counts[1] > 0:
+                reasons.append(_reason("multiple_trades", f"{symbol} already has an open position",
+                                       counts[0] + counts[1], 1))
+        open_count = len(book.positions)
+        if open_count >= rules.max_open:
+            reasons.append(_reason("max_open_trades", f"{open_count} positions open", open_count, rules.max_open))
+        now = time.time() if now is None else now
+        if now < self.cooldown_until:
+            reasons.append(_reason("loss_cooldown", f"{self.loss_streak} consecutive losses, cooling down "
+                                   f"{self.cooldown_until - now:.0f}s more", self.loss_streak, rules.cooldown_losses))
+        if spread_points > rules.max_spread:
+            reasons.append(_reason("max_spread", f"spread {spread_points:g} points", spread_points, rules.max_spread))
+        if signal_price is not None:
+            spec = self.specs.get(symbol)
+            if spec is not None:
+                # Positive = the current quote is worse than the price the signal was generated at
+                slippage = (price - signal_price) * side / spec.point
+                if slippage > rules.max_slippage:
+                    reasons.append(_reason("max_slippage", f"price moved {slippage:.1f} points against the signal",
+                                           slippage, rules.max_slippage))
+
+        for r in reasons:
+            self.rejections[r["rule"]] = self.rejections.get(r["rule"], 0) + 1
+        return {"allowed": not reasons, "reasons": reasons, "risk_pct": risk_pct, "total_exposure_pct": total_pct}
+
+    def stats(self):
+        return {
+            "checks": self.checks,
+            "rejections": dict(self.rejections),
+            "open_positions": len(self.book.positions),
+            "loss_streak": self.loss_streak,
+            "cooldown_until": self.cooldown_until or None,
+            "rules": self.rules.as_dict(),
+        }
+
+
+def _reason(rule, message, value, limit):
+    return {"rule": rule, "message": message, "value": value, "limit": limit}
+
+
+def _demo_engine(positions, equity=100000.0):
+    """Engine with ``positions`` small open trades spread over a few symbols (for the benchmark)."""
+    engine = PreTradeRiskEngine({"risk_settings": {"max_open_trades": positions + 10, "allow_multiple_trades": True},
+                                 "advanced_settings": {"max_spread": 30, "max_slippage": 20}})
+    symbols = ["XAUUSD", "EURUSD", "GBPJPY", "USDJPY", "EURJPY", "XAGUSD", "US30", "NVDA"]
+    for symbol in symbols:
+        jpy = "JPY" in symbol
+        engine.set_symbol(symbol, 0.001 if jpy else 0.01, 0.67 if jpy else 1.0, 0.001 if jpy else 0.01)
+    for n in range(positions):
+        symbol = symbols[n % len(symbols)]
+        engine.open_position(n + 1, symbol, "buy", 0.01, 2000.0, 1995.0, equity)
+    return engine, equity
+
+
+def benchmark(positions=50, checks=100000):
+    engine, equity = _demo_engine(positions)
+    latencies = []
+    clock = time.perf_counter
+    for n in range(checks):
+        side = "buy" if n % 3 else "sell"  # every third order is an opposing trade
+        t0 = clock()
+        engine.check("XAUUSD", side, 0.1, 2000.0 + (n % 7) * 0.05, 1990.0, equity, spread_points=18,
+                     signal_price=2000.0)
+        latencies.append(clock() - t0)
+    latencies.sort()
+    us = [x * 1e6 for x in latencies]
+    return {
+        "positions": positions,
+        "checks": checks,
+        "p50_us": round(us[len(us) // 2], 2),
+        "p99_us": round(us[int(0.99 * (len(us) - 1))], 2),
+        "max_us": round(us[-1], 2),
+        "rejections": engine.rejections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pre-trade risk check.")
+    parser.add_argument("--positions", type=int, default=50)
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    engine, equity = _demo_engine(args.positions)
+    print("sample rejection:", engine.check("XAUUSD", "sell", 5.0, 2000.5, 2010.0, equity, spread_points=40,
+                                            signal_price=2000.0)["reasons"])
+    result = benchmark(args.positions, args.checks)
+    print(f"{result['checks']} checks with {result['positions']} open positions: "
+          f"p50 {result['p50_us']} us, p99 {result['p99_us']} us, max {result['max_us']} us")
+    if result["p99_us"] > args.budget_ms * 1000.0:
+        print(f"p99 over the {args.budget_ms} ms budget")
+        sys.exit(1)
+    print(f"within the {args.budget_ms} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Bounded LRU cache for analytics results.
+
+Entries are keyed on the normalized query and tagged with the trade store's
+write version. An entry is served only while it is younger than ``ttl`` and
+its version still matches, so any trade insert/close/delete invalidates
+every cached aggregate on the next read.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_key(endpoint, **params):
+    """Order-independent key; ``None`` params are dropped and strings trimmed."""
+    items = []
+    for name, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        items.append((name, value))
+    return (endpoint, tuple(sorted(items)))
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, version, compute, cacheable=lambda value: True):
+        """Return the cached value for ``key`` at ``version`` or compute and store it."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, stored_at, value = entry
+                if entry_version != version:
+                    self.stale += 1
+                    del self._entries[key]
+                elif now - stored_at > self.ttl:
+                    self.expired += 1
+                    del self._entries[key]
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return value
+            self.misses += 1
+        value = compute()
+        if cacheable(value):
+            with self._lock:
+                self._entries[key] = (version, time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stale": self.stale,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
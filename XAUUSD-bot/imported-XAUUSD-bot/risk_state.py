@@ -0,0 +1,399 @@
+"""Shared daily risk counters in one SQLite WAL database.
+
+Replaces ``logs/daily_trade_count.json``, ``logs/daily_pnl.json`` and
+``last_trade_times_main.json``, which were rewritten in full on every trade
+and re-read by each process. The bot and the API server open the same
+``logs/risk_state.db`` and see the same live counters:
+
+- ``daily_counters``: trades, wins, losses and P&L per (day, symbol)
+- ``open_trades``: one row per reserved or open ticket
+- ``last_trade``: last entry time per (scope, key), ``scope`` being the old
+  file's top-level name (``"last_trade_times_main"`` -> ``"main"``)
+
+:meth:`RiskStateStore.reserve_trade` checks ``max_daily_trades`` (per
+symbol, like the old counter file), ``max_daily_loss``,
+``max_daily_profit``, ``max_open_trades`` and an optional cooldown, and
+records the trade in the same ``BEGIN IMMEDIATE`` transaction, so two
+processes racing for the last slot cannot both get it. Writes touch single
+rows; nothing is rewritten in full.
+
+    python risk_state.py migrate                # import the legacy JSON files
+    python risk_state.py show
+    python risk_state.py stress --workers 8     # concurrent reservations, checks for lost updates
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+RISK_DB_FILE = os.path.join("logs", "risk_state.db")
+LEGACY_TRADE_COUNT_FILE = os.path.join("logs", "daily_trade_count.json")
+LEGACY_PNL_FILE = os.path.join("logs", "daily_pnl.json")
+LEGACY_LAST_TRADE_FILE = "last_trade_times_main.json"
+
+# Symbol used for P&L the legacy files kept only as a daily total
+ALL_SYMBOLS = "*"
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS daily_counters (
+        day TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        trades INTEGER NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0,
+        pnl REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, symbol)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS open_trades (
+        ticket TEXT PRIMARY KEY,
+        symbol TEXT NOT NULL,
+        day TEXT NOT NULL,
+        opened_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_open_trades_symbol ON open_trades (symbol)",
+    """CREATE TABLE IF NOT EXISTS last_trade (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        ts REAL NOT NULL,
+        PRIMARY KEY (scope, key)
+    ) WITHOUT ROWID""",
+]
+
+DAY_TOTALS_SQL = """
+    SELECT COALESCE(SUM(trades), 0), COALESCE(SUM(pnl), 0) FROM daily_counters WHERE day = ?
+"""
+
+SYMBOL_TRADES_SQL = "SELECT trades FROM daily_counters WHERE day = ? AND symbol = ?"
+
+BUMP_TRADES_SQL = """
+    INSERT INTO daily_counters (day, symbol, trades) VALUES (?, ?, 1)
+    ON CONFLICT (day, symbol) DO UPDATE SET trades = trades + 1
+"""
+
+ADD_PNL_SQL = """
+    INSERT INTO daily_counters (day, symbol, wins, losses, pnl) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, symbol) DO UPDATE SET
+        wins = wins + excluded.wins, losses = losses + excluded.losses, pnl = pnl + excluded.pnl
+"""
+
+SET_LAST_TRADE_SQL = """
+    INSERT INTO last_trade (scope, key, ts) VALUES (?, ?, ?)
+    ON CONFLICT (scope, key) DO UPDATE SET ts = max(ts, excluded.ts)
+"""
+
+
+def trading_day(ts=None):
+    """Local calendar day of ``ts`` (default now), the key the legacy files used."""
+    return datetime.datetime.fromtimestamp(time.time() if ts is None else ts).strftime("%Y-%m-%d")
+
+
+def _parse_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+
+def _number(value, default=None):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class RiskStateStore:
+    def __init__(self, db_file=RISK_DB_FILE, busy_timeout_ms=5000):
+        self.db_file = db_file
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def connection(self):
+        """This thread's autocommit connection; transactions are opened explicitly."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout_ms / 1000.0, isolation_level=None,
+                                   cached_statements=64, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self, work):
+        """Run ``work(conn)`` inside one ``BEGIN IMMEDIATE`` transaction (takes the write lock up front)."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    # --- atomic operations ---
+
+    def reserve_trade(self, symbol, limits, ticket=None, now=None, cooldown_seconds=0, scope="main", key=None):
+        """Check the daily limits and, if they allow it, count the trade atomically.
+
+        ``limits`` is the ``risk_settings`` dict. Returns ``(allowed, reason, state)``
+        where ``state`` holds the counters the decision was made on. Call
+        :meth:`cancel_reservation` with the same ``ticket`` if the order then fails.
+        """
+        now = time.time() if now is None else now
+        day = trading_day(now)
+        key = key or symbol
+        ticket = str(ticket) if ticket is not None else f"pending-{uuid.uuid4().hex}"
+        max_trades = _number(limits.get("max_daily_trades"))
+        max_loss = _number(limits.get("max_daily_loss"))
+        max_profit = _number(limits.get("max_daily_profit"))
+        max_open = _number(limits.get("max_open_trades"))
+
+        def work(conn):
+            day_trades, day_pnl = conn.execute(DAY_TOTALS_SQL, (day,)).fetchone()
+            row = conn.execute(SYMBOL_TRADES_SQL, (day, symbol)).fetchone()
+            symbol_trades = row[0] if row else 0
+            open_count = conn.execute("SELECT COUNT(*) FROM open_trades").fetchone()[0]
+            row = conn.execute("SELECT ts FROM last_trade WHERE scope = ? AND key = ?", (scope, key)).fetchone()
+            last = row[0] if row else None
+            state = {"day": day, "symbol_trades": symbol_trades, "day_trades": day_trades,
+                     "day_pnl": round(day_pnl, 2), "open_trades": open_count, "last_trade": last}
+            if max_trades is not None and symbol_trades >= max_trades:
+                return False, f"max_daily_trades reached for {symbol} ({symbol_trades}/{int(max_trades)})", state
+            if max_loss is not None and max_loss > 0 and day_pnl <= -max_loss:
+                return False, f"max_daily_loss reached ({day_pnl:.2f} <= -{max_loss:g})", state
+            if max_profit is not None and max_profit > 0 and day_pnl >= max_profit:
+                return False, f"max_daily_profit reached ({day_pnl:.2f} >= {max_profit:g})", state
+            if max_open is not None and open_count >= max_open:
+                return False, f"max_open_trades reached ({open_count}/{int(max_open)})", state
+            if cooldown_seconds and last is not None and now - last < cooldown_seconds:
+                return False, f"cooldown for {key}: {now - last:.0f}s of {cooldown_seconds:g}s", state
+            conn.execute(BUMP_TRADES_SQL, (day, symbol))
+            conn.execute("INSERT OR REPLACE INTO open_trades (ticket, symbol, day, opened_at) VALUES (?, ?, ?, ?)",
+                         (ticket, symbol, day, now))
+            conn.execute(SET_LAST_TRADE_SQL, (scope, key, now))
+            state.update(symbol_trades=symbol_trades + 1, day_trades=day_trades + 1,
+                         open_trades=open_count + 1, last_trade=now, ticket=ticket)
+            return True, None, state
+
+        return self._write(work)
+
+    def cancel_reservation(self, ticket):
+        """Undo :meth:`reserve_trade` for an order that was never filled."""
+        def work(conn):
+            row = conn.execute("SELECT symbol, day FROM open_trades WHERE ticket = ?", (str(ticket),)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM open_trades WHERE ticket = ?", (str(ticket),))
+            conn.execute("UPDATE daily_counters SET trades = max(trades - 1, 0) WHERE day = ? AND symbol = ?", row)
+            return True
+        return self._write(work)
+
+    def confirm_ticket(self, reservation, ticket):
+        """Replace a pending reservation id with the broker's ticket once the order fills."""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE open_trades SET ticket = ? WHERE ticket = ?", (str(ticket), str(reservation))).rowcount == 1)
+
+    def record_close(self, symbol, pnl, ticket=None, closed_at=None):
+        """Add a closed trade's P&L to its day and free its open slot."""
+        day = trading_day(closed_at)
+        pnl = float(pnl)
+
+        def work(conn):
+            conn.execute(ADD_PNL_SQL, (day, symbol, int(pnl > 0), int(pnl < 0), pnl))
+            if ticket is not None:
+                conn.execute("DELETE FROM open_trades WHERE ticket = ?", (str(ticket),))
+        self._write(work)
+
+    def sync_open_tickets(self, tickets):
+        """Drop open slots whose tickets the terminal no longer reports (closed while we were down)."""
+        keep = {str(t) for t in tickets}
+
+        def work(conn):
+            stale = [t for (t,) in conn.execute("SELECT ticket FROM open_trades") if t not in keep
+                     and not t.startswith("pending-")]
+            conn.executemany("DELETE FROM open_trades WHERE ticket = ?", [(t,) for t in stale])
+            return stale
+        return self._write(work)
+
+    def set_last_trade(self, key, ts=None, scope="main"):
+        self._write(lambda conn: conn.execute(SET_LAST_TRADE_SQL, (scope, key, time.time() if ts is None else ts)))
+
+    # --- reads ---
+
+    def last_trade_times(self, scope="main"):
+        rows = self.connection().execute("SELECT key, ts FROM last_trade WHERE scope = ?", (scope,))
+        return {key: ts for key, ts in rows}
+
+    def snapshot(self, day=None, limits=None):
+        """Counters for ``day`` (default today), open slots and, with ``limits``, what is left."""
+        day = day or trading_day()
+        conn = self.connection()
+        symbols = {symbol: {"trades": trades, "wins": wins, "losses": losses, "pnl": round(pnl, 2)}
+                   for symbol, trades, wins, losses, pnl in conn.execute(
+                       "SELECT symbol, trades, wins, losses, pnl FROM daily_counters WHERE day = ? ORDER BY symbol",
+                       (day,))}
+        open_by_symbol = dict(conn.execute("SELECT symbol, COUNT(*) FROM open_trades GROUP BY symbol"))
+        state = {
+            "day": day,
+            "trades": sum(s["trades"] for s in symbols.values()),
+            "pnl": round(sum(s["pnl"] for s in symbols.values()), 2),
+            "open_trades": sum(open_by_symbol.values()),
+            "symbols": symbols,
+            "open_by_symbol": open_by_symbol,
+            "last_trade_times": self.last_trade_times(),
+        }
+        if limits:
+            max_trades = _number(limits.get("max_daily_trades"))
+            max_open = _number(limits.get("max_open_trades"))
+            max_loss = _number(limits.get("max_daily_loss"))
+            max_profit = _number(limits.get("max_daily_profit"))
+            state["remaining"] = {
+                "trades_per_symbol": None if max_trades is None else {
+                    s: max(0, int(max_trades) - v["trades"]) for s, v in symbols.items()},
+                "open_trades": None if max_open is None else max(0, int(max_open) - state["open_trades"]),
+                "loss_before_stop": None if not max_loss else round(max_loss + state["pnl"], 2),
+                "profit_before_stop": None if not max_profit else round(max_profit - state["pnl"], 2),
+            }
+        return state
+
+    # --- legacy files ---
+
+    def migrate_legacy(self, trade_count_file=LEGACY_TRADE_COUNT_FILE, pnl_file=LEGACY_PNL_FILE,
+                       last_trade_file=LEGACY_LAST_TRADE_FILE):
+        """Import the old JSON counters; safe to re-run (imported values never double-count)."""
+        imported = {"trade_counts": 0, "pnl": 0, "last_trade_times": 0}
+        counts, pnls, last_times = (_read_json(p) for p in (trade_count_file, pnl_file, last_trade_file))
+
+        def work(conn):
+            for day, per_symbol in (counts or {}).items():
+                for symbol, trades in (per_symbol or {}).items():
+                    conn.execute("""
+                        INSERT INTO daily_counters (day, symbol, trades) VALUES (?, ?, ?)
+                        ON CONFLICT (day, symbol) DO UPDATE SET trades = max(trades, excluded.trades)
+                    """, (day, symbol, int(trades)))
+                    imported["trade_counts"] += 1
+            for day, value in (pnls or {}).items():
+                per_symbol = value if isinstance(value, dict) else {ALL_SYMBOLS: value}
+                for symbol, pnl in per_symbol.items():
+                    pnl = _number(pnl)
+                    if pnl is None:
+                        continue
+                    # Only fills days the store has no P&L for, so a re-run cannot add it twice
+                    conn.execute("""
+                        INSERT INTO daily_counters (day, symbol, pnl) VALUES (?, ?, ?)
+                        ON CONFLICT (day, symbol) DO UPDATE SET pnl = excluded.pnl
+                        WHERE pnl = 0 AND wins = 0 AND losses = 0
+                    """, (day, symbol, pnl))
+                    imported["pnl"] += 1
+            for name, times in (last_times or {}).items():
+                scope = name.replace("last_trade_times_", "") or "main"
+                for key, value in (times or {}).items():
+                    ts = _parse_time(value)
+                    if ts is not None:
+                        conn.execute(SET_LAST_TRADE_SQL, (scope, key, ts))
+                        imported["last_trade_times"] += 1
+            return imported
+
+        return self._write(work)
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+
+
+def _read_json(path):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Skipping unreadable legacy file {path}: {e}")
+        return None
+
+
+def _stress_worker(db_file, symbol, limits, attempts, results):
+    store = RiskStateStore(db_file)
+    granted, latencies = 0, []
+    for _ in range(attempts):
+        t0 = time.perf_counter()
+        allowed, _, _ = store.reserve_trade(symbol, limits)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        granted += allowed
+    store.close()
+    results.put((granted, latencies))
+
+
+def stress(db_file, workers, attempts, max_trades):
+    """Race ``workers`` processes for ``max_trades`` slots; the store must grant exactly that many."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    limits = {"max_daily_trades": max_trades, "max_open_trades": max_trades}
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    started = time.perf_counter()
+    processes = [ctx.Process(target=_stress_worker, args=(db_file, "XAUUSD", limits, attempts, results))
+                 for _ in range(workers)]
+    for p in processes:
+        p.start()
+    outcomes = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - started
+    granted = sum(g for g, _ in outcomes)
+    latencies = sorted(ms for _, lat in outcomes for ms in lat)
+    stored = RiskStateStore(db_file).snapshot()
+    print(f"{workers} processes x {attempts} attempts in {elapsed:.2f}s "
+          f"(p50 {latencies[len(latencies) // 2]:.2f} ms, p99 {latencies[int(0.99 * (len(latencies) - 1))]:.2f} ms)")
+    print(f"granted {granted}, stored trades {stored['trades']}, open {stored['open_trades']}, limit {max_trades}")
+    return granted == stored["trades"] == stored["open_trades"] == min(max_trades, workers * attempts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the shared risk-state store.")
+    parser.add_argument("command", choices=["migrate", "show", "stress"])
+    parser.add_argument("--db", default=RISK_DB_FILE)
+    parser.add_argument("--day")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=50)
+    parser.add_argument("--max-trades", type=int, default=100)
+    args = parser.parse_args()
+    if args.command == "stress":
+        db_file = args.db if args.db != RISK_DB_FILE else os.path.join(".cache", "risk_state_stress.db")
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        if not stress(db_file, args.workers, args.attempts, args.max_trades):
+            print("Lost or duplicated updates detected.")
+            sys.exit(1)
+        print("No lost updates.")
+        return
+    store = RiskStateStore(args.db)
+    if args.command == "migrate":
+        print(f"Imported {store.migrate_legacy()}")
+    print(json.dumps(store.snapshot(args.day), indent=2))
+
+
+if __name__ == "__main__":
+    main()
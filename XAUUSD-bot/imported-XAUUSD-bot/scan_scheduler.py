@@ -0,0 +1,278 @@
+"""Concurrent per-cycle symbol scanning for the bot loop.
+
+Each cycle the scheduler:
+
+1. skips symbols whose current candle has not closed since their last scan
+   (bar boundaries are counted on the epoch, so the broker's whole-hour
+   server offset does not matter for intraday timeframes);
+2. orders the rest so symbols with an active ``trading_sessions`` window
+   come first;
+3. fetches bars on a thread pool (terminal/news I/O) and hands each
+   symbol's bars to a process pool for strategy evaluation as soon as they
+   arrive;
+4. reports fetch / evaluate / total milliseconds per symbol.
+
+``fetch`` and ``evaluate`` are supplied by the caller; ``evaluate`` must be
+a module-level function so it can be sent to worker processes (pass
+``cpu_workers=0`` to evaluate on the I/O threads instead), and
+``cpu_initializer`` can pre-import strategy code in each worker.
+
+    python scan_scheduler.py --cycles 3     # fake terminal + reference strategy
+"""
+import argparse
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from candle_store import TIMEFRAME_SECONDS, normalize_timeframe
+
+# Sessions that move each instrument; anything unlisted trades with New York
+CURRENCY_SESSIONS = {
+    "JPY": ("asian", "london"), "AUD": ("asian",), "NZD": ("asian",),
+    "EUR": ("london",), "GBP": ("london",), "CHF": ("london",),
+    "USD": ("new_york",), "CAD": ("new_york",),
+    "XAU": ("london", "new_york"), "XAG": ("london", "new_york"),
+}
+# Session windows in match order: the first one containing a time wins, so the
+# London/New York overlap counts as new_york. Times are UTC "HH:MM" and may wrap
+# midnight; these defaults fill in a window the config does not give times for.
+SESSION_NAMES = ("new_york", "london", "asian")
+DEFAULT_WINDOWS = {"new_york": ("13:00", "22:00"), "london": ("08:00", "17:00"), "asian": ("00:00", "09:00")}
+# Legacy top-level flags, read only for a window that has no "active" key of its own
+SESSION_FLAGS = {"london": "london_session", "new_york": "new_york_session", "asian": "tokyo_session"}
+
+
+def symbol_sessions(symbol):
+    """Sessions relevant to ``symbol``: its currencies' sessions, New York for indices and stocks."""
+    sessions = []
+    if len(symbol) >= 6 and symbol[:6].isalpha():
+        for code in (symbol[:3], symbol[3:6]):
+            for name in CURRENCY_SESSIONS.get(code.upper(), ()):
+                if name not in sessions:
+                    sessions.append(name)
+    return sessions or ["new_york"]
+
+
+def session_windows(trading_sessions=None, enabled_only=True):
+    """``[(name, start, end)]`` from config ``trading_sessions``, in match order.
+
+    The one place session windows are read; the scheduler, the analytics
+    store and engine and the optimizer all take them from here. A window
+    is enabled by its own ``active`` key (what the settings API writes);
+    the legacy ``<name>_session`` flag counts only when the window has no
+    ``active`` key, and ``enable_trading`` (or ``enabled``) false disables
+    every window. ``enabled_only=False`` returns every window regardless,
+    for classifying past trades by time of day.
+    """
+    trading_sessions = trading_sessions or {}
+    if enabled_only and (not trading_sessions.get("enable_trading", True)
+                         or not trading_sessions.get("enabled", True)):
+        return []
+    windows = []
+    for name in SESSION_NAMES:
+        window = trading_sessions.get(name) or {}
+        if enabled_only and not (window["active"] if "active" in window else trading_sessions.get(SESSION_FLAGS[name])):
+            continue
+        default_start, default_end = DEFAULT_WINDOWS[name]
+        windows.append((name, window.get("start") or default_start, window.get("end") or default_end))
+    return windows
+
+
+def clock_minutes(hhmm):
+    """'08:30' -> 510."""
+    hours, minutes = str(hhmm).split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def in_window(minute, start, end):
+    """True when ``minute`` of the day falls in [start, end) ("HH:MM"), wrapping midnight if end < start."""
+    lo, hi = clock_minutes(start), clock_minutes(end)
+    return lo <= minute < hi if lo <= hi else (minute >= lo or minute < hi)
+
+
+def active_sessions(trading_sessions, now=None):
+    """Names of ``trading_sessions`` windows that are enabled and open at ``now`` (UTC)."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    minute = now.hour * 60 + now.minute
+    return {name for name, start, end in session_windows(trading_sessions) if in_window(minute, start, end)}
+
+
+class ScanScheduler:
+    def __init__(self, config, fetch, evaluate, io_workers=8, cpu_workers=None, on_timing=None, cpu_initializer=None):
+        self.config = config
+        self.fetch = fetch
+        self.evaluate = evaluate
+        self.on_timing = on_timing
+        self.timeframe = normalize_timeframe(config.get("timeframe", "TIMEFRAME_M15"))
+        self.seconds = TIMEFRAME_SECONDS[self.timeframe]
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="scan-io")
+        workers = os.cpu_count() if cpu_workers is None else cpu_workers
+        self._cpu = ProcessPoolExecutor(max_workers=workers, initializer=cpu_initializer) if workers else None
+        self._last_bar = {}  # symbol -> bar boundary index last scanned
+        self._lock = threading.Lock()
+        self.history = []
+
+    def warm_up(self):
+        """Start every worker process (and run its initializer) before the first cycle."""
+        if self._cpu is not None:
+            workers = self._cpu._max_workers
+            for future in [self._cpu.submit(time.sleep, 0.05) for _ in range(workers)]:
+                future.result()
+
+    def close(self):
+        self._io.shutdown(wait=True)
+        if self._cpu is not None:
+            self._cpu.shutdown(wait=True)
+
+    def plan(self, now=None):
+        """(ordered due symbols, {symbol: skip reason}) for a cycle at ``now`` (epoch seconds)."""
+        now = now or time.time()
+        boundary = int(now // self.seconds)
+        open_sessions = active_sessions(self.config.get("trading_sessions"),
+                                        datetime.datetime.fromtimestamp(now, datetime.timezone.utc))
+        due, skipped = [], {}
+        for index, symbol in enumerate(self.config.get("symbols", [])):
+            if self._last_bar.get(symbol) == boundary:
+                skipped[symbol] = "candle_not_closed"
+                continue
+            in_session = any(s in open_sessions for s in symbol_sessions(symbol))
+            due.append((0 if in_session else 1, index, symbol))
+        return [symbol for _, _, symbol in sorted(due)], skipped
+
+    def run_cycle(self, now=None):
+        """Scan every due symbol once; returns the cycle report."""
+        started = time.perf_counter()
+        now = now or time.time()
+        boundary = int(now // self.seconds)
+        symbols, skipped = self.plan(now)
+        timings = {}
+        results = {}
+        pending = []
+
+        def fetch_one(symbol):
+            t0 = time.perf_counter()
+            bars = self.fetch(symbol, self.timeframe)
+            return bars, (time.perf_counter() - t0) * 1000.0
+
+        fetches = {symbol: self._io.submit(fetch_one, symbol) for symbol in symbols}
+        for symbol in symbols:  # priority order; later fetches keep running meanwhile
+            try:
+                bars, fetch_ms = fetches[symbol].result()
+            except Exception as e:
+                timings[symbol] = {"error": f"fetch: {e}"}
+                continue
+            if bars is None or len(bars) == 0:
+                timings[symbol] = {"fetch_ms": round(fetch_ms, 2), "error": "no bars"}
+                continue
+            queued = time.perf_counter()
+            if self._cpu is not None:
+                future = self._cpu.submit(_timed_evaluate, self.evaluate, symbol, bars)
+            else:
+                future = self._io.submit(_timed_evaluate, self.evaluate, symbol, bars)
+            done_at = {}
+            future.add_done_callback(lambda f, d=done_at: d.setdefault("t", time.perf_counter()))
+            pending.append((symbol, fetch_ms, queued, future, done_at))
+
+        for symbol, fetch_ms, queued, future, done_at in pending:
+            try:
+                result, eval_ms = future.result()
+            except Exception as e:
+                timings[symbol] = {"fetch_ms": round(fetch_ms, 2), "error": f"evaluate: {e}"}
+                continue
+            with self._lock:
+                self._last_bar[symbol] = boundary
+            results[symbol] = result
+            queued_ms = (done_at.get("t", time.perf_counter()) - queued) * 1000.0
+            timings[symbol] = {
+                "fetch_ms": round(fetch_ms, 2),
+                "evaluate_ms": round(eval_ms, 2),
+                "queue_ms": round(max(0.0, queued_ms - eval_ms), 2),
+                "total_ms": round(fetch_ms + queued_ms, 2),
+            }
+            if self.on_timing:
+                self.on_timing(symbol, timings[symbol])
+
+        report = {
+            "time": now,
+            "order": symbols,
+            "skipped": skipped,
+            "timings": timings,
+            "results": results,
+            "cycle_ms": round((time.perf_counter() - started) * 1000.0, 2),
+        }
+        self.history = (self.history + [{k: v for k, v in report.items() if k != "results"}])[-100:]
+        return report
+
+    def run_forever(self, poll_interval=None, stop=None):
+        """Run a cycle at every bar close (polling every ``poll_interval`` seconds) until ``stop`` is set."""
+        stop = stop or threading.Event()
+        poll_interval = poll_interval or float(self.config.get("polling_interval_seconds", 60))
+        while not stop.is_set():
+            report = self.run_cycle()
+            if report["order"]:
+                print(f"Scan cycle: {len(report['order'])} symbols in {report['cycle_ms']} ms")
+            next_close = (int(time.time() // self.seconds) + 1) * self.seconds
+            stop.wait(max(0.5, min(poll_interval, next_close - time.time() + 1.0)))
+
+
+def _timed_evaluate(evaluate, symbol, bars):
+    t0 = time.perf_counter()
+    result = evaluate(symbol, bars)
+    return result, (time.perf_counter() - t0) * 1000.0
+
+
+def _demo_warm_up():
+    import pandas  # noqa: F401  (paid once per worker, not on the first scan)
+    import backtest  # noqa: F401
+
+
+def _demo_evaluate(symbol, bars):
+    """Reference strategy over candle-store columns (runs in a worker process)."""
+    import pandas as pd
+    from backtest import ema_cross
+    return ema_cross(pd.DataFrame({"close": bars["close"]}), symbol)
+
+
+def main():
+    import json
+    import sys
+    import fake_mt5
+    from candle_store import CandleStore
+
+    parser = argparse.ArgumentParser(description="Run scan cycles against a fake terminal.")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument("--mt5-latency", type=float, default=0.02)
+    parser.add_argument("--store", default=os.path.join(".cache", "scan_demo_candles"))
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    terminal = fake_mt5.FakeMT5(latency=args.mt5_latency, symbols=config.get("symbols", []))
+    terminal.initialize()
+    sys.modules["MetaTrader5"] = terminal
+    store = CandleStore(args.store)
+    count = int(config.get("candle_count", 50))
+    terminal_lock = threading.Lock()  # one terminal: calls are serialized, reads are not
+
+    def fetch(symbol, timeframe):
+        with terminal_lock:
+            store.sync(terminal, symbol, timeframe)
+        return {k: v.copy() for k, v in store.series(symbol, timeframe).tail(count, names=["time", "close"]).items()}
+
+    scheduler = ScanScheduler(config, fetch, _demo_evaluate, cpu_initializer=_demo_warm_up)
+    try:
+        scheduler.warm_up()
+        for cycle in range(args.cycles):
+            report = scheduler.run_cycle()
+            print(f"cycle {cycle + 1}: {report['cycle_ms']} ms, order {report['order']}, skipped {len(report['skipped'])}")
+            for symbol, timing in report["timings"].items():
+                print(f"  {symbol:<8} {timing}")
+    finally:
+        scheduler.close()
+
+
+if __name__ == "__main__":
+    main()
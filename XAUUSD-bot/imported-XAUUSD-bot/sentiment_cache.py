@@ -0,0 +1,278 @@
+"""Cached, coalesced sentiment lookups in front of the LLM.
+
+Results are keyed by (symbol, normalized headline set, model): headlines
+are trimmed, lower-cased, whitespace-collapsed, de-duplicated and sorted,
+so reordered or re-fetched copies of the same news hit the same entry.
+Entries live for ``ttl`` seconds and are persisted to a JSON file (written
+with ``os.replace``) at most every ``save_interval`` seconds and on
+:meth:`SentimentCache.flush`, so a restarted bot does not pay for news it
+already scored. A failed write is logged and retried; it never fails a lookup.
+
+Concurrent callers for the same key share one backend call: the first one
+runs it and the others wait on its future. Failures are passed to every
+waiter and never cached.
+
+Backends only need a ``model`` name and ``analyze(symbol, headlines)``
+returning ``{"sentiment", "score", "reason"}``:
+
+- :class:`GeminiBackend`: ``google.generativeai``, keyed like
+  ``scripts/test_model.py`` (``GEMINI_API_KEY`` / ``GENAI_API_KEY``)
+- :class:`AnalyzerBackend`: wraps an existing ``LLMSentimentAnalyzer``
+- :class:`FakeBackend`: offline, deterministic, with optional latency
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+SENTIMENT_CACHE_FILE = "logs/sentiment_cache.json"
+NEUTRAL = {"sentiment": "NEUTRAL", "score": 0.0, "reason": "no sentiment available"}
+
+
+def normalize_headlines(headlines):
+    """Order- and formatting-independent tuple of headlines."""
+    cleaned = {re.sub(r"\s+", " ", str(h)).strip().lower() for h in headlines or ()}
+    return tuple(sorted(h for h in cleaned if h))
+
+
+def cache_key(symbol, headlines, model):
+    payload = json.dumps([str(symbol).upper(), normalize_headlines(headlines), model], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _coerce_result(raw):
+    """Clamp a backend answer to the ``{"sentiment", "score", "reason"}`` shape."""
+    if not isinstance(raw, dict):
+        return dict(NEUTRAL, reason=f"unexpected sentiment response: {raw!r}"[:200])
+    try:
+        score = max(-1.0, min(1.0, float(raw.get("score", 0.0))))
+    except (TypeError, ValueError):
+        score = 0.0
+    sentiment = str(raw.get("sentiment") or "").upper()
+    if sentiment not in ("POSITIVE", "NEGATIVE", "NEUTRAL"):
+        sentiment = "POSITIVE" if score > 0 else "NEGATIVE" if score < 0 else "NEUTRAL"
+    return {"sentiment": sentiment, "score": score, "reason": str(raw.get("reason", ""))}
+
+
+class GeminiBackend:
+    PROMPT = (
+        "You are a markets analyst. Rate the likely short-term impact of these headlines on {symbol}. "
+        'Reply with JSON only: {{"sentiment": "POSITIVE|NEGATIVE|NEUTRAL", "score": -1..1, "reason": "..."}}\n'
+        "{headlines}"
+    )
+
+    def __init__(self, model="gemini-1.5-flash", api_key=None):
+        import google.generativeai as genai
+        key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GENAI_API_KEY")
+        if not key:
+            raise RuntimeError("No Gemini API key: set GEMINI_API_KEY or GENAI_API_KEY")
+        genai.configure(api_key=key)
+        self.model = model
+        self._client = genai.GenerativeModel(model)
+
+    def analyze(self, symbol, headlines):
+        prompt = self.PROMPT.format(symbol=symbol, headlines="\n".join(f"- {h}" for h in headlines))
+        text = getattr(self._client.generate_content(prompt), "text", "") or ""
+        match = re.search(r"\{.*\}", text, re.S)
+        return json.loads(match.group(0)) if match else dict(NEUTRAL, reason=text[:200])
+
+
+class AnalyzerBackend:
+    """Adapter for ``LLMSentimentAnalyzer``; ``call`` maps (analyzer, symbol, headlines) to its API."""
+
+    def __init__(self, analyzer, call=None):
+        self.analyzer = analyzer
+        self.model = str(getattr(analyzer, "model_name", None) or getattr(analyzer, "model", None) or "llm-analyzer")
+        self.call = call or (lambda a, symbol, headlines: a.get_sentiment(symbol, headlines))
+
+    def analyze(self, symbol, headlines):
+        return self.call(self.analyzer, symbol, list(headlines))
+
+
+class FakeBackend:
+    """Keyword-scored sentiment for offline runs; ``latency`` simulates the remote call."""
+
+    POSITIVE_WORDS = ("rally", "surge", "gain", "bullish", "rise", "weak dollar", "cut", "safe haven")
+    NEGATIVE_WORDS = ("drop", "fall", "slump", "bearish", "plunge", "strong dollar", "hike", "selloff")
+
+    def __init__(self, model="fake-sentiment", latency=0.0, responses=None):
+        self.model = model
+        self.latency = latency
+        self.responses = responses or {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def analyze(self, symbol, headlines):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if symbol in self.responses:
+            return self.responses[symbol]
+        text = " ".join(headlines)
+        score = sum(text.count(w) for w in self.POSITIVE_WORDS) - sum(text.count(w) for w in self.NEGATIVE_WORDS)
+        score = max(-1.0, min(1.0, score / 3.0))
+        return {"score": score, "reason": f"fake backend, {len(headlines)} headlines"}
+
+
+class SentimentCache:
+    def __init__(self, backend, ttl=900.0, path=SENTIMENT_CACHE_FILE, max_entries=2000, save_interval=30.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.path = path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self._entries = {}  # key -> {"stored_at", "symbol", "model", "result"}
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.backend_calls = 0
+        self.errors = 0
+        self.saves = 0
+        self.save_errors = 0
+        self._load()
+
+    def get(self, symbol, headlines, timeout=None):
+        """Sentiment for ``symbol`` given ``headlines``; neutral when there is no news."""
+        normalized = normalize_headlines(headlines)
+        if not normalized:
+            return dict(NEUTRAL, reason="no headlines")
+        key = cache_key(symbol, normalized, self.backend.model)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["stored_at"] <= self.ttl:
+                self.hits += 1
+                return dict(entry["result"])
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+                self.backend_calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return dict(future.result(timeout=timeout))
+
+        try:
+            # The key is normalized; the model still sees the headlines as written
+            originals = [str(h).strip() for h in headlines if str(h).strip()]
+            result = _coerce_result(self.backend.analyze(symbol, originals))
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = {"stored_at": time.time(), "symbol": symbol, "model": self.backend.model,
+                                  "result": result}
+            self._inflight.pop(key, None)
+            self._evict(time.time())
+        future.set_result(result)
+        self._schedule_save()
+        return dict(result)
+
+    def _evict(self, now):
+        expired = [k for k, e in self._entries.items() if now - e["stored_at"] > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        if len(self._entries) > self.max_entries:
+            oldest = sorted(self._entries, key=lambda k: self._entries[k]["stored_at"])
+            for k in oldest[:len(self._entries) - self.max_entries]:
+                del self._entries[k]
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError(f"expected an object, got {type(entries).__name__}")
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable sentiment cache {self.path}: {e}")
+            return
+        now = time.time()
+        loaded, skipped = {}, 0
+        for key, entry in entries.items():
+            try:
+                stored_at = float(entry["stored_at"])
+                if not isinstance(entry["result"], dict) or not math.isfinite(stored_at):
+                    raise ValueError("bad entry")
+            except (TypeError, KeyError, ValueError):
+                skipped += 1
+                continue
+            if now - stored_at <= self.ttl:
+                loaded[key] = dict(entry, stored_at=stored_at)
+        if skipped:
+            print(f"Skipped {skipped} malformed entries in sentiment cache {self.path}")
+        self._entries = loaded
+
+    def _schedule_save(self):
+        """Mark the entries dirty and write them ``save_interval`` seconds from the first change."""
+        if not self.path:
+            return
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                return
+            timer = self._save_timer = threading.Timer(self.save_interval, self.flush)
+            timer.daemon = True
+        timer.start()
+
+    def flush(self):
+        """Write the entries now if they changed since the last save."""
+        if not self.path:
+            return
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            if not self._dirty:
+                return
+            self._dirty = False
+            snapshot = dict(self._entries)
+        if timer is not None:
+            timer.cancel()
+        try:
+            with self._save_lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save sentiment cache {self.path}, will retry: {e}")
+            with self._lock:
+                self.save_errors += 1
+            self._schedule_save()
+            return
+        with self._lock:
+            self.saves += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.backend.model,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "backend_calls": self.backend_calls,
+                "errors": self.errors,
+                "saves": self.saves,
+                "save_errors": self.save_errors,
+            }
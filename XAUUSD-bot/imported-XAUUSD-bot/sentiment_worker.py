@@ -0,0 +1,241 @@
+"""Background sentiment refresh with a deadline-bounded read path.
+
+:class:`SentimentWorker` runs an asyncio loop on its own thread. Every
+``interval`` seconds, and immediately when :meth:`notify_news` is called,
+it fetches headlines for each symbol and scores them through a
+:class:`sentiment_cache.SentimentCache` (so unchanged news costs nothing).
+The latest value per symbol is kept in memory.
+
+The trade-decision path calls :meth:`read`, which never waits on the LLM:
+it returns the stored value if it is younger than ``max_age`` and falls
+back to neutral when the value is stale, missing or not readable within
+``deadline`` seconds. Every read is recorded with the age and compute
+latency of the value used, and the worker appends those records to
+``logs/sentiment_usage.jsonl`` every ``log_flush_interval`` seconds, or as
+soon as half of ``log_capacity`` records are waiting. Records that still do
+not fit are dropped and counted in ``stats()["usage_log_dropped"]``.
+
+    worker = SentimentWorker(cache, news_source=fetch_headlines, symbols=config["symbols"])
+    worker.start()
+    value = worker.read("XAUUSD")      # {"sentiment", "score", "source", "age_s", ...}
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from sentiment_cache import NEUTRAL
+
+USAGE_LOG_FILE = "logs/sentiment_usage.jsonl"
+
+
+class SentimentWorker:
+    def __init__(self, cache, news_source, symbols, interval=300.0, max_age=900.0, deadline=0.05,
+                 refresh_timeout=30.0, concurrency=4, usage_log=USAGE_LOG_FILE, history=1000,
+                 log_flush_interval=5.0, log_capacity=10000):
+        self.cache = cache
+        self.news_source = news_source
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.max_age = max_age
+        self.deadline = deadline
+        self.refresh_timeout = refresh_timeout
+        self.concurrency = concurrency
+        self.usage_log = usage_log
+        self.log_flush_interval = log_flush_interval
+        self._values = {}  # symbol -> {"result", "computed_at", "latency_ms", "headlines"}
+        self._lock = threading.Lock()
+        self._reads = deque(maxlen=history)
+        self._pending_log = deque(maxlen=log_capacity)
+        self._flush_requested = False
+        self._loop = None
+        self._wake = None
+        self._urgent = set()
+        self._thread = None
+        self._stopping = False
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.fallbacks = {"stale": 0, "missing": 0, "deadline": 0}
+        self.usage_log_dropped = 0
+
+    # --- decision path ---
+
+    def read(self, symbol, deadline=None, max_age=None):
+        """Latest sentiment for ``symbol``, or neutral if it is not fresh and readable in time."""
+        started = time.perf_counter()
+        deadline = self.deadline if deadline is None else deadline
+        max_age = self.max_age if max_age is None else max_age
+        if self._lock.acquire(timeout=deadline):
+            try:
+                value = self._values.get(symbol)
+            finally:
+                self._lock.release()
+            if value is None:
+                source = "missing"
+            else:
+                age = time.time() - value["computed_at"]
+                source = "fresh" if age <= max_age else "stale"
+        else:
+            value, source = None, "deadline"
+
+        if source == "fresh":
+            result = dict(value["result"])
+        else:
+            self.fallbacks[source] += 1
+            result = dict(NEUTRAL, reason=f"fallback: sentiment {source}")
+        record = {
+            "time": time.time(),
+            "symbol": symbol,
+            "source": source,
+            "sentiment": result["sentiment"],
+            "score": result["score"],
+            "age_s": None if value is None else round(time.time() - value["computed_at"], 3),
+            "latency_ms": None if value is None else value["latency_ms"],
+            "read_ms": round((time.perf_counter() - started) * 1000.0, 3),
+        }
+        self._reads.append(record)
+        if len(self._pending_log) == self._pending_log.maxlen:
+            self.usage_log_dropped += 1  # the append below pushes out the oldest record
+        self._pending_log.append(record)
+        if len(self._pending_log) >= self._pending_log.maxlen // 2 and not self._flush_requested:
+            self._request_flush()
+        result.update({k: record[k] for k in ("source", "age_s", "latency_ms", "read_ms")})
+        return result
+
+    # --- background side ---
+
+    def notify_news(self, symbol=None):
+        """Refresh ``symbol`` (or every symbol) now instead of waiting for the schedule."""
+        loop = self._loop
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(self._mark_urgent, symbol)
+
+    def _request_flush(self):
+        loop = self._loop
+        if loop is None:
+            return
+        self._flush_requested = True
+        loop.call_soon_threadsafe(self._wake.set)
+
+    def _mark_urgent(self, symbol):
+        self._urgent.update([symbol] if symbol else self.symbols)
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._thread_main, args=(ready,), name="sentiment-worker", daemon=True)
+        self._thread.start()
+        ready.wait(timeout=5)
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush_usage()
+        self.cache.flush()
+
+    def _thread_main(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._wake = asyncio.Event()
+        ready.set()
+        try:
+            loop.run_until_complete(self._run())
+        finally:
+            self._loop = None
+            loop.close()
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        due = set(self.symbols)
+        next_round = time.monotonic()
+        while not self._stopping:
+            due |= self._urgent
+            self._urgent.clear()
+            if time.monotonic() >= next_round:
+                due |= set(self.symbols)
+                next_round = time.monotonic() + self.interval
+            if due:
+                await asyncio.gather(*(self._refresh(symbol, semaphore) for symbol in due))
+                due = set()
+            self._flush_requested = False
+            await asyncio.get_running_loop().run_in_executor(None, self.flush_usage)
+            self._wake.clear()
+            if self._urgent or self._stopping:
+                continue
+            # Wake for the next round, or sooner to flush the usage log
+            timeout = min(self.log_flush_interval, max(0.0, next_round - time.monotonic()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, symbol, semaphore):
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            try:
+                result, headlines = await asyncio.wait_for(
+                    loop.run_in_executor(None, self._compute, symbol), timeout=self.refresh_timeout)
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Sentiment refresh for {symbol} failed: {e!r}")
+                return
+            latency_ms = round((time.perf_counter() - started) * 1000.0, 3)
+            with self._lock:
+                self._values[symbol] = {"result": result, "computed_at": time.time(), "latency_ms": latency_ms,
+                                        "headlines": headlines}
+            self.refreshes += 1
+
+    def _compute(self, symbol):
+        headlines = list(self.news_source(symbol) or [])
+        return self.cache.get(symbol, headlines, timeout=self.refresh_timeout), len(headlines)
+
+    def flush_usage(self):
+        """Append recorded reads to the usage log."""
+        if not self.usage_log or not self._pending_log:
+            return
+        lines = []
+        while self._pending_log:
+            try:
+                lines.append(json.dumps(self._pending_log.popleft()))
+            except IndexError:
+                break
+        if not lines:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.usage_log) or ".", exist_ok=True)
+            with open(self.usage_log, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            self.usage_log_dropped += len(lines)
+            print(f"Could not append {len(lines)} sentiment usage records to {self.usage_log}: {e}")
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            values = {s: {"sentiment": v["result"]["sentiment"], "score": v["result"]["score"],
+                          "age_s": round(now - v["computed_at"], 1), "latency_ms": v["latency_ms"],
+                          "headlines": v["headlines"]} for s, v in self._values.items()}
+        reads = list(self._reads)
+        read_ms = sorted(r["read_ms"] for r in reads)
+        return {
+            "values": values,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "fallbacks": dict(self.fallbacks),
+            "usage_log_dropped": self.usage_log_dropped,
+            "reads": len(reads),
+            "read_p99_ms": read_ms[min(len(read_ms) - 1, int(0.99 * len(read_ms)))] if read_ms else None,
+            "cache": self.cache.stats(),
+        }
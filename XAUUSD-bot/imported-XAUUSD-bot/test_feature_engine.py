@@ -0,0 +1,58 @@
+"""Streaming :class:`feature_engine.FeatureEngine` against the batch recompute.
+
+    python -m pytest test_feature_engine.py
+    python -m unittest test_feature_engine
+"""
+import math
+import unittest
+
+import feature_engine
+from feature_engine import FeatureEngine, batch_atr, batch_ema, batch_features, check_equivalence
+
+CASES = [
+    {},
+    {"ema_periods": (3, 200), "atr_period": 5, "swing_strength": 1},
+    {"ema_periods": (20,), "atr_period": 30, "swing_strength": 5, "sequence_length": 3},
+]
+
+
+@unittest.skipIf(feature_engine.np is None, "numpy is required for the batch features")
+class StreamingMatchesBatch(unittest.TestCase):
+    def test_every_bar_and_feature_vector(self):
+        for params in CASES:
+            for seed in range(3):
+                for n in (0, 1, 2, 3, 10, 3000):
+                    with self.subTest(params=params, seed=seed, n=n):
+                        self.assertEqual(check_equivalence(n, seed, **params), [])
+
+    def test_ema_without_scipy(self):
+        bars = feature_engine._random_bars(2000, 7)
+        close = [b[3] for b in bars]
+        saved, feature_engine.lfilter = feature_engine.lfilter, None
+        try:
+            looped = batch_ema(close, 21)
+        finally:
+            feature_engine.lfilter = saved
+        self.assertEqual(looped.tolist(), batch_ema(close, 21).tolist())
+
+    def test_ema_seeds_with_first_close(self):
+        self.assertEqual(batch_ema([5.0, 5.0, 5.0], 9).tolist(), [5.0, 5.0, 5.0])
+        self.assertEqual(len(batch_ema([], 9)), 0)
+
+    def test_atr_warms_up_over_period(self):
+        bars = feature_engine._random_bars(50, 3)
+        h, l, c = ([b[i] for b in bars] for i in (1, 2, 3))
+        atr = batch_atr(h, l, c, 14)
+        self.assertTrue(all(math.isnan(x) for x in atr[:13]))
+        self.assertFalse(any(math.isnan(x) for x in atr[13:]))
+        same = feature_engine.np.array_equal(atr, batch_features([b[0] for b in bars], h, l, c)["atr"], equal_nan=True)
+        self.assertTrue(same)
+
+    def test_stream_snapshot_keys_match_batch_columns(self):
+        engine = FeatureEngine()
+        snapshot = engine.update(1.0, 2.0, 0.5, 1.5)
+        self.assertEqual(set(snapshot), set(batch_features([1.0], [2.0], [0.5], [1.5])))
+
+
+if __name__ == "__main__":
+    unittest.main()